@@ -0,0 +1,390 @@
+#-------------------------------------------------------------------------------
+# Name:        Bench
+# Purpose:     Throughput, latency, memory and cancellation benchmarks of the
+#              scan engine against fake responders, with JSON output that can
+#              be compared against a saved baseline.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#
+#   python bench.py -o baseline.json
+#   python bench.py --compare baseline.json
+#
+# Every case runs in a fresh interpreter, so peak RSS belongs to that case.
+
+import argparse
+import heapq                                # fake reply times
+import json
+import os
+import platform
+import random                               # fake latency and loss
+import shutil                               # stub ping directory
+import subprocess                           # one interpreter per case
+import sys
+import tempfile                             # stub ping directory
+import threading                            # scans cancelled from another thread
+import time
+
+try:
+    import resource                         # peak RSS, POSIX only
+except ImportError:
+    resource = None
+
+import ip_scanner
+from probe_backend import cl_probe_backend, CAP_RTT, CAP_IN_PROCESS
+
+# target sets by size, as prefix and per-octet ranges for get_in_range_ips
+SIZES = {256: ('10.0.0', [(0, 255)]),
+         65536: ('10', [(0, 0), (0, 255), (0, 255)]),
+         1048576: ('10', [(0, 15), (0, 255), (0, 255)])}
+
+# latency distributions of the fake backends
+DISTRIBUTIONS = ('fixed', 'uniform', 'exp')
+
+BACKENDS = ('fake', 'ping-stub')
+
+# metrics where a larger value is better, the rest are better smaller
+_HIGHER_IS_BETTER = ('hosts_per_sec', 'enumerate_per_sec')
+
+
+class cl_fake_backend(cl_probe_backend):
+    """
+    Answers probes in process after a latency drawn from a distribution with
+    the given mean, in seconds. A fraction loss of probes, and any whose
+    latency exceeds the timeout, get no reply and are reported dead once
+    their timeout has passed, like a real backend.
+    """
+
+    CAPABILITIES = frozenset([CAP_RTT, CAP_IN_PROCESS])
+
+    def __init__(self, latency=0.005, distribution='exp', loss=0.0, timeout=1.0, seed=None):
+
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError('unknown latency distribution: {}'.format(distribution))
+
+        self.latency = latency
+        self.distribution = distribution
+        self.loss = loss
+        self.timeout = timeout
+        self.random = random.Random(seed)
+
+        # heap of (reply time, sequence, host, alive, rtt)
+        self.replies = list()
+        self.sequence = 0
+
+    def fn_start_probe(self, host, timeout=None, grace=0.0):
+
+        if timeout is None:
+            timeout = self.timeout
+        limit = timeout + grace
+        now = time.time()
+
+        rtt = self._fn_draw_latency()
+        if self.random.random() < self.loss or rtt > limit:
+            reply = (now + limit, self.sequence, host, False, None)
+        else:
+            reply = (now + rtt, self.sequence, host, True, rtt)
+
+        self.sequence += 1
+        heapq.heappush(self.replies, reply)
+
+    def fn_poll(self, wait):
+
+        now = time.time()
+        if self.replies and self.replies[0][0] > now and wait > 0:
+            time.sleep(min(wait, self.replies[0][0] - now))
+            now = time.time()
+
+        results = list()
+        while self.replies and self.replies[0][0] <= now:
+            due, sequence, host, alive, rtt = heapq.heappop(self.replies)
+            results.append((host, alive, rtt))
+
+        return results
+
+    def fn_in_flight(self):
+
+        return len(self.replies)
+
+    def fn_cancel(self):
+
+        del self.replies[:]
+
+    def _fn_draw_latency(self):
+
+        if self.distribution == 'fixed':
+            return self.latency
+        elif self.distribution == 'uniform':
+            return self.random.uniform(0, 2 * self.latency)
+
+        return self.random.expovariate(1.0 / self.latency)
+
+
+def fn_write_stub_ping(directory, latency, loss):
+    """
+    Writes a 'ping' script into directory that sleeps for latency seconds
+    and fails with probability loss. Returns its path.
+    """
+    path = os.path.join(directory, 'ping')
+    with open(path, 'w') as script:
+        script.write('#!/bin/sh\n')
+        script.write('sleep {}\n'.format(latency))
+
+        # every process draws from /dev/urandom, a time seeded generator
+        # would make all pings started within a second fail alike
+        script.write('[ $(od -An -N2 -tu2 /dev/urandom) -ge {} ]\n'.format(int(loss * 65536)))
+    os.chmod(path, 0o755)
+
+    return path
+
+
+def _fn_peak_rss_kb():
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # bytes on macOS, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+def _fn_create_engine(case):
+
+    if case['backend'] == 'fake':
+        return cl_fake_backend(case['latency'], case['distribution'], case['loss'],
+                               case['timeout'], case['seed'])
+
+    # the stub ping directory is put first on PATH by the parent
+    import probe_backend
+    return probe_backend.create_backend('ping', case['timeout'])
+
+
+def _fn_scan(case, cancel_after=None):
+    """
+    Scans the case's targets. Returns (results, seconds to the first result,
+    seconds for the whole scan, seconds taken to cancel or None).
+    """
+    prefix, ranges = SIZES[case['hosts']]
+    state = {'count': 0, 'first': None}
+
+    def fn_report(result):
+        if state['first'] is None:
+            state['first'] = time.time()
+        state['count'] += 1
+
+    engine = _fn_create_engine(case)
+    scanner = ip_scanner.cl_ip_scanner(prefix.split('.'), ranges, None, fn_report, None,
+                                       engine=engine,
+                                       max_in_flight=case['concurrency'],
+                                       timeout=case['timeout'])
+
+    started = time.time()
+    thread = threading.Thread(target=scanner._check_active_ips)
+    thread.start()
+
+    cancel_seconds = None
+    if cancel_after is not None:
+
+        # cancel once part of the scan is done, or after cancel_after seconds
+        deadline = started + cancel_after
+        while thread.is_alive() and time.time() < deadline and state['count'] < case['hosts'] // 10:
+            time.sleep(0.005)
+
+        stop = time.time()
+        scanner._fn_stop_scan()
+        thread.join()
+        cancel_seconds = time.time() - stop
+    else:
+        thread.join()
+
+    finished = time.time()
+    engine.fn_close()
+
+    first = None if state['first'] is None else state['first'] - started
+    return state['count'], first, finished - started, cancel_seconds
+
+
+def fn_run_case(case):
+    """
+    Runs one case in this process and returns its metrics.
+    """
+    prefix, ranges = SIZES[case['hosts']]
+
+    # enumeration alone, the floor under any scan
+    started = time.time()
+    count = 0
+    for _ in ip_scanner.get_in_range_ips(prefix, ranges):
+        count += 1
+    enumerate_seconds = time.time() - started
+
+    cancelled, first, elapsed, cancel_seconds = _fn_scan(case, case['cancel_after'])
+    results, first, elapsed, unused = _fn_scan(case)
+
+    return dict(case,
+                results=results,
+                seconds=round(elapsed, 4),
+                hosts_per_sec=round(results / elapsed, 1) if elapsed else None,
+                first_result_ms=None if first is None else round(first * 1000.0, 2),
+                cancel_ms=round(cancel_seconds * 1000.0, 2),
+                enumerate_per_sec=round(count / enumerate_seconds, 1) if enumerate_seconds else None,
+                peak_rss_kb=_fn_peak_rss_kb())
+
+
+def fn_run_suite(args):
+    """
+    Runs every case of the suite, each in its own interpreter. Returns the
+    report as a dict.
+    """
+    cases = list()
+    stub_directory = None
+
+    try:
+        for backend in args.backends:
+
+            env = dict(os.environ)
+            if backend == 'ping-stub':
+                if stub_directory is None:
+                    stub_directory = tempfile.mkdtemp(prefix='ip_scanner_bench_')
+                    fn_write_stub_ping(stub_directory, args.latency, args.loss)
+                env['PATH'] = stub_directory + os.pathsep + env.get('PATH', '')
+
+            for hosts in args.sizes:
+
+                # a process per host makes the bigger sizes take hours
+                if backend == 'ping-stub' and hosts > args.max_stub_hosts:
+                    continue
+
+                case = dict(backend=backend,
+                            hosts=hosts,
+                            concurrency=args.concurrency,
+                            timeout=args.timeout,
+                            latency=args.latency,
+                            distribution=args.distribution,
+                            loss=args.loss,
+                            seed=args.seed,
+                            cancel_after=args.cancel_after)
+
+                output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                                  '--run-case', json.dumps(case)],
+                                                 env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+                result = json.loads(output.decode('utf-8'))
+                sys.stderr.write('{backend:>10} {hosts:>8} hosts: {hosts_per_sec:>10} hosts/s, first '
+                                 '{first_result_ms} ms, cancel {cancel_ms} ms, peak {peak_rss_kb} KB\n'
+                                 .format(**result))
+                cases.append(result)
+    finally:
+        if stub_directory is not None:
+            shutil.rmtree(stub_directory, ignore_errors=True)
+
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'created': time.time(),
+            'cases': cases}
+
+
+def fn_compare(report, baseline, tolerance):
+    """
+    Returns a list of messages, one for each metric of report that is worse
+    than the same case of baseline by more than tolerance, a fraction.
+    """
+    def fn_key(case):
+        return case['backend'], case['hosts']
+
+    previous = dict((fn_key(case), case) for case in baseline['cases'])
+    regressions = list()
+
+    for case in report['cases']:
+        old = previous.get(fn_key(case))
+        if old is None:
+            continue
+
+        for metric in ('hosts_per_sec', 'first_result_ms', 'cancel_ms', 'peak_rss_kb', 'enumerate_per_sec'):
+            new_value, old_value = case.get(metric), old.get(metric)
+            if not new_value or not old_value:
+                continue
+
+            if metric in _HIGHER_IS_BETTER:
+                worse = new_value < old_value * (1.0 - tolerance)
+            else:
+                worse = new_value > old_value * (1.0 + tolerance)
+
+            if worse:
+                regressions.append('{} {} hosts: {} {} -> {}'.format(case['backend'], case['hosts'],
+                                                                     metric, old_value, new_value))
+
+    return regressions
+
+
+def fn_build_parser():
+
+    parser = argparse.ArgumentParser(prog='bench.py', description='Scan engine benchmarks.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', choices=sorted(SIZES),
+                        default=sorted(SIZES), help='target sizes (default: all)')
+    parser.add_argument('-b', '--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS),
+                        help='backends to measure (default: all)')
+    parser.add_argument('-c', '--concurrency', type=int, default=1000,
+                        help='probes in flight (default: %(default)s)')
+    parser.add_argument('-t', '--timeout', type=float, default=0.05,
+                        help='probe timeout in seconds (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='mean reply latency in seconds (default: %(default)s)')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='exp',
+                        help='latency distribution of the fake backend (default: %(default)s)')
+    parser.add_argument('--loss', type=float, default=0.5,
+                        help='fraction of probes without reply (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default: %(default)s)')
+    parser.add_argument('--cancel-after', type=float, default=1.0,
+                        help='cancel the cancellation run after this many seconds or a '
+                             'tenth of the hosts (default: %(default)s)')
+    parser.add_argument('--max-stub-hosts', type=int, default=256,
+                        help='largest size run with the stub ping (default: %(default)s)')
+    parser.add_argument('-o', '--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='exit 1 if a metric is worse than in this earlier report')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fraction a metric may worsen before it counts as a regression '
+                             '(default: %(default)s)')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+
+    return parser
+
+
+def main(argv=None):
+
+    args = fn_build_parser().parse_args(argv)
+
+    # child interpreter running a single case
+    if args.run_case:
+        sys.stdout.write(json.dumps(fn_run_case(json.loads(args.run_case))))
+        return 0
+
+    report = fn_run_suite(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = fn_compare(report, json.load(baseline), args.tolerance)
+        for message in regressions:
+            sys.stderr.write('regression: {}\n'.format(message))
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
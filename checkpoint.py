@@ -0,0 +1,233 @@
+#-------------------------------------------------------------------------------
+# Name:        Checkpoint
+# Purpose:     Periodic on-disk record of a scan's progress, so a cancelled or
+#              crashed scan resumes where it stopped instead of from scratch.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+from array import array                     # RTTs of alive hosts
+import os                                   # atomic replace and removal
+import re                                   # skip runs of whole bitmap bytes
+import struct                               # file header
+import sys                                  # byte order of the arrays
+import time                                 # save interval
+import zlib                                 # bitmaps of long runs compress well
+
+import ip_scanner
+import ip_targets
+
+_MAGIC = b'IPSCKPT1'
+_HEADER = struct.Struct('<QQI')             # hosts, cursor, length of targets
+_BLOB = struct.Struct('<I')                 # length of each compressed section
+
+# bytes of the done bitmap with some bit clear, and with some bit set
+_NOT_FULL = re.compile(b'[^\xff]')
+_NOT_EMPTY = re.compile(b'[^\x00]')
+
+
+class cl_scan_checkpoint():
+    """
+    Tracks which positions of a target set have a result, in a done bitmap
+    and an alive bitmap, plus the RTTs of alive hosts. The cursor is the
+    first position without a result, everything before it is done. fn_add
+    saves the checkpoint every interval seconds; the file is rewritten
+    atomically, so a crash leaves the previous checkpoint intact. A /8
+    costs 4 MB of bitmaps in memory and far less on disk.
+    """
+
+    # seconds between saves while results arrive
+    _INTERVAL = 10.0
+
+    def __init__(self, path, targets, interval=_INTERVAL):
+        """
+        Loads the checkpoint in path if there is one. Raises ValueError if it
+        belongs to different targets, is not a checkpoint or is damaged.
+        """
+        if not isinstance(targets, ip_targets.cl_target_set):
+            targets = targets.fn_to_target_set()
+
+        self.path = path
+        self.targets = targets
+        self.targets_key = ','.join(targets.fn_to_strings()).encode('ascii')
+        self.interval = interval
+
+        size = (len(targets) + 7) // 8
+        self.done = bytearray(size)
+        self.alive = bytearray(size)
+        self.done_count = 0
+        self.cursor = 0
+
+        # positions and RTTs in milliseconds of alive hosts that have one
+        self.rtt_positions = array('I')
+        self.rtts = array('f')
+
+        if os.path.exists(path):
+            self._fn_load()
+
+        # results that were already saved when the scan started
+        self.resumed = self.done_count
+
+        self.saved_at = time.time()
+
+    def fn_is_complete(self):
+
+        return self.done_count == len(self.targets)
+
+    def fn_remaining(self):
+        """
+        Returns a cl_target_set of the targets without a result, in order.
+        """
+        intervals = list()
+        position = self._fn_find_bit(self.cursor, 0)
+
+        while position < len(self.targets):
+            end = self._fn_find_bit(position, 1)
+            intervals.extend(self.targets.fn_slice(position, end).fn_intervals())
+            position = self._fn_find_bit(end, 0)
+
+        return ip_targets.cl_target_set(intervals)
+
+    def fn_replay(self):
+        """
+        Yields a cl_scan_result for every saved result, with attempts 0.
+        """
+        rtts = dict(zip(self.rtt_positions, self.rtts))
+
+        for byte_index, byte in enumerate(self.done):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte >> bit & 1:
+                    position = (byte_index << 3) + bit
+                    ip = ip_targets.int_to_ip(self.targets.fn_int_at(position))
+                    if self.alive[byte_index] >> bit & 1:
+                        rtt = rtts.get(position)
+                        yield ip_scanner.cl_scan_result(ip, True, None if rtt is None else rtt / 1000.0, 0)
+                    else:
+                        yield ip_scanner.cl_scan_result(ip, False, None, 0)
+
+    def fn_add(self, result):
+
+        position = self.targets.fn_index(result.ip)
+        byte, bit = position >> 3, 1 << (position & 7)
+        if self.done[byte] & bit:
+            return
+
+        self.done[byte] |= bit
+        self.done_count += 1
+
+        if result.alive:
+            self.alive[byte] |= bit
+            if result.rtt is not None:
+                self.rtt_positions.append(position)
+                self.rtts.append(result.rtt * 1000.0)
+
+        # move the cursor past the completed prefix
+        if position == self.cursor:
+            self.cursor = self._fn_find_bit(position, 0)
+
+        if time.time() - self.saved_at >= self.interval:
+            self.fn_save()
+
+    def fn_save(self):
+
+        rtt_positions, rtts = self.rtt_positions, self.rtts
+        if sys.byteorder == 'big':
+            rtt_positions, rtts = array('I', rtt_positions), array('f', rtts)
+            rtt_positions.byteswap()
+            rtts.byteswap()
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as output:
+            output.write(_MAGIC)
+            output.write(_HEADER.pack(len(self.targets), self.cursor, len(self.targets_key)))
+            output.write(self.targets_key)
+            for blob in (self.done, self.alive, rtt_positions.tobytes(), rtts.tobytes()):
+                blob = zlib.compress(bytes(blob), 1)
+                output.write(_BLOB.pack(len(blob)))
+                output.write(blob)
+
+            # on disk before it replaces the previous checkpoint
+            output.flush()
+            os.fsync(output.fileno())
+
+        os.replace(temp_path, self.path)
+        self.saved_at = time.time()
+
+    def fn_discard(self):
+        """
+        Removes the checkpoint file, for scans that completed.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _fn_find_bit(self, position, value):
+        """
+        Returns the first position from position on whose done bit is value,
+        or the number of targets if there is none.
+        """
+        n = len(self.targets)
+        skip = _NOT_FULL if value == 0 else _NOT_EMPTY
+
+        while position < n:
+            if self.done[position >> 3] >> (position & 7) & 1 == value:
+                return position
+
+            # whole bytes without the bit wanted are skipped in C
+            if position & 7 == 7:
+                match = skip.search(self.done, (position >> 3) + 1)
+                if match is None:
+                    return n
+                position = match.start() << 3
+            else:
+                position += 1
+
+        return n
+
+    def _fn_load(self):
+
+        with open(self.path, 'rb') as source:
+            data = source.read()
+
+        if not data.startswith(_MAGIC):
+            raise ValueError('{} is not a scan checkpoint'.format(self.path))
+
+        # a short read or a damaged section surfaces as struct or zlib errors
+        try:
+            offset = len(_MAGIC)
+            hosts, cursor, key_length = _HEADER.unpack_from(data, offset)
+            offset += _HEADER.size
+
+            if data[offset:offset + key_length] != self.targets_key or hosts != len(self.targets):
+                raise ValueError('{} is a checkpoint of different targets'.format(self.path))
+            offset += key_length
+
+            blobs = list()
+            for _ in range(4):
+                length = _BLOB.unpack_from(data, offset)[0]
+                offset += _BLOB.size
+                blobs.append(zlib.decompress(data[offset:offset + length]))
+                offset += length
+        except (struct.error, zlib.error):
+            raise ValueError('{} is a truncated or corrupt checkpoint'.format(self.path))
+
+        if len(blobs[0]) != len(self.done) or len(blobs[1]) != len(self.alive) or cursor > hosts:
+            raise ValueError('{} is a truncated or corrupt checkpoint'.format(self.path))
+
+        self.done = bytearray(blobs[0])
+        self.alive = bytearray(blobs[1])
+        self.rtt_positions = array('I')
+        self.rtt_positions.frombytes(blobs[2])
+        self.rtts = array('f')
+        self.rtts.frombytes(blobs[3])
+        if sys.byteorder == 'big':
+            self.rtt_positions.byteswap()
+            self.rtts.byteswap()
+
+        self.cursor = cursor
+        self.done_count = bin(int.from_bytes(self.done, 'little')).count('1')
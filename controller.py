@@ -1,6 +1,7 @@
 #-------------------------------------------------------------------------------
 # Name:        IP Scanner Controller
-# Purpose:     Controller between ip_scanner.py and gui.py for the IP scanner application
+# Purpose:     Headless command line controller for the IP scanner, streams
+#              results to stdout or a file without importing the GUI.
 #
 # Author:      Peter Zhou
 #
@@ -8,20 +9,708 @@
 # Copyright:   (c) PBES 2017
 # Licence:     <your licence>
 #-------------------------------------------------------------------------------
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+
 import ip_scanner
-import wx
-import gui
+import ip_targets
+import probe_backend
+import result_channel
+import scan_eta
 
-class controller()
+# descriptors kept free for output files, sockets and the like when the
+# concurrency is capped to the open file limit
+_FD_HEADROOM = 64
 
 
-def main():
-    ex = wx.App()
-    ip_scan_gui()
-    ex.MainLoop()
+class cl_result_writer():
+    """
+    Writes each scan result as soon as it arrives, as NDJSON or CSV. Nothing
+    is buffered beyond the output stream, so memory use does not grow with
+    the size of the scan.
+    """
 
+    FORMATS = ('ndjson', 'csv')
 
-if __name__ == '__main__':
-    main()
+    _CSV_HEADER = ('ip', 'alive', 'rtt_ms', 'attempts')
+
+    def __init__(self, stream, fmt='ndjson', alive_only=False):
+
+        self.stream = stream
+        self.fmt = fmt
+        self.alive_only = alive_only
+
+        # running totals for the summary line
+        self.total = 0
+        self.alive = 0
+
+        if fmt == 'csv':
+            self.csv_writer = csv.writer(stream, lineterminator='\n')
+            self.csv_writer.writerow(self._CSV_HEADER)
+
+    def fn_write(self, result):
+
+        self.total += 1
+        if result.alive:
+            self.alive += 1
+        elif self.alive_only:
+            return
+
+        rtt_ms = None if result.rtt is None else round(result.rtt * 1000.0, 3)
+
+        if self.fmt == 'csv':
+            self.csv_writer.writerow((result.ip,
+                                      int(result.alive),
+                                      '' if rtt_ms is None else rtt_ms,
+                                      result.attempts))
+        else:
+            self.stream.write(json.dumps({'ip': result.ip,
+                                          'alive': result.alive,
+                                          'rtt_ms': rtt_ms,
+                                          'attempts': result.attempts}))
+            self.stream.write('\n')
+
+        self.stream.flush()
+
+
+class cl_progress_reporter():
+    """
+    Prints the scan's progress, probe rate and estimated time left to a
+    stream every interval seconds from a background thread. A terminal
+    gets one line rewritten in place, anything else a line per report.
+    """
+
+    def __init__(self, scanner, counts, total, stream=sys.stderr, interval=1.0):
+
+        # counts has total and alive attributes, e.g. a result channel
+        self.scanner = scanner
+        self.counts = counts
+        self.stream = stream
+        self.interval = interval
+        self.in_place = stream.isatty()
+
+        # ping probes without reply take the timeout, or about 11 s by default
+        self.eta = scan_eta.cl_eta_estimator(total, scanner.timeout or 11.0, scanner.max_in_flight)
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def fn_start(self):
+
+        # rates are measured from the start of the scan
+        self.eta.fn_update(0, 0, None, 0)
+
+        self.thread = threading.Thread(target=self._fn_run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def fn_stop(self):
+
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+        if self.in_place:
+            self.stream.write('\n')
+            self.stream.flush()
+
+    def _fn_run(self):
+
+        while not self.stop_event.wait(self.interval):
+            stats = self.scanner.fn_stats()
+            self.eta.fn_update(self.counts.total, self.counts.alive, stats['in_flight'], stats['probes_sent'])
+
+            line = scan_eta.fn_format_status(self.eta.fn_status())
+            if self.in_place:
+                self.stream.write('\r\033[K' + line)
+            else:
+                self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+def fn_build_parser():
+
+    parser = argparse.ArgumentParser(prog='controller.py',
+                                     description='Headless IP scanner.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    scan = commands.add_parser('scan', help='scan targets and stream the results')
+    scan.add_argument('targets', nargs='+',
+                      help="addresses, CIDR blocks, ranges or per-octet ranges, e.g. "
+                           "10.0.0.0/24 10.1.0.1-10.1.0.50 10.2.0-3.1-254")
+    scan.add_argument('-x', '--exclude', action='append', default=[],
+                      help='targets to skip, may be given several times')
+    _fn_add_probe_arguments(scan)
+    scan.add_argument('-f', '--format', choices=cl_result_writer.FORMATS, default='ndjson',
+                      help='output format (default: %(default)s)')
+    scan.add_argument('-o', '--output', help='write results to a file instead of stdout')
+    scan.add_argument('--alive-only', action='store_true',
+                      help='only output hosts that replied')
+    scan.add_argument('--progress', action='store_true',
+                      help='report progress, probe rate and time left to stderr every second')
+    scan.add_argument('--backpressure', choices=result_channel.POLICIES,
+                      default=result_channel.POLICY_BLOCK,
+                      help='when --queue-size results wait for the output: hold the scan, '
+                           'count further results without writing them, or queue them '
+                           'on disk (default: %(default)s)')
+    scan.add_argument('--queue-size', type=int, default=result_channel.cl_result_channel._CAPACITY,
+                      help='results held in memory for the output (default: %(default)s)')
+    scan.add_argument('--cache', metavar='PATH',
+                      help='result cache file, read before and written after the scan')
+    scan.add_argument('--cache-ttl', type=float, default=300.0,
+                      help='seconds a cached result stays fresh (default: %(default)s)')
+    scan.add_argument('--cache-policy', choices=ip_scanner.CACHE_POLICIES,
+                      default=ip_scanner.CACHE_SKIP,
+                      help='report fresh cached hosts without probing them, or probe '
+                           'them after the others (default: %(default)s)')
+    scan.add_argument('--history', metavar='DB',
+                      help='store the finished scan in this scan history file')
+    scan.add_argument('--checkpoint', metavar='PATH',
+                      help='save progress here and resume from it if it exists; '
+                           'removed once the scan completes')
+    scan.add_argument('--checkpoint-interval', type=float, default=10.0,
+                      help='seconds between checkpoint saves (default: %(default)s)')
+    scan.add_argument('--metrics', metavar='PATH',
+                      help='write scan metrics to this file in Prometheus text format')
+    scan.add_argument('--metrics-interval', type=float, default=5.0,
+                      help='seconds between metrics file writes (default: %(default)s)')
+    scan.set_defaults(fn_command=_fn_cmd_scan)
+
+    watch = commands.add_parser('watch', help='keep probing targets and stream hosts '
+                                              'coming up and going down',
+                                description='Intervals are in seconds and must be at least 0.1.')
+    watch.add_argument('targets', nargs='+', help='targets, as for scan')
+    watch.add_argument('-x', '--exclude', action='append', default=[],
+                       help='targets to skip, may be given several times')
+    _fn_add_probe_arguments(watch, workers=False)
+    watch.add_argument('--alive-interval', type=float,
+                       default=30.0,
+                       help='seconds between probes of alive hosts (default: %(default)s)')
+    watch.add_argument('--dead-interval', type=float,
+                       default=300.0,
+                       help='seconds before a dead host is probed again, doubled while it '
+                            'stays dead (default: %(default)s)')
+    watch.add_argument('--max-dead-interval', type=float,
+                       default=3600.0,
+                       help='longest wait between probes of a dead host (default: %(default)s)')
+    watch.add_argument('--recheck-interval', type=float,
+                       default=2.0,
+                       help='seconds before an alive host that missed a reply is probed '
+                            'again (default: %(default)s)')
+    watch.add_argument('--down-after', type=int, default=2,
+                       help='missed replies in a row before an alive host is reported down '
+                            '(default: %(default)s)')
+    watch.add_argument('--jitter', type=float, default=0.2,
+                       help='fraction every interval is randomly stretched or shrunk by '
+                            '(default: %(default)s)')
+    watch.add_argument('-o', '--output', help='write events to a file instead of stdout')
+    watch.set_defaults(fn_command=_fn_cmd_watch)
+
+    history = commands.add_parser('history', help='list scans stored in a history file')
+    history.add_argument('db', help='scan history file')
+    history.add_argument('targets', nargs='*', help='only scans of exactly these targets')
+    history.add_argument('-x', '--exclude', action='append', default=[],
+                         help='targets excluded from the scans, as given to scan')
+    history.add_argument('-n', '--limit', type=int, default=20,
+                         help='newest scans listed (default: %(default)s)')
+    history.set_defaults(fn_command=_fn_cmd_history)
+
+    diff = commands.add_parser('diff', help='hosts that changed state between two stored scans')
+    diff.add_argument('db', help='scan history file')
+    diff.add_argument('targets', nargs='*',
+                      help='compare the last two scans of exactly these targets')
+    diff.add_argument('-x', '--exclude', action='append', default=[],
+                      help='targets excluded from the scans, as given to scan')
+    diff.add_argument('-s', '--scans', nargs=2, type=int, metavar=('OLD', 'NEW'),
+                      help='compare these scan ids instead')
+    diff.set_defaults(fn_command=_fn_cmd_diff)
+
+    coordinate = commands.add_parser('coordinate',
+                                     help='split a scan into shards for worker nodes '
+                                          'and stream the merged results')
+    coordinate.add_argument('targets', nargs='+', help='targets, as for scan')
+    coordinate.add_argument('-x', '--exclude', action='append', default=[],
+                            help='targets to skip, may be given several times')
+    coordinate.add_argument('-l', '--listen', default='0.0.0.0:7878',
+                            help='address workers connect to, port 0 picks a free one '
+                                 '(default: %(default)s)')
+    coordinate.add_argument('--shard-size', type=int,
+                            default=65536,
+                            help='hosts per shard (default: %(default)s)')
+    coordinate.add_argument('--dead-after', type=float,
+                            default=10.0,
+                            help='seconds of silence before a worker\'s shards are handed '
+                                 'out again (default: %(default)s)')
+    coordinate.add_argument('--speculate-after', type=float,
+                            default=5.0,
+                            help='seconds a shard runs before an idle worker may scan '
+                                 'a second copy (default: %(default)s)')
+    coordinate.add_argument('-f', '--format', choices=cl_result_writer.FORMATS, default='ndjson',
+                            help='output format (default: %(default)s)')
+    coordinate.add_argument('-o', '--output', help='write results to a file instead of stdout')
+    coordinate.add_argument('--alive-only', action='store_true',
+                            help='only output hosts that replied')
+    coordinate.set_defaults(fn_command=_fn_cmd_coordinate)
+
+    worker = commands.add_parser('worker', help='scan shards for a coordinator')
+    worker.add_argument('coordinator', help='host:port of the coordinator')
+    worker.add_argument('-n', '--name', help='name reported to the coordinator '
+                                             '(default: host name)')
+    _fn_add_probe_arguments(worker)
+    worker.set_defaults(fn_command=_fn_cmd_worker)
+
+    daemon = commands.add_parser('daemon',
+                                 help='serve scan jobs over a local HTTP API, sharing '
+                                      'one probe engine between them')
+    daemon.add_argument('-l', '--listen', default='127.0.0.1:7880',
+                        help='HTTP address to serve on (default: %(default)s)')
+    daemon.add_argument('-u', '--unix', help='serve on this unix socket path instead')
+    daemon.add_argument('-v', '--verbose', action='store_true', help='log every request')
+    daemon.add_argument('--metrics', action='store_true',
+                        help='collect scan metrics and serve them at /metrics')
+    _fn_add_probe_arguments(daemon, workers=False)
+    daemon.set_defaults(fn_command=_fn_cmd_daemon)
+
+    return parser
+
+def _fn_add_probe_arguments(parser, workers=True):
+
+    # options of the probe engine, shared by scan and worker
+    parser.add_argument('-c', '--concurrency', type=int,
+                        default=ip_scanner.cl_sub_process_spawner._MAX_SUB_PROCESSES,
+                        help='probes kept in flight at once (default: %(default)s)')
+    parser.add_argument('-t', '--timeout', type=float, default=1.0,
+                        help='seconds to wait for a reply, or the initial timeout '
+                             'with --adaptive (default: %(default)s)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='derive timeouts from the RTTs observed in each /24')
+    parser.add_argument('--min-timeout', type=float, default=0.05,
+                        help='adaptive timeout floor in seconds (default: %(default)s)')
+    parser.add_argument('--max-timeout', type=float, default=5.0,
+                        help='adaptive timeout ceiling in seconds (default: %(default)s)')
+    parser.add_argument('--rtt-multiplier', type=float, default=3.0,
+                        help='adaptive timeout as a multiple of the p99 RTT (default: %(default)s)')
+    parser.add_argument('--grace', type=float, default=0.0,
+                        help='seconds after the timeout a late reply is still accepted '
+                             '(default: %(default)s)')
+    parser.add_argument('-r', '--retries', type=int, default=0,
+                        help='re-probe hosts that did not answer up to this many times '
+                             '(default: %(default)s)')
+    parser.add_argument('--retry-backoff', type=float, default=0.5,
+                        help='seconds before the first retry, doubled for each further one '
+                             '(default: %(default)s)')
+    parser.add_argument('--rate', type=float,
+                        help='cap on probes sent per second across the scan')
+    parser.add_argument('--subnet-rate', type=float,
+                        help='cap on probes sent per second to each /24, the /24s are '
+                             'then probed in turn rather than one after another')
+    parser.add_argument('-e', '--engine', choices=probe_backend.BACKEND_NAMES, default='ping',
+                        help='ping subprocesses, in-process ICMP, or TCP connect '
+                             '(default: %(default)s)')
+    if workers:
+        parser.add_argument('-w', '--workers', type=int, default=0,
+                            help='probe processes to spread the scan over, each keeping '
+                                 '--concurrency probes in flight; 0 probes from this process '
+                                 '(default: %(default)s)')
+    parser.add_argument('-p', '--ports',
+                        help='comma separated ports for the tcp engine (default: 80,443,22)')
+    parser.add_argument('--raise-fd-limit', action='store_true',
+                        help='raise the open file limit to the hard limit before probing, '
+                             'for a --concurrency above the soft limit')
+
+def _fn_scanner_options(args):
+    """
+    Returns cl_ip_scanner keyword arguments for the probe options in args.
+    """
+    ports = None
+    if args.ports:
+        ports = [int(port) for port in args.ports.split(',') if port.strip()]
+
+    workers = getattr(args, 'workers', 0)
+
+    # every probe in flight holds a descriptor, past the limit probes fail
+    if args.raise_fd_limit:
+        fd_limit = probe_backend.fn_raise_fd_limit()
+    else:
+        fd_limit = probe_backend.fn_fd_limit()
+
+    concurrency = args.concurrency
+    if fd_limit is not None and concurrency > fd_limit - _FD_HEADROOM:
+        concurrency = max(1, fd_limit - _FD_HEADROOM)
+        sys.stderr.write('concurrency lowered to {}, the open file limit is {}; raise it '
+                         'with --raise-fd-limit or ulimit -n\n'.format(concurrency, fd_limit))
+
+    # worker processes create their own backend from its name
+    if workers > 1:
+        engine = args.engine
+    else:
+        engine = probe_backend.create_backend(args.engine, args.timeout, ports)
+
+    adaptive_timeout = None
+    if args.adaptive:
+        import probe_timeout
+        adaptive_timeout = probe_timeout.cl_adaptive_timeout(args.timeout,
+                                                             args.min_timeout,
+                                                             args.max_timeout,
+                                                             args.rtt_multiplier)
+
+    rate_limiter = None
+    if args.rate or args.subnet_rate:
+        import rate_limit
+        rate_limiter = rate_limit.cl_rate_limiter(args.rate, args.subnet_rate)
+
+    return dict(engine=engine,
+                max_in_flight=concurrency,
+                timeout=args.timeout,
+                adaptive_timeout=adaptive_timeout,
+                grace=args.grace,
+                retries=args.retries,
+                retry_backoff=args.retry_backoff,
+                rate_limiter=rate_limiter,
+                workers=workers,
+                ports=ports)
+
+def _fn_cmd_scan(args):
+
+    targets = ip_targets.parse_targets(args.targets, args.exclude)
+
+    cache = None
+    if args.cache:
+        import result_store
+        cache = result_store.cl_result_cache(args.cache_ttl)
+        if os.path.exists(args.cache):
+            cache.fn_load(args.cache)
+
+    scan_checkpoint = None
+    if args.checkpoint:
+        import checkpoint
+        try:
+            scan_checkpoint = checkpoint.cl_scan_checkpoint(args.checkpoint, targets,
+                                                            args.checkpoint_interval)
+        except ValueError as error:
+            sys.stderr.write('{}\n'.format(error))
+            return 2
+
+        if scan_checkpoint.resumed:
+            sys.stderr.write('resuming, {} of {} hosts already scanned\n'.format(
+                scan_checkpoint.resumed, len(targets)))
+
+    # created last, so nothing above can return with the backend left open
+    options = _fn_scanner_options(args)
+
+    stream = open(args.output, 'w') if args.output else sys.stdout
+    writer = cl_result_writer(stream, args.format, args.alive_only)
+
+    # results reach the output through a bounded channel, so a slow output
+    # holds the scan back, loses detail or spills to disk as chosen instead
+    # of growing memory
+    channel = result_channel.cl_result_channel(args.queue_size, args.backpressure)
+    consumer = threading.Thread(target=_fn_consume, args=(channel, writer.fn_write))
+    consumer.daemon = True
+    consumer.start()
+
+    recorder = None
+    if args.history:
+        import scan_history
+        history = scan_history.cl_scan_history(args.history)
+        recorder = history.fn_record(targets)
+
+        def fn_report(result):
+            recorder.fn_add(result)
+            channel.fn_put(result)
+    else:
+        fn_report = channel.fn_put
+
+    metrics = None
+    metrics_writer = None
+    if args.metrics:
+        import scan_metrics
+        metrics = scan_metrics.cl_scan_metrics()
+        metrics_writer = scan_metrics.cl_metrics_writer(metrics, args.metrics, args.metrics_interval)
+        metrics_writer.fn_start()
 
+    scanner = ip_scanner.cl_ip_scanner(None, None, None, fn_report, None,
+                                       targets=targets,
+                                       cache=cache,
+                                       cache_policy=args.cache_policy,
+                                       checkpoint=scan_checkpoint,
+                                       metrics=metrics,
+                                       **options)
 
+    progress = None
+    if args.progress:
+        progress = cl_progress_reporter(scanner, channel, len(targets))
+        progress.fn_start()
+
+    try:
+        scanner._check_active_ips()
+    except KeyboardInterrupt:
+        scanner._fn_stop_scan()
+        if scan_checkpoint is not None:
+            sys.stderr.write('progress saved to {}\n'.format(args.checkpoint))
+        return 130
+    finally:
+        if progress is not None:
+            progress.fn_stop()
+
+        # write out whatever is still queued
+        channel.fn_close()
+        consumer.join()
+
+        if stream is not sys.stdout:
+            stream.close()
+
+        # whatever was scanned before an interrupt is worth keeping
+        if cache is not None:
+            cache.fn_save(args.cache)
+
+        if metrics_writer is not None:
+            metrics_writer.fn_stop()
+
+        # pool workers close the backends they created themselves
+        if not isinstance(options['engine'], str):
+            options['engine'].fn_close()
+
+    sys.stderr.write('{} hosts scanned, {} alive\n'.format(channel.total, channel.alive))
+    if channel.dropped:
+        sys.stderr.write('{} results not written, the output fell behind\n'.format(channel.dropped))
+
+    # interrupted scans are not stored, they would cover part of the range only
+    if recorder is not None:
+        sys.stderr.write('stored as scan {}\n'.format(recorder.fn_finish()))
+        if recorder.replayed:
+            sys.stderr.write('{} results taken from the cache or checkpoint were not stored\n'.format(
+                recorder.replayed))
+        history.fn_close()
+
+    achieved, target = scanner.fn_rate_report()
+    if target is not None:
+        sys.stderr.write('probe rate {:.1f}/s of {:.1f}/s target\n'.format(achieved, target))
+    else:
+        sys.stderr.write('probe rate {:.1f}/s\n'.format(achieved))
+
+    return 0
+
+def _fn_consume(channel, fn_write):
+
+    # runs on its own thread until the channel is closed and empty
+    while True:
+        batch = channel.fn_get_batch(1024, 0.5)
+        for result in batch:
+            fn_write(result)
+        if not batch and channel.fn_is_drained():
+            return
+
+def _fn_cmd_watch(args):
+
+    import scan_watch
+
+    targets = ip_targets.parse_targets(args.targets, args.exclude)
+
+    options = _fn_scanner_options(args)
+    del options['workers'], options['ports']
+
+    stream = open(args.output, 'w') if args.output else sys.stdout
+
+    def fn_event(event):
+        stream.write(json.dumps({'ip': event.ip,
+                                 'change': event.state,
+                                 'rtt_ms': None if event.rtt is None else round(event.rtt * 1000.0, 3),
+                                 'time': round(event.time, 3)}))
+        stream.write('\n')
+        stream.flush()
+
+    try:
+        watcher = scan_watch.cl_host_watcher(targets, fn_event,
+                                             alive_interval=args.alive_interval,
+                                             dead_interval=args.dead_interval,
+                                             max_dead_interval=args.max_dead_interval,
+                                             recheck_interval=args.recheck_interval,
+                                             down_after=args.down_after,
+                                             jitter=args.jitter,
+                                             **options)
+    except ValueError:
+        options['engine'].fn_close()
+        raise
+
+    sys.stderr.write('watching {} hosts\n'.format(len(targets)))
+    sys.stderr.flush()
+
+    # the watch never ends by itself, it runs on its own thread so Ctrl-C
+    # reaches the main thread
+    thread = threading.Thread(target=watcher.fn_run)
+    thread.daemon = True
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.fn_stop()
+        thread.join()
+        options['engine'].fn_close()
+        if stream is not sys.stdout:
+            stream.close()
+
+    stats = watcher.fn_stats()
+    sys.stderr.write('{} of {} hosts up, {} probes sent\n'.format(stats['up'], stats['hosts'],
+                                                                  stats['probes_sent']))
+    return 0
+
+def _fn_cmd_history(args):
+
+    import scan_history
+    history = scan_history.cl_scan_history(args.db)
+
+    targets = ip_targets.parse_targets(args.targets, args.exclude) if args.targets else None
+    for info in history.fn_scans(targets, args.limit):
+        sys.stdout.write(json.dumps({'scan': info.scan_id,
+                                     'started': info.started,
+                                     'finished': info.finished,
+                                     'targets': info.targets,
+                                     'hosts': info.hosts,
+                                     'scanned': info.scanned,
+                                     'alive': info.alive}))
+        sys.stdout.write('\n')
+
+    history.fn_close()
+    return 0
+
+def _fn_cmd_diff(args):
+
+    import scan_history
+    history = scan_history.cl_scan_history(args.db)
+
+    try:
+        if args.scans:
+            diff = history.fn_diff(*args.scans)
+        elif args.targets:
+            diff = history.fn_changes(ip_targets.parse_targets(args.targets, args.exclude))
+        else:
+            sys.stderr.write('give targets or --scans OLD NEW\n')
+            return 2
+    except KeyError as error:
+        sys.stderr.write('{}\n'.format(error.args[0]))
+        return 1
+    finally:
+        history.fn_close()
+
+    if diff is None:
+        sys.stderr.write('fewer than two scans of these targets\n')
+        return 1
+
+    for state, hosts in (('up', diff.came_up), ('down', diff.went_down)):
+        for ip in hosts:
+            sys.stdout.write(json.dumps({'ip': ip, 'change': state}))
+            sys.stdout.write('\n')
+
+    sys.stderr.write('{} came up, {} went down\n'.format(len(diff.came_up), len(diff.went_down)))
+    return 0
+
+def _fn_cmd_coordinate(args):
+
+    import scan_cluster
+
+    targets = ip_targets.parse_targets(args.targets, args.exclude)
+
+    stream = open(args.output, 'w') if args.output else sys.stdout
+    writer = cl_result_writer(stream, args.format, args.alive_only)
+
+    def fn_log(text):
+        sys.stderr.write(text + '\n')
+        sys.stderr.flush()
+
+    coordinator = scan_cluster.cl_scan_coordinator(targets, writer.fn_write,
+                                                   scan_cluster.fn_parse_address(args.listen),
+                                                   args.shard_size,
+                                                   args.dead_after,
+                                                   args.speculate_after,
+                                                   fn_log)
+    fn_log('listening on {}:{}, {} hosts in {} shards'.format(coordinator.address[0],
+                                                             coordinator.address[1],
+                                                             len(targets),
+                                                             len(coordinator.shards)))
+    try:
+        coordinator.fn_run()
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    sys.stderr.write('{} hosts scanned, {} alive\n'.format(writer.total, writer.alive))
+    sys.stderr.write('{:.1f} hosts/s\n'.format(coordinator.fn_rate_report()[0]))
+
+    return 0
+
+def _fn_cmd_worker(args):
+
+    import scan_cluster
+
+    worker = scan_cluster.cl_scan_worker(scan_cluster.fn_parse_address(args.coordinator, 'localhost'),
+                                         _fn_scanner_options(args),
+                                         args.name)
+    try:
+        completed = worker.fn_run()
+    except KeyboardInterrupt:
+        worker.fn_stop()
+        return 130
+    except OSError as error:
+        sys.stderr.write('cannot reach coordinator: {}\n'.format(error))
+        return 1
+
+    sys.stderr.write('{} shards scanned\n'.format(completed))
+    return 0
+
+def _fn_cmd_daemon(args):
+
+    import scan_cluster
+    import scan_daemon
+
+    options = _fn_scanner_options(args)
+    del options['workers'], options['ports']
+
+    if args.metrics:
+        import scan_metrics
+        options['metrics'] = scan_metrics.cl_scan_metrics()
+
+    service = scan_daemon.cl_scan_daemon(**options)
+    server = scan_daemon.fn_create_server(service,
+                                          scan_cluster.fn_parse_address(args.listen),
+                                          args.unix,
+                                          args.verbose)
+    service.fn_start()
+
+    sys.stderr.write('serving on {}\n'.format(args.unix or args.listen))
+    sys.stderr.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.fn_stop()
+
+    return 0
+
+
+def main(argv=None):
+
+    args = fn_build_parser().parse_args(argv)
+
+    # bad targets and unusable probe options end the command with a message
+    try:
+        return args.fn_command(args)
+    except ValueError as error:
+        sys.stderr.write('error: {}\n'.format(error))
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,6 +11,12 @@
 import wx
 import ip_scanner
 import threading
+import result_store
+import scan_history
+import checkpoint
+import scan_eta
+import result_channel
+import os
 
 
 class cl_ip_scan_gui(wx.Frame):
@@ -36,8 +42,28 @@ class cl_ip_scan_gui(wx.Frame):
 
     _FINISH_STR = "Scan Completed."
 
+    # seconds a ping without reply takes, the ETA's probe time until
+    # results show the actual rate
     _NO_REPLY_TIME = 11
 
+    # milliseconds between applying queued results to the GUI
+    _RESULT_INTERVAL = 100
+
+    # most results applied per tick, keeps each repaint short
+    _MAX_RESULT_BATCH = 5000
+
+    # results waiting to be shown before the scan thread is held
+    _RESULT_CAPACITY = 65536
+
+    # seconds a host's result is reused by later scans
+    _CACHE_TTL = 300
+
+    # every finished scan is kept here for comparing with later ones
+    _HISTORY_PATH = os.path.join(os.path.expanduser('~'), '.ip_scanner_history.db')
+
+    # progress of a cancelled scan, picked up again by the next scan of its range
+    _CHECKPOINT_PATH = os.path.join(os.path.expanduser('~'), '.ip_scanner_checkpoint')
+
     def __init__(self):
 
         wx.Frame.__init__(self, None)
@@ -47,6 +73,23 @@ class cl_ip_scan_gui(wx.Frame):
 
         self.ping_index = 0
         self.total_pings = 0
+        self.alive_count = 0
+
+        # estimates the time left from the rate results arrive at
+        self.eta = None
+
+        # results handed over from the scan thread, drained on a timer; a
+        # new channel for every scan, a cancelled one ignores late results
+        self.result_channel = None
+
+        # recent results, so rescans within _CACHE_TTL skip hosts already
+        # seen; only used while enabled in the options menu
+        self.result_cache = result_store.cl_result_cache(self._CACHE_TTL)
+
+        # scan history, opened once enabled in the options menu, and the
+        # recorder of the scan in progress
+        self.history = None
+        self.history_recorder = None
 
         self._fn_set_menu()
         self._fn_set_header()
@@ -77,6 +120,12 @@ class cl_ip_scan_gui(wx.Frame):
         filemenu.Append(cancel_item)
         self.Bind(wx.EVT_MENU, self._fn_on_cancel, cancel_item)
 
+        # Create options menu, nothing is reused or written to disk unless checked
+        optionsmenu = wx.Menu()
+        self.cache_item = optionsmenu.AppendCheckItem(wx.ID_ANY, '&Reuse Recent Results')
+        self.history_item = optionsmenu.AppendCheckItem(wx.ID_ANY, 'Keep Scan &History')
+        self.checkpoint_item = optionsmenu.AppendCheckItem(wx.ID_ANY, 'Resume Cancelled &Scans')
+
         # Create help menu to be added to menu bar
         helpmenu = wx.Menu()
 
@@ -85,8 +134,9 @@ class cl_ip_scan_gui(wx.Frame):
         helpmenu.Append(about_item)
         self.Bind(wx.EVT_MENU, self._fn_on_about, about_item)
 
-        # Add file/help menu to menu bar and set menu bar to frame
+        # Add file/options/help menu to menu bar and set menu bar to frame
         menubar.Append(filemenu, '&File')
+        menubar.Append(optionsmenu, '&Options')
         menubar.Append(helpmenu, '&Help')
         self.SetMenuBar(menubar)
 
@@ -112,6 +162,14 @@ class cl_ip_scan_gui(wx.Frame):
         # terminate scan thread
         self.scan_thread.stop()
 
+        # discard results that have not been shown yet, releasing the scan
+        # thread if it waits for room
+        self.results_timer.Stop()
+        self.result_channel.fn_cancel()
+
+        # cancelled scans stay out of the history
+        self.history_recorder = None
+
         # reset frame title
         self.SetTitle('IP Scanner')
 
@@ -123,7 +181,7 @@ class cl_ip_scan_gui(wx.Frame):
         wx.CallAfter(self.gauge.SetValue, self.ping_count)
 
         # clear previous scan from results table
-        self.results_table.DeleteAllItems()
+        self._fn_clear_results_table()
 
         # unlock user input and disable cancel button
         self._fn_enable_user_input()
@@ -150,46 +208,56 @@ class cl_ip_scan_gui(wx.Frame):
         self.timer = wx.Timer(self)
         self.Bind(wx.EVT_TIMER, self._fn_update_time_remain, self.timer)
 
+        # create timer applying queued results in batches
+        self.results_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self._fn_drain_results, self.results_timer)
+
         # create static text to display time remaining
         self.time_remain = wx.StaticText(self.panel, label='Estimated Time:')
-        self.est_time = 0
+
+        # probes per second and alive and dead counts while scanning
+        self.status_bar = self.CreateStatusBar()
 
         timer_box = wx.BoxSizer(wx.HORIZONTAL)
         timer_box.Add(self.time_remain, flag=wx.ALIGN_CENTER)
         self.sizer.Add((0,90))
         self.sizer.Add(timer_box, flag=wx.ALIGN_CENTER | wx.RIGHT, border=450)
 
-    # displays run time estimate of scan on GUI
+    # displays run time estimate of scan on GUI, called from the scan thread
     def fn_start_timer(self, ip_list_len):
 
-        self.est_time = self._NO_REPLY_TIME * ip_list_len
-        self.time_remain.SetLabel(self._fn_get_est_time_unit())
+        self.eta = scan_eta.cl_eta_estimator(ip_list_len,
+                                             self._NO_REPLY_TIME,
+                                             ip_scanner.cl_sub_process_spawner._MAX_SUB_PROCESSES)
+        self.eta.fn_update(0, 0, None, 0)
+        wx.CallAfter(self._fn_show_estimate)
 
     def _fn_stop_timer(self):
 
         self.timer.Stop()
-        self.est_time = 0
-        self.time_remain.SetLabel('Estimated Time: {} seconds'.format(self.est_time))
 
-    # decrements time remaining shown on GUI
+        # final counts stay in the status bar
+        if self.eta is not None:
+            self.eta.fn_update(self.ping_index, self.alive_count)
+            self._fn_show_estimate()
+        self.time_remain.SetLabel('Estimated Time: 0 seconds')
+
+    # measures the result rate and shows the time remaining on GUI
     def _fn_update_time_remain(self, e):
 
-        if self.est_time > 0:
-            self.est_time -= 1
-            self.time_remain.SetLabel(self._fn_get_est_time_unit())
+        if self.eta is None:
+            return
 
-    def _fn_get_est_time_unit(self):
+        stats = self.scan_thread.scanner.fn_stats()
+        self.eta.fn_update(self.ping_index, self.alive_count, stats['in_flight'], stats['probes_sent'])
+        self._fn_show_estimate()
 
-        if self.est_time >= 7200:
-            return 'Estimated Time: {} hours, {} minutes'.format(self.est_time/3600, self.est_time % 7200)
-        elif self.est_time >= 3600:
-            return 'Estimated Time: {} hour, {} minutes'.format(self.est_time/3600, self.est_time % 3600)
-        elif self.est_time >= 120:
-            return 'Estimated Time: {} minutes'.format(self.est_time/60)
-        elif self.est_time >= 60:
-            return 'Estimated Time: {} minute'.format(self.est_time/60)
-        else:
-            return 'Estimated Time: < 1 minute'
+    def _fn_show_estimate(self):
+
+        status = self.eta.fn_status()
+        self.time_remain.SetLabel('Estimated Time: ' + scan_eta.fn_format_duration(status['seconds_left']))
+        self.status_bar.SetStatusText('{probe_rate:.1f} probes/s    {alive} alive    {dead} dead    '
+                                      '{done} of {total} scanned'.format(**status))
 
     def _fn_set_gauge(self):
 
@@ -202,22 +270,35 @@ class cl_ip_scan_gui(wx.Frame):
         self.sizer.Add(gauge_box, flag=wx.CENTRE)
 
     def _fn_set_results_table(self):
-        self.results_table = wx.ListCtrl(self.panel, wx.ID_ANY, size=(550,200), style=wx.LC_REPORT)
-        self.results_table.InsertColumn(0, 'IP Address')
-        self.results_table.InsertColumn(1, 'Reply')
-        self.results_table.SetColumnWidth(0, wx.LIST_AUTOSIZE)
+
+        # virtual table, rows are read from the result store on demand
+        self.result_store = result_store.cl_result_store()
+        self.results_table = cl_results_table(self.panel, self.result_store)
 
         # set font
         results_table_font = wx.Font(12, wx.DEFAULT, wx.NORMAL, wx.BOLD)
         self.results_table.SetFont(results_table_font)
 
-        # set width of IP columnn to fit length of ip address
-        self.results_table.SetColumnWidth(0, 80)
+        # filter out hosts that did not reply
+        self.alive_only_box = wx.CheckBox(self.panel, label='Alive only')
+        self.alive_only_box.Bind(wx.EVT_CHECKBOX, self._fn_on_alive_only)
 
         results_box = wx.BoxSizer(wx.HORIZONTAL)
         results_box.Add(self.results_table, flag=wx.CENTER)
         self.sizer.Add((0, 10))
         self.sizer.Add(results_box, flag=wx.ALIGN_CENTER)
+        self.sizer.Add(self.alive_only_box, flag=wx.ALIGN_CENTER | wx.TOP, border=5)
+
+    # ignores CommandEvent arg to toggle the alive only filter
+    def _fn_on_alive_only(self, e):
+
+        self.result_store.fn_set_filter(self.alive_only_box.IsChecked())
+        self.results_table.fn_refresh()
+
+    def _fn_clear_results_table(self):
+
+        self.result_store.fn_clear()
+        self.results_table.fn_refresh()
 
     # set labels and text boxes for user input
     def _fn_set_input(self):
@@ -268,11 +349,13 @@ class cl_ip_scan_gui(wx.Frame):
     def _fn_set_ctrl_btns(self):
 
         self._fn_set_start_btn()
+        self._fn_set_pause_btn()
         self._fn_set_cancel_btn()
 
-        # horizontal box sizer to contain both buttons
+        # horizontal box sizer to contain all buttons
         ctrl_btn_box = wx.BoxSizer(wx.HORIZONTAL)
         ctrl_btn_box.Add(self.start_btn, flag=wx.RIGHT, border=10)
+        ctrl_btn_box.Add(self.pause_btn, flag=wx.RIGHT, border=10)
         ctrl_btn_box.Add(self.cancel_btn)
 
         self.sizer.Add((0,30))
@@ -284,6 +367,34 @@ class cl_ip_scan_gui(wx.Frame):
         self.start_btn = wx.Button(self.panel, label='Start')
         self.start_btn.Bind(wx.EVT_BUTTON, self._fn_on_start)
 
+    def _fn_set_pause_btn(self):
+
+        self.pause_btn = wx.Button(self.panel, label='Pause')
+        self.pause_btn.Bind(wx.EVT_BUTTON, self._fn_on_pause)
+
+        # pause button holds a running scan, is disabled at start
+        self.pause_btn.Disable()
+
+    # ignores CommandEvent arg to pause or resume the current scan
+    def _fn_on_pause(self, e):
+
+        if self.scan_thread.scanner._paused:
+
+            # replies still arrived while paused, only sending resumes
+            self.scan_thread.resume()
+            if self.eta is not None:
+                self.eta.fn_reset_rate()
+            self.timer.Start(1000)
+            self.pause_btn.SetLabel('Pause')
+            self.SetTitle('IP Scanner (Scanning)')
+        else:
+
+            # the estimate stands still while nothing is sent
+            self.scan_thread.pause()
+            self.timer.Stop()
+            self.pause_btn.SetLabel('Resume')
+            self.SetTitle('IP Scanner (Paused)')
+
     def _fn_set_cancel_btn(self):
 
         self.cancel_btn = wx.Button(self.panel, label='Cancel')
@@ -324,8 +435,30 @@ class cl_ip_scan_gui(wx.Frame):
                 curr = next
 
         # clear previous scan from results table
-        self.results_table.DeleteAllItems()
+        self._fn_clear_results_table()
+        self.result_channel = result_channel.cl_result_channel(self._RESULT_CAPACITY)
         self.ping_index = 0
+        self.alive_count = 0
+        self.eta = None
+
+        # record the scan for the history once it finishes
+        targets = ip_scanner.get_in_range_ips(self.prefix_list, self.range_list).fn_to_target_set()
+        if self.history_item.IsChecked():
+            if self.history is None:
+                self.history = scan_history.cl_scan_history(self._HISTORY_PATH)
+            self.history_recorder = self.history.fn_record(targets)
+
+        # resume a cancelled scan of the same range, a checkpoint of any
+        # other range is replaced
+        scan_checkpoint = None
+        if self.checkpoint_item.IsChecked():
+            try:
+                scan_checkpoint = checkpoint.cl_scan_checkpoint(self._CHECKPOINT_PATH, targets)
+            except ValueError:
+                os.remove(self._CHECKPOINT_PATH)
+                scan_checkpoint = checkpoint.cl_scan_checkpoint(self._CHECKPOINT_PATH, targets)
+
+        cache = self.result_cache if self.cache_item.IsChecked() else None
 
         # Update frame title
         self.SetTitle('IP Scanner (Scanning)')
@@ -340,10 +473,13 @@ class cl_ip_scan_gui(wx.Frame):
         self.scan_thread = cl_guiThread(self.prefix_list,
                                         self.range_list,
                                         self.set_gauge_range,
-                                        self.update_scan_progress,
-                                        self.fn_start_timer)
-        # start timer
+                                        self.result_channel.fn_put,
+                                        self.fn_start_timer,
+                                        cache,
+                                        scan_checkpoint)
+        # start timers
         self.timer.Start(1000)
+        self.results_timer.Start(self._RESULT_INTERVAL)
 
     def _fn_parse_input(self, string):
 
@@ -387,7 +523,9 @@ class cl_ip_scan_gui(wx.Frame):
         # lock submit button
         self.start_btn.Disable()
 
-        # Enable cancel button
+        # Enable pause and cancel buttons
+        self.pause_btn.SetLabel('Pause')
+        self.pause_btn.Enable()
         self.cancel_btn.Enable()
 
     def _fn_enable_user_input(self):
@@ -397,7 +535,8 @@ class cl_ip_scan_gui(wx.Frame):
         # unlock submit button
         self.start_btn.Enable()
 
-        # Disable cancel button
+        # Disable pause and cancel buttons
+        self.pause_btn.Disable()
         self.cancel_btn.Disable()
 
     def _fn_disable_fields(self):
@@ -424,24 +563,36 @@ class cl_ip_scan_gui(wx.Frame):
         self.total_pings = n
         self.gauge.SetRange(self.total_pings)
 
-    # Updates est time remaining, gauge, and results table
-    def update_scan_progress(self, result):
+    # Updates gauge and results table from results queued by the scan thread
+    def _fn_drain_results(self, e):
 
-        # decrement time remaining by run time of failed ping
-        self.est_time -= self._NO_REPLY_TIME
+        batch = self.result_channel.fn_get_batch(self._MAX_RESULT_BATCH, 0)
+        if not batch:
+            return
 
-        # append ping result to table
-        self._fn_append_results_table(result)
+        # append the whole batch to the table with a single repaint
+        self.results_table.Freeze()
+        for result in batch:
+            self._fn_append_results_table(result)
+        self.results_table.fn_refresh()
+        self.results_table.Thaw()
 
         # update gauge
-        wx.CallAfter(self.gauge.SetValue, self.ping_index)
-        print 'break 4'
-        print '-----------------------------------------------------------------------------------'
+        self.gauge.SetValue(self.ping_index)
+
         if self.ping_index == self.total_pings:
             self._fn_on_finish()
 
     def _fn_on_finish(self):
 
+        # stop draining before the dialog runs its own event loop
+        self.results_timer.Stop()
+
+        # keep the scan for later comparison
+        if self.history_recorder is not None:
+            self.history_recorder.fn_finish()
+            self.history_recorder = None
+
         fin = wx.MessageDialog(None, self._FINISH_STR, 'Done', wx.CLOSE | wx.ICON_INFORMATION)
         fin.ShowModal()
 
@@ -456,26 +607,78 @@ class cl_ip_scan_gui(wx.Frame):
 
     def _fn_append_results_table(self, result):
 
-        print 'break 0'
-        ip = result[0]
-        reply = result[1]
-        print 'break 1'
-        # insert ip address into first column
-        #---------------------------------------------------------
-        wx.CallAfter(self.results_table.InsertItem,self.ping_index, ip)
-        print self.ping_index
-        print 'break 2'
-        #---------------------------------------------------------
-
-        # insert color coded reply into second column
-        wx.CallAfter(self.results_table.SetItem, self.ping_index, 1, str(reply))
-        if reply == True:
-            wx.CallAfter(self.results_table.SetItemBackgroundColour, self.ping_index, wx.GREEN)
+        # stored compactly, the virtual table reads it back when drawn
+        self.result_store.fn_append(result)
+        if self.history_recorder is not None:
+            self.history_recorder.fn_add(result)
+        if result.alive:
+            self.alive_count += 1
+        self.ping_index += 1
+
+
+class cl_results_table(wx.ListCtrl):
+    """
+    Virtual results table. Rows are never created as native items, the
+    control asks for the text and colour of each visible row on repaint.
+    """
+
+    _COLUMNS = ('IP Address', 'Reply', 'RTT (ms)')
+
+    # result store sort key for each column
+    _SORT_KEYS = ('ip', 'alive', 'rtt')
+
+    def __init__(self, parent, store):
+
+        wx.ListCtrl.__init__(self, parent, wx.ID_ANY, size=(550,200),
+                             style=wx.LC_REPORT | wx.LC_VIRTUAL)
+        self.store = store
+
+        for col, label in enumerate(self._COLUMNS):
+            self.InsertColumn(col, label)
+
+        # set width of IP columnn to fit length of ip address
+        self.SetColumnWidth(0, 160)
+
+        # colour coded replies
+        self.alive_attr = wx.ItemAttr()
+        self.alive_attr.SetBackgroundColour(wx.GREEN)
+        self.dead_attr = wx.ItemAttr()
+        self.dead_attr.SetBackgroundColour(wx.RED)
+
+        # clicking a column header sorts by it, a second click reverses
+        self.Bind(wx.EVT_LIST_COL_CLICK, self._fn_on_col_click)
+
+    def fn_refresh(self):
+
+        self.SetItemCount(self.store.fn_refresh())
+        self.Refresh()
+
+    def OnGetItemText(self, item, col):
+
+        ip, alive, rtt = self.store.fn_row(item)
+        if col == 0:
+            return ip
+        elif col == 1:
+            return str(alive)
+        elif rtt is None:
+            return ''
         else:
-            wx.CallAfter(self.results_table.SetItemBackgroundColour, self.ping_index, wx.RED)
+            return '{:.1f}'.format(rtt)
 
-        self.ping_index += 1
-        print 'break 3'
+    def OnGetItemAttr(self, item):
+
+        if self.store.fn_is_alive(item):
+            return self.alive_attr
+
+        return self.dead_attr
+
+    def _fn_on_col_click(self, e):
+
+        key = self._SORT_KEYS[e.GetColumn()]
+        reverse = self.store.sort_key == key and not self.store.sort_reverse
+
+        self.store.fn_set_sort(key, reverse)
+        self.fn_refresh()
 
 
 class cl_guiThread(threading.Thread):
@@ -485,14 +688,18 @@ class cl_guiThread(threading.Thread):
                  range_list,
                  fn_set_gauge_range,
                  fn_update_scan_progress,
-                 fn_start_timer):
+                 fn_start_timer,
+                 cache=None,
+                 scan_checkpoint=None):
 
         # instantiate instance of ip_scanner class to perform scan
         self.scanner = ip_scanner.cl_ip_scanner(prefix_list,
                                                       range_list,
                                                       fn_set_gauge_range,
                                                       fn_update_scan_progress,
-                                                      fn_start_timer)
+                                                      fn_start_timer,
+                                                      cache=cache,
+                                                      checkpoint=scan_checkpoint)
 
         # instantiate thread to start scan
         threading.Thread.__init__(self)
@@ -508,6 +715,15 @@ class cl_guiThread(threading.Thread):
 
         self.scanner._fn_stop_scan()
 
+    # holds and continues sending probes, replies keep arriving
+    def pause(self):
+
+        self.scanner.fn_pause()
+
+    def resume(self):
+
+        self.scanner.fn_resume()
+
     # overload run function to update GUI progress bar
     def run(self):
 
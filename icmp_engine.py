@@ -0,0 +1,228 @@
+#-------------------------------------------------------------------------------
+# Name:        ICMP Engine
+# Purpose:     Sends and receives ICMP echo over a single socket so that hosts
+#              can be pinged without starting a ping process per address.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import heapq                                # per-probe deadlines
+import os                                   # identifier for raw sockets
+import select                               # wait for replies
+import socket                               # ICMP socket
+import struct                               # pack/unpack ICMP headers
+import time                                 # send times and deadlines
+from probe_backend import cl_probe_backend, CAP_RTT, CAP_LATE_REPLIES, CAP_IN_PROCESS, CAP_ICMP
+
+_ICMP_ECHO_REPLY = 0
+_ICMP_ECHO_REQUEST = 8
+
+
+class cl_icmp_engine(cl_probe_backend):
+
+    CAPABILITIES = frozenset([CAP_RTT, CAP_LATE_REPLIES, CAP_IN_PROCESS, CAP_ICMP])
+
+    # seconds to wait for a reply before a host is reported dead
+    _DEFAULT_TIMEOUT = 1.0
+
+    # largest datagram read from the socket
+    _RECV_SIZE = 2048
+
+    # socket receive buffer, large enough to absorb bursts of replies
+    _RCVBUF_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, timeout=_DEFAULT_TIMEOUT):
+
+        self.timeout = timeout
+
+        # unprivileged ping socket where the OS allows it, raw socket otherwise
+        self.sock, self._raw = _fn_open_icmp_socket()
+        self.sock.setblocking(False)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self._RCVBUF_SIZE)
+
+        # ping sockets have their identifier rewritten to the local port
+        if self._raw:
+            self._ident = os.getpid() & 0xFFFF
+        else:
+            self.sock.bind(('', 0))
+            self._ident = self.sock.getsockname()[1] & 0xFFFF
+
+        # seq -> (host, send time, deadline) for every probe awaiting a reply
+        self.pending = dict()
+
+        # heap of (deadline, seq) used to expire probes that never get a reply
+        self.deadlines = list()
+
+        # seqs past their timeout that still accept a late reply
+        self.late = set()
+
+        # next sequence number to hand out
+        self._seq = 0
+
+    def fn_in_flight(self):
+
+        # probes in their grace period no longer hold a slot
+        return len(self.pending) - len(self.late)
+
+    def fn_outstanding(self):
+
+        # every probe whose result has not been returned yet
+        return len(self.pending)
+
+    def fn_start_probe(self, host, timeout=None, grace=0.0):
+        """
+        Sends one echo request to host. Its result is returned by a later
+        call to fn_poll, either as a reply or once the timeout has passed.
+        With a grace period the probe stops counting as in flight at the
+        timeout, but a reply arriving within grace seconds after it still
+        marks the host alive.
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        seq = self._fn_next_seq()
+        now = time.time()
+
+        try:
+            self.sock.sendto(_fn_echo_request(self._ident, seq), (host, 0))
+        except (OSError, socket.error):
+            # unreachable or unroutable, expire on the next poll
+            timeout = 0
+
+        self.pending[seq] = (host, now, now + timeout, grace)
+        heapq.heappush(self.deadlines, (now + timeout, seq))
+
+    def fn_poll(self, wait):
+        """
+        Waits up to wait seconds for replies, then returns a list of
+        (host, alive, rtt) for every probe that answered or timed out.
+        rtt is in seconds, or None for hosts that did not answer.
+        """
+        results = list()
+
+        # never sleep past the earliest deadline
+        if self.deadlines:
+            wait = max(0, min(wait, self.deadlines[0][0] - time.time()))
+
+        if self.pending:
+            readable = select.select([self.sock], [], [], wait)[0]
+            if readable:
+                self._fn_read_replies(results)
+        elif wait > 0:
+            time.sleep(wait)
+
+        self._fn_expire(results)
+        return results
+
+    def fn_cancel(self):
+
+        # forget every outstanding probe, late replies are ignored
+        self.pending.clear()
+        self.late.clear()
+        del self.deadlines[:]
+
+    def fn_close(self):
+
+        self.fn_cancel()
+        self.sock.close()
+
+    def _fn_next_seq(self):
+
+        # skip sequence numbers still awaiting a reply after wrap around
+        for _ in range(0x10000):
+            self._seq = (self._seq + 1) & 0xFFFF
+            if self._seq not in self.pending:
+                return self._seq
+
+        raise RuntimeError('more than 65536 ICMP probes in flight')
+
+    def _fn_read_replies(self, results):
+
+        while True:
+
+            try:
+                packet, addr = self.sock.recvfrom(self._RECV_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+
+            now = time.time()
+
+            # raw sockets deliver the IP header as well
+            if self._raw:
+                packet = packet[(packet[0] & 0x0F) * 4:]
+
+            if len(packet) < 8:
+                continue
+
+            icmp_type, code, checksum, ident, seq = struct.unpack('!BBHHH', packet[:8])
+            if icmp_type != _ICMP_ECHO_REPLY:
+                continue
+
+            # raw sockets see every reply on the host, not just ours
+            if self._raw and ident != self._ident:
+                continue
+
+            entry = self.pending.get(seq)
+            if entry is None or entry[0] != addr[0]:
+                continue
+
+            del self.pending[seq]
+            self.late.discard(seq)
+            results.append((entry[0], True, now - entry[1]))
+
+    def _fn_expire(self, results):
+
+        now = time.time()
+        while self.deadlines and self.deadlines[0][0] <= now:
+
+            deadline, seq = heapq.heappop(self.deadlines)
+
+            # entries already answered, or whose seq was reused, are skipped lazily
+            entry = self.pending.get(seq)
+            if entry is None or entry[2] != deadline:
+                continue
+
+            # first expiry of a probe with a grace period frees its slot only
+            host, sent, deadline, grace = entry
+            if grace > 0 and seq not in self.late:
+                self.late.add(seq)
+                self.pending[seq] = (host, sent, deadline + grace, grace)
+                heapq.heappush(self.deadlines, (deadline + grace, seq))
+                continue
+
+            del self.pending[seq]
+            self.late.discard(seq)
+            results.append((host, False, None))
+
+
+def _fn_open_icmp_socket():
+
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        return sock, False
+    except (OSError, socket.error):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        return sock, True
+
+def _fn_echo_request(ident, seq):
+
+    payload = struct.pack('!d', time.time())
+    header = struct.pack('!BBHHH', _ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = _fn_checksum(header + payload)
+
+    return struct.pack('!BBHHH', _ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+def _fn_checksum(data):
+
+    if len(data) % 2:
+        data += b'\0'
+
+    total = sum(struct.unpack('!{}H'.format(len(data) // 2), data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+
+    return ~total & 0xFFFF
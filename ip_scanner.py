@@ -10,91 +10,308 @@
 # Licence:     <your licence>
 #-------------------------------------------------------------------------------
 
-from platform import system as system_name  # Type of OS
-import subprocess                           # subprocesses to execute ping
+from array import array                     # hosts deferred by the cache
+from collections import namedtuple          # scan result records
+from ip_targets import cl_ip_range          # lazy target enumeration
+from ip_targets import ip_to_int, int_to_ip # compact deferred hosts
+from probe_backend import cl_ping_backend   # default probe mechanism
+from probe_backend import CAP_RTT           # needed by adaptive timeouts
+import heapq                                # retries ordered by due time
+import threading                            # pause and resume
+import time                                 # retry due times and send rate
+
+# result of one probe, rtt is in seconds or None when the host did not reply.
+# For ping subprocesses the rtt is the run time of the ping process.
+# attempts counts the probes sent to the host, including retries, and is 0
+# for results reported from a result cache.
+cl_scan_result = namedtuple('cl_scan_result', ['ip', 'alive', 'rtt', 'attempts'])
+cl_scan_result.__new__.__defaults__ = (None, 1)
+
+# what cl_ip_scanner does with hosts that have a fresh cached result: skip
+# them and report the cached result with attempts 0, or probe them last
+CACHE_SKIP = 'skip'
+CACHE_DEFER = 'defer'
+CACHE_POLICIES = (CACHE_SKIP, CACHE_DEFER)
 
 class cl_sub_process_spawner():
 
     _MAX_SUB_PROCESSES = 100
 
-    def __init__(self, ip_list, fn_update_scan_progress_cb):
+    # longest wait for results before the window is topped up again
+    _POLL_INTERVAL = 0.01
+
+    # most retries and rate deferred hosts queued before new targets pause
+    _MAX_DEFERRED = 4096
+
+    # returned by an exhausted target iterator
+    _EXHAUSTED = object()
+
+    # longest sleep while paused with nothing in flight
+    _PAUSE_WAIT = 0.05
+
+    def __init__(self,
+                 ip_list,
+                 fn_update_scan_progress_cb,
+                 engine=None,
+                 max_in_flight=_MAX_SUB_PROCESSES,
+                 timeout=None,
+                 adaptive_timeout=None,
+                 grace=0.0,
+                 retries=0,
+                 retry_backoff=0.5,
+                 rate_limiter=None,
+                 metrics=None):
 
         # reference to list of IPs to ping
         self.ip_list = ip_list
 
+        # number of pings kept in flight at once
+        self.max_in_flight = max_in_flight
+
+        # seconds before a ping without reply is reported dead, None for OS default
+        self.timeout = timeout
+
+        # optional probe_timeout.cl_adaptive_timeout, overrides timeout per host
+        self.adaptive_timeout = adaptive_timeout
+
+        # seconds after the timeout during which a late reply is still accepted
+        self.grace = grace
+
+        # extra probes for hosts that did not answer, the n-th retry waits
+        # retry_backoff * 2 ** (n - 1) seconds after the previous attempt
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+
+        # heap of (due time, host, attempt) for pending retries, also holds
+        # hosts deferred by the rate limiter
+        self.retry_heap = list()
+
+        # optional rate_limit.cl_rate_limiter capping probe emission
+        self.rate_limiter = rate_limiter
+
+        # probes sent and when the first and last went out, for the rate report
+        self.probes_sent = 0
+        self.first_send = None
+        self.last_send = None
+
+        # attempt number of hosts in flight on a retry
+        self.attempt_dict = dict()
+
+        # optional scan_metrics.cl_scan_metrics fed with probe start and poll
+        # times, probes in flight and the retry queue depth
+        self.metrics = metrics
+
+        # probe_backend.cl_probe_backend doing the probing, ping subprocesses
+        # unless another backend is given; only a backend created here is
+        # closed here, callers close their own
+        self.owns_engine = engine is None
+        if engine is None:
+            engine = cl_ping_backend(timeout)
+        self.engine = engine
+
+        # adaptive timeouts learn from RTTs, a backend without them starves it
+        if adaptive_timeout is not None and CAP_RTT not in engine.CAPABILITIES:
+            raise ValueError('adaptive timeouts need a backend that reports round trip times')
+
         # function to increment gauge
         self._fn_update_scan_progress = fn_update_scan_progress_cb
 
-        # to store spawned subprocesses
-        self.sub_process_dict = dict()
-
         # set to false to stop spawn
         self._running = True
 
+        # cleared while paused, set again to resume or stop
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+
     def _fn_spawn(self):
+        """
+        Keeps up to max_in_flight pings in flight at all times. A new
+        ping is started as soon as any running one finishes, and each result
+        is reported in completion order rather than in list order. Retries
+        that are due take the next free slots ahead of new addresses, so
+        they are interleaved with the sweep instead of forming a tail.
+
+        ip_list may also be an open-ended iterator that yields None while it
+        has nothing to probe; replies are then collected until it is asked
+        again on the next pass, and the scan only ends once it is exhausted.
+        """
+        ip_iter = iter(self.ip_list)
+        exhausted = False
+
+        try:
+            while self._running:
+
+                # paused, nothing new is sent but replies are still collected
+                if not self._resume_event.is_set():
+                    if self._fn_outstanding() == 0:
+                        self._resume_event.wait(self._PAUSE_WAIT)
+                    else:
+                        self._fn_wait_for_replies()
+                    continue
+
+                # top up the window with due retries, then new pings, checking
+                # for a stop on every probe so a wide window cannot delay it
+                while self._running and self._fn_in_flight() < self.max_in_flight:
+
+                    # over the global packet rate, try again after the next poll
+                    if self.rate_limiter is not None and not self.rate_limiter.fn_ready():
+                        break
+
+                    host = self._fn_next_retry()
+                    if host is None and not exhausted and len(self.retry_heap) < self._MAX_DEFERRED:
+                        host = next(ip_iter, self._EXHAUSTED)
+                        exhausted = host is self._EXHAUSTED
+                        if exhausted:
+                            host = None
+
+                    if host is None:
+                        break
+
+                    # hosts over their /24 rate wait for the token reserved for them
+                    if self.rate_limiter is not None:
+                        delay = self.rate_limiter.fn_acquire(host)
+                        if delay > 0:
+                            attempt = self.attempt_dict.pop(host, 1)
+                            heapq.heappush(self.retry_heap, (time.time() + delay, host, attempt))
+                            continue
+
+                    self._fn_ping(host)
+
+                # nothing left to send or wait on
+                if exhausted and not self.retry_heap and self._fn_outstanding() == 0:
+                    break
 
-        ip_list_len = len(self.ip_list)
+                # report finished pings, waiting briefly if none are done yet
+                self._fn_wait_for_replies()
+        finally:
+            # drop whatever is still outstanding after a stop or an error, so
+            # no probe outlives the scan
+            self.engine.fn_cancel()
+            if self.owns_engine:
+                self.engine.fn_close()
 
-        # ping all ip addresses within range
-        step = self._MAX_SUB_PROCESSES
-        for i in range(0, ip_list_len, step):
+    def fn_rate_report(self):
+        """
+        Returns (achieved, target) probe rates in packets per second. target
+        is None without a global rate limit.
+        """
+        target = self.rate_limiter.rate if self.rate_limiter is not None else None
 
-            # end position of subset within ip_set
-            end = i + step
+        if self.probes_sent < 2 or self.last_send == self.first_send:
+            return 0.0, target
 
-            # end position past the range of ip_set
-            if end > ip_list_len:
-                end = ip_list_len
+        return (self.probes_sent - 1) / (self.last_send - self.first_send), target
 
-            # send out pings sequentially
-            for j in range(i, end):
+    def _fn_next_retry(self):
 
-                if self._running == False:
-                    self._fn_terminate_sub_processes()
-                    break
+        if not self.retry_heap or self.retry_heap[0][0] > time.time():
+            return None
 
-                else:
+        due, host, attempt = heapq.heappop(self.retry_heap)
+        self.attempt_dict[host] = attempt
+        return host
 
-                    self._fn_ping(self.ip_list[j])
+    def _fn_in_flight(self):
 
-            # wait for replies
-            self._fn_wait_for_replies()
+        return self.engine.fn_in_flight()
 
-    def _fn_wait_for_replies(self):
+    def _fn_outstanding(self):
 
-        for key in self.sub_process_dict.keys():
+        # includes probes in their grace period, which hold no slot
+        return self.engine.fn_outstanding()
+
+    def _fn_wait_for_replies(self):
+        """
+        Reports every probe the backend has finished, waiting up to one poll
+        interval for the first. Returns the number of replies processed.
+        """
+        # nothing to wait on while only retries or rate deferred hosts are
+        # left, backends return at once then, so sleep until the next is due
+        if self._fn_outstanding() == 0:
+            delay = self._POLL_INTERVAL
+            if self.retry_heap:
+                delay = min(delay, self.retry_heap[0][0] - time.time())
+            if delay > 0:
+                time.sleep(delay)
+            return 0
+
+        if self.metrics is None:
+            replies = self.engine.fn_poll(self._POLL_INTERVAL)
+        else:
+            started = time.perf_counter()
+            replies = self.engine.fn_poll(self._POLL_INTERVAL)
+            self.metrics.fn_polled(time.perf_counter() - started,
+                                   self._fn_in_flight(),
+                                   len(self.retry_heap))
 
-            sub_process = self.sub_process_dict[key]
-            sub_process.wait()                              # wait for process to finish
+        for host, alive, rtt in replies:
+            self._fn_process_ping(host, alive, rtt)
 
-            self._fn_process_ping(key, sub_process.returncode)
-            del self.sub_process_dict[key]
+        return len(replies)
 
     def _fn_ping(self, host):
         """
-        Pings the host IP address specified by creating a subprocess,
-        and creates an (host, sub_process) entry in the subprocess dictionary
+        Starts a probe of the host IP address specified on the backend
         """
-        # determine parameters from OS and execute ping
-        if system_name().lower() == "windows":
-            sub_process = subprocess.Popen(['ping', '-n', '1', host], stdout=subprocess.PIPE)
+        timeout = self._fn_probe_timeout(host)
+
+        # emission times for the rate report
+        self.last_send = time.time()
+        if self.first_send is None:
+            self.first_send = self.last_send
+        self.probes_sent += 1
+
+        if self.metrics is None:
+            self.engine.fn_start_probe(host, timeout, self.grace)
         else:
-            sub_process = subprocess.Popen(['ping', '-c', '1', host], stdout=subprocess.PIPE)
+            started = time.perf_counter()
+            self.engine.fn_start_probe(host, timeout, self.grace)
+            self.metrics.fn_probe_started(time.perf_counter() - started)
+
+    def _fn_probe_timeout(self, host):
+
+        if self.adaptive_timeout is not None:
+            return self.adaptive_timeout.fn_timeout(host)
+
+        return self.timeout
 
-        # append subprocess to list before returning
-        self.sub_process_dict[host] = sub_process
-        return
+    def _fn_process_ping(self, ip, alive, rtt=None):
 
-    def _fn_process_ping(self, ip, reply):
+        # replies feed the RTT distribution behind adaptive timeouts
+        if self.adaptive_timeout is not None and rtt is not None:
+            self.adaptive_timeout.fn_observe(ip, rtt)
 
-        result = (ip, reply == 0)
+        attempts = self.attempt_dict.pop(ip, 1)
+
+        # hosts that did not answer are queued again until out of retries
+        if not alive and attempts <= self.retries:
+            due = time.time() + self.retry_backoff * 2 ** (attempts - 1)
+            heapq.heappush(self.retry_heap, (due, ip, attempts + 1))
+            return
+
+        result = cl_scan_result(ip, alive, rtt, attempts)
         self._fn_update_scan_progress(result)
 
+    def fn_pause(self):
+        """
+        Stops sending probes. Probes in flight still complete and are reported.
+        """
+        self._resume_event.clear()
+
+    def fn_resume(self):
+
+        self._resume_event.set()
+
+    def fn_is_paused(self):
+
+        return not self._resume_event.is_set()
+
     def _fn_terminate_sub_processes(self):
 
+        # the spawning thread cancels outstanding probes on its way out,
+        # within one poll interval, paused or not
         self._running = False
-        for key in self.sub_process_dict.keys():
-            self.sub_process_dict[key].terminate()
+        self._resume_event.set()
 
 
 class cl_ip_scanner():
@@ -106,45 +323,257 @@ class cl_ip_scanner():
                  range_list,
                  fn_set_gauge_range_cb,
                  fn_update_scan_progress_cb,
-                 fn_start_timer_cb):
-
-        # needed data and functions from GUI class
+                 fn_start_timer_cb,
+                 engine=None,
+                 targets=None,
+                 max_in_flight=cl_sub_process_spawner._MAX_SUB_PROCESSES,
+                 timeout=None,
+                 adaptive_timeout=None,
+                 grace=0.0,
+                 retries=0,
+                 retry_backoff=0.5,
+                 rate_limiter=None,
+                 workers=0,
+                 ports=None,
+                 cache=None,
+                 cache_policy=CACHE_SKIP,
+                 checkpoint=None,
+                 metrics=None):
+
+        # needed data and functions from GUI class, the gauge and timer
+        # callbacks may be None for headless scans
         self.prefix_list = prefix_list
         self.range_list = range_list
         self._fn_set_gauge_range = fn_set_gauge_range_cb
         self._fn_update_scan_progress = fn_update_scan_progress_cb
         self._fn_start_timer = fn_start_timer_cb
 
+        # probe_backend.cl_probe_backend to probe with, ping subprocesses if None.
+        # With more than one worker process it is a probe_backend.BACKEND_NAMES
+        # name instead, every worker creates its own backend from it
+        self.engine = engine
+        self.workers = workers
+        self.ports = ports
+
+        # optional ip_targets.cl_target_set, used instead of prefix/range lists
+        self.targets = targets
+
+        # probe concurrency and per-probe timeout in seconds, optionally
+        # adapted to observed RTTs by a probe_timeout.cl_adaptive_timeout
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.adaptive_timeout = adaptive_timeout
+        self.grace = grace
+
+        # re-probes of hosts that did not answer, with exponential backoff
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+
+        # optional rate_limit.cl_rate_limiter capping packets per second
+        self.rate_limiter = rate_limiter
+
+        # optional result_store.cl_result_cache shared between scans, and
+        # one of CACHE_POLICIES. Worker processes only add to the cache
+        if cache_policy not in CACHE_POLICIES:
+            raise ValueError('unknown cache policy: {}'.format(cache_policy))
+        self.cache = cache
+        self.cache_policy = cache_policy
+
+        # optional checkpoint.cl_scan_checkpoint of the same targets; only the
+        # hosts it has no result for are probed, and it is saved when the scan
+        # stops early or removed once the scan is complete
+        self.checkpoint = checkpoint
+
+        # optional scan_metrics.cl_scan_metrics, see fn_stats
+        self.metrics = metrics
+
+        # created by _check_active_ips, stop and pause requests made before
+        # then are remembered and applied to it
+        self.sub_process_spawner = None
+        self._stopped = False
+        self._paused = False
+
         # to hold created threads
         self.thread_list = list()
 
     def _check_active_ips(self):
 
-        # obtain subnet prefix
-        prefix, prefix_len = get_subnet_prefix(self.prefix_list)
-
-        # generate all ip addresses within range
-        ip_list = list()
-        starting_byte = self._MAX_FIELDS - prefix_len - 1
-        get_in_range_ips(prefix, self.range_list, ip_list, starting_byte)
+        # lazily enumerate all ip addresses within range
+        if self.targets is not None:
+            ip_list = self.targets
+        else:
+            ip_list = get_in_range_ips(self.prefix_list, self.range_list)
         ip_list_len = len(ip_list)
 
         # set timer and estimated run time with number of ips generated
-        self._fn_start_timer(ip_list_len)
+        if self._fn_start_timer is not None:
+            self._fn_start_timer(ip_list_len)
 
         # set range of progress bar
-        self._fn_set_gauge_range(ip_list_len)
+        if self._fn_set_gauge_range is not None:
+            self._fn_set_gauge_range(ip_list_len)
+
+        # results saved by an interrupted run count towards this one
+        if self.checkpoint is not None:
+            for result in self.checkpoint.fn_replay():
+                if self._stopped:
+                    return
+                self._fn_report_progress(result)
+            ip_list = self.checkpoint.fn_remaining()
+
+        # a pool of probe processes, each scanning blocks of the targets
+        if self.workers > 1:
+            import worker_pool
+            self.sub_process_spawner = worker_pool.cl_worker_pool(ip_list,
+                                                                  self._fn_report_result,
+                                                                  self.engine or 'ping',
+                                                                  self.workers,
+                                                                  self.max_in_flight,
+                                                                  self.timeout,
+                                                                  self.adaptive_timeout,
+                                                                  self.grace,
+                                                                  self.retries,
+                                                                  self.retry_backoff,
+                                                                  self.rate_limiter,
+                                                                  self.ports,
+                                                                  self.metrics)
+        else:
+            if self.rate_limiter is not None:
+                ip_list = self.rate_limiter.fn_order(ip_list)
+            if self.cache is not None:
+                ip_list = self._fn_cached_targets(ip_list)
+
+            # instantiate subprocess spawner
+            self.sub_process_spawner = cl_sub_process_spawner(ip_list,
+                                                              self._fn_report_result,
+                                                              self.engine,
+                                                              self.max_in_flight,
+                                                              self.timeout,
+                                                              self.adaptive_timeout,
+                                                              self.grace,
+                                                              self.retries,
+                                                              self.retry_backoff,
+                                                              self.rate_limiter,
+                                                              self.metrics)
+
+        # apply requests made while the scan was being set up
+        if self._paused:
+            self.sub_process_spawner.fn_pause()
+        if self._stopped:
+            self.sub_process_spawner._fn_terminate_sub_processes()
+
+        # spawn subprocesses to execute pings, saving progress however it ends
+        try:
+            self.sub_process_spawner._fn_spawn()
+        finally:
+            if self.checkpoint is not None:
+                if self.checkpoint.fn_is_complete():
+                    self.checkpoint.fn_discard()
+                else:
+                    self.checkpoint.fn_save()
+
+    def _fn_cached_targets(self, ip_list):
+        """
+        Yields the targets that need probing. Hosts with a fresh cached result
+        are reported from the cache instead, or with CACHE_DEFER yielded
+        after every other host.
+        """
+        deferred = array('I')
+
+        for ip in ip_list:
+
+            # long runs of cached hosts are replayed without returning to
+            # the spawner, so stop requests are checked here too
+            if self._stopped:
+                return
+
+            cached = self.cache.fn_lookup(ip)
+            if cached is None:
+                yield ip
+            elif self.cache_policy == CACHE_DEFER:
+                deferred.append(ip_to_int(ip))
+            else:
+                alive, rtt = cached
+                self._fn_report_result(cl_scan_result(ip, alive, rtt, 0), False)
+
+        for ip in deferred:
+            yield int_to_ip(ip)
+
+    def _fn_report_result(self, result, probed=True):
+
+        # only probe results refresh the cache, cached ones would never expire
+        if self.cache is not None and probed:
+            self.cache.fn_store(result)
+
+        if self.checkpoint is not None:
+            self.checkpoint.fn_add(result)
+
+        self._fn_report_progress(result)
 
-        # instantiate subprocess spawner
-        self.sub_process_spawner = cl_sub_process_spawner(ip_list,
-                                                      self._fn_update_scan_progress)
+    def _fn_report_progress(self, result):
 
-        # spawn subprocesses to execute pings
-        self.sub_process_spawner._fn_spawn()
+        if self.metrics is None:
+            self._fn_update_scan_progress(result)
+            return
+
+        # time spent in the caller's callback, the GUI or an output writer
+        started = time.perf_counter()
+        self._fn_update_scan_progress(result)
+        self.metrics.fn_result(result, time.perf_counter() - started)
 
     def _fn_stop_scan(self):
 
-        self.sub_process_spawner._fn_terminate_sub_processes()
+        self._stopped = True
+
+        if self.sub_process_spawner is not None:
+            self.sub_process_spawner._fn_terminate_sub_processes()
+
+    def fn_pause(self):
+
+        self._paused = True
+        if self.sub_process_spawner is not None:
+            self.sub_process_spawner.fn_pause()
+
+    def fn_resume(self):
+
+        self._paused = False
+        if self.sub_process_spawner is not None:
+            self.sub_process_spawner.fn_resume()
+
+    def fn_rate_report(self):
+
+        # nothing sent before the scan has started
+        if self.sub_process_spawner is None:
+            target = self.rate_limiter.rate if self.rate_limiter is not None else None
+            return 0.0, target
+
+        return self.sub_process_spawner.fn_rate_report()
+
+    def fn_stats(self):
+        """
+        Returns a dict of the scan's probe count, probes in flight and rates,
+        and with metrics every scan_metrics.cl_scan_metrics value as well.
+        Safe to call from any thread, before or during the scan.
+        """
+        spawner = self.sub_process_spawner
+        achieved, target = spawner.fn_rate_report() if spawner is not None else (0.0, None)
+
+        # worker pools do not know what their processes have in flight
+        in_flight = None
+        if isinstance(spawner, cl_sub_process_spawner):
+            in_flight = spawner._fn_in_flight()
+
+        stats = {'probes_sent': spawner.probes_sent if spawner is not None else 0,
+                 'in_flight': in_flight,
+                 'probe_rate': achieved,
+                 'target_rate': target,
+                 'paused': self._paused,
+                 'stopped': self._stopped}
+
+        if self.metrics is not None:
+            stats.update(self.metrics.fn_snapshot())
+
+        return stats
 
 
 def get_subnet_prefix(prefix_list):
@@ -153,43 +582,25 @@ def get_subnet_prefix(prefix_list):
 
     return prefix, prefix_len
 
-def get_in_range_ips(prefix, ranges, ip_list, byte ):
-
-    if byte < 0:
-       return ip_list.append(prefix)
-
-    index = byte - len(ranges) + 1
-    cur_range = ranges[index]
-    start = int(cur_range[0])
-    end = int(cur_range[1])
+def get_in_range_ips(prefix, ranges):
+    """
+    Returns a lazy ip_targets.cl_ip_range over every address matching prefix,
+    given as a dotted string or a list of octets, and one (start, end) range
+    per remaining octet. Nothing is expanded until addresses are read.
+    """
+    if not isinstance(prefix, (list, tuple)):
+        prefix = [octet for octet in str(prefix).split('.') if octet != '']
 
-    if byte == 0:
-        for val in range(start, end+1):
-            ip = prefix + '.{}'.format(str(val))
-            ip_list.append(ip)
-        return
-    else:
-        temp = list()
-        for val in range(start, end+1):
-            ip = prefix + '.{}'.format(str(val))
-            temp.append(ip)
-
-        for ip in temp:
-            get_in_range_ips(ip, ranges, ip_list, byte - 1)
+    return cl_ip_range(prefix, ranges)
 
 
 #----------------------------------------------------------------------------------------
 
 def main():
 
-    ip_list = list()
-    prefix = '10.11'
-    ranges = [(0,255),(0,255)]
-    byte = 1
-
-    get_in_range_ips(prefix, ranges, ip_list, byte)
-    for ip in ip_list:
-        print ip
+    # the command line controller drives the scanner without the GUI
+    import controller
+    return controller.main()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,488 @@
+#-------------------------------------------------------------------------------
+# Name:        IP Targets
+# Purpose:     Lazy, integer based enumeration of the IP addresses to scan.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+from array import array                     # compact interval storage
+import bisect                               # interval lookups
+import itertools                            # walk the leading octet ranges
+import socket                               # dotted-quad formatting
+import struct                               # pack addresses for formatting
+
+_MAX_FIELDS = 4
+
+
+class cl_ip_range():
+    """
+    All addresses matching a fixed prefix followed by one inclusive range
+    per remaining octet. Addresses are kept as 32-bit integers and are only
+    formatted to dotted-quad as they are handed out, so a range of any size
+    costs the same memory and starts yielding immediately.
+    """
+
+    def __init__(self, prefix_list, range_list):
+
+        if len(prefix_list) + len(range_list) != _MAX_FIELDS:
+            raise ValueError('prefix and ranges must cover {} octets'.format(_MAX_FIELDS))
+
+        # (first value, number of values) for every octet, most significant first
+        self.octets = [(int(octet), 1) for octet in prefix_list]
+        for start, end in range_list:
+            start, end = int(start), int(end)
+            self.octets.append((start, max(0, end - start + 1)))
+
+        self._len = 1
+        for start, count in self.octets:
+            self._len *= count
+
+    def __len__(self):
+
+        return self._len
+
+    def __getitem__(self, index):
+
+        return int_to_ip(self.fn_int_at(index))
+
+    def __iter__(self):
+
+        for ip in self.fn_iter_ints():
+            yield int_to_ip(ip)
+
+    def __contains__(self, ip):
+
+        ip = ip_to_int(ip)
+        for shift, (start, count) in zip((24, 16, 8, 0), self.octets):
+            if not start <= (ip >> shift) & 0xFF < start + count:
+                return False
+
+        return True
+
+    def fn_int_at(self, index):
+        """
+        Returns the address at position index, as an integer, in the same
+        order as iteration.
+        """
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('ip range index out of range')
+
+        # mixed radix decomposition, last octet varies fastest
+        ip = 0
+        for shift, (start, count) in zip((0, 8, 16, 24), reversed(self.octets)):
+            index, offset = divmod(index, count)
+            ip |= (start + offset) << shift
+
+        return ip
+
+    def fn_to_target_set(self):
+
+        return cl_target_set(_fn_octet_intervals(self))
+
+    def fn_iter_ints(self):
+
+        if self._len == 0:
+            return
+
+        # the last octet is contiguous, so only the leading three are combined
+        leading = [range(start, start + count) for start, count in self.octets[:-1]]
+        last_start, last_count = self.octets[-1]
+
+        for a, b, c in itertools.product(*leading):
+            base = (a << 24) | (b << 16) | (c << 8) | last_start
+            for ip in range(base, base + last_count):
+                yield ip
+
+
+class cl_target_set():
+    """
+    A set of IPv4 addresses stored as sorted, merged, inclusive integer
+    intervals. Membership and random access are O(log n) in the number of
+    intervals, and iteration is lazy, so a /8 costs a single interval.
+    """
+
+    def __init__(self, intervals=()):
+
+        merged = _fn_merge_intervals(intervals)
+
+        # interval bounds, and the number of addresses before each interval
+        self.starts = array('I', [start for start, end in merged])
+        self.ends = array('I', [end for start, end in merged])
+        self.offsets = array('Q', [0])
+        for start, end in merged:
+            self.offsets.append(self.offsets[-1] + end - start + 1)
+
+    def __len__(self):
+
+        return self.offsets[-1]
+
+    def __getitem__(self, index):
+
+        return int_to_ip(self.fn_int_at(index))
+
+    def __iter__(self):
+
+        for ip in self.fn_iter_ints():
+            yield int_to_ip(ip)
+
+    def __contains__(self, ip):
+
+        if not isinstance(ip, int):
+            ip = ip_to_int(ip)
+
+        i = bisect.bisect_right(self.starts, ip) - 1
+        return i >= 0 and ip <= self.ends[i]
+
+    def __eq__(self, other):
+
+        return isinstance(other, cl_target_set) and \
+               self.starts == other.starts and self.ends == other.ends
+
+    def __ne__(self, other):
+
+        return not self == other
+
+    def __or__(self, other):
+
+        return self.fn_union(other)
+
+    def __sub__(self, other):
+
+        return self.fn_difference(other)
+
+    def __repr__(self):
+
+        strings = self.fn_to_strings()
+        if len(strings) > 4:
+            strings = strings[:4] + ['... {} intervals'.format(len(strings))]
+
+        return 'cl_target_set({})'.format(', '.join(strings))
+
+    def fn_intervals(self):
+
+        return zip(self.starts, self.ends)
+
+    def fn_int_at(self, index):
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('target set index out of range')
+
+        i = bisect.bisect_right(self.offsets, index) - 1
+        return self.starts[i] + index - self.offsets[i]
+
+    def fn_index(self, ip):
+        """
+        Returns the position of ip in the set, the inverse of fn_int_at.
+        """
+        if not isinstance(ip, int):
+            ip = ip_to_int(ip)
+
+        i = bisect.bisect_right(self.starts, ip) - 1
+        if i < 0 or ip > self.ends[i]:
+            raise ValueError('{} is not in the target set'.format(int_to_ip(ip)))
+
+        return self.offsets[i] + ip - self.starts[i]
+
+    def fn_slice(self, start, stop):
+        """
+        Returns the addresses at positions [start, stop) as a new set.
+        """
+        stop = min(stop, len(self))
+        if start >= stop:
+            return cl_target_set()
+
+        first = bisect.bisect_right(self.offsets, start) - 1
+        last = bisect.bisect_right(self.offsets, stop - 1) - 1
+
+        intervals = list()
+        for i in range(first, last + 1):
+            intervals.append((max(self.starts[i], self.starts[i] + start - self.offsets[i]),
+                              min(self.ends[i], self.starts[i] + stop - 1 - self.offsets[i])))
+
+        return cl_target_set(intervals)
+
+    def fn_iter_ints(self):
+
+        for start, end in self.fn_intervals():
+            for ip in range(start, end + 1):
+                yield ip
+
+    def fn_interleaved(self):
+        """
+        Yields the addresses taking the /24s in turn: the first address of
+        every /24, then the second, and so on, so consecutive addresses are
+        in different /24s wherever the set spans several.
+        """
+        # (first address, addresses per /24, number of /24s) of the partial
+        # /24s at either end of every interval and the whole ones between
+        pieces = list()
+        for start, end in self.fn_intervals():
+            if start >> 8 == end >> 8:
+                pieces.append((start, end - start + 1, 1))
+                continue
+
+            if start & 0xFF:
+                pieces.append((start, 0x100 - (start & 0xFF), 1))
+                start = (start | 0xFF) + 1
+            tail = None
+            if end & 0xFF != 0xFF:
+                tail = (end & ~0xFF, (end & 0xFF) + 1, 1)
+                end = (end & ~0xFF) - 1
+            if start <= end:
+                pieces.append((start, 0x100, (end - start + 1) >> 8))
+            if tail is not None:
+                pieces.append(tail)
+
+        # one pass per position within a /24, dropping pieces run out of it
+        offset = 0
+        while pieces:
+            for first, count, subnets in pieces:
+                for subnet in range(subnets):
+                    yield int_to_ip(first + (subnet << 8) + offset)
+
+            offset += 1
+            pieces = [piece for piece in pieces if piece[1] > offset]
+
+    def fn_union(self, other):
+
+        return cl_target_set(list(self.fn_intervals()) + list(other.fn_intervals()))
+
+    def fn_difference(self, other):
+
+        result = list()
+        others = list(other.fn_intervals())
+        j = 0
+
+        for start, end in self.fn_intervals():
+
+            # skip exclusions that end before this interval
+            while j < len(others) and others[j][1] < start:
+                j += 1
+
+            # cut every overlapping exclusion out of the interval
+            k = j
+            while k < len(others) and others[k][0] <= end:
+                if others[k][0] > start:
+                    result.append((start, others[k][0] - 1))
+                start = max(start, others[k][1] + 1)
+                k += 1
+
+            if start <= end:
+                result.append((start, end))
+
+        return cl_target_set(result)
+
+    def fn_exclude(self, specs):
+        """
+        Returns a copy without the addresses in specs, a list of strings in
+        any form accepted by parse_targets.
+        """
+        return self.fn_difference(parse_targets(specs))
+
+    def fn_to_strings(self):
+        """
+        Formats the set as a list of single addresses and 'first-last' ranges
+        that parse_targets reads back to the same set.
+        """
+        strings = list()
+        for start, end in self.fn_intervals():
+            if start == end:
+                strings.append(int_to_ip(start))
+            else:
+                strings.append('{}-{}'.format(int_to_ip(start), int_to_ip(end)))
+
+        return strings
+
+
+class cl_target_slice():
+    """
+    Lazy view of positions [start, stop) of a cl_ip_range or cl_target_set,
+    used to hand contiguous blocks of a scan to workers.
+    """
+
+    def __init__(self, targets, start, stop):
+
+        self.targets = targets
+        self.start = start
+        self.stop = min(stop, len(targets))
+
+    def __len__(self):
+
+        return max(0, self.stop - self.start)
+
+    def __getitem__(self, index):
+
+        return int_to_ip(self.fn_int_at(index))
+
+    def __iter__(self):
+
+        for ip in self.fn_iter_ints():
+            yield int_to_ip(ip)
+
+    def fn_int_at(self, index):
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('target slice index out of range')
+
+        return self.targets.fn_int_at(self.start + index)
+
+    def fn_to_target_set(self):
+
+        targets = self.targets
+        if not isinstance(targets, cl_target_set):
+            targets = targets.fn_to_target_set()
+
+        return targets.fn_slice(self.start, self.stop)
+
+    def fn_iter_ints(self):
+
+        for index in range(self.start, self.stop):
+            yield self.targets.fn_int_at(index)
+
+
+def parse_targets(specs, exclude=()):
+    """
+    Builds a cl_target_set from a list of strings. Each string may be a single
+    address ('10.0.0.1'), a CIDR block ('10.0.0.0/8'), an address range
+    ('10.0.0.1-10.0.3.254') or per-octet ranges ('10.0-3.*.1-254'), and may
+    hold several of these separated by commas. Addresses in exclude are
+    removed from the result.
+    """
+    if isinstance(specs, str):
+        specs = [specs]
+
+    intervals = list()
+    for spec in specs:
+        for item in spec.split(','):
+            item = item.strip()
+            if item:
+                intervals.extend(_fn_parse_spec(item))
+
+    targets = cl_target_set(intervals)
+    if exclude:
+        targets = targets.fn_exclude(exclude)
+
+    return targets
+
+def _fn_parse_spec(spec):
+
+    # CIDR block, the address needs all four octets so '10/8' is no 0.0.0.0/8
+    if '/' in spec:
+        address, prefix_len = spec.split('/', 1)
+        if not prefix_len.isdigit() or not 0 <= int(prefix_len) <= 32:
+            raise ValueError('invalid CIDR prefix length: {}'.format(spec))
+        prefix_len = int(prefix_len)
+
+        mask = (0xFFFFFFFF << (32 - prefix_len)) & 0xFFFFFFFF
+        start = _fn_parse_address(address, spec) & mask
+        return [(start, start | (~mask & 0xFFFFFFFF))]
+
+    # first-last address range
+    if spec.count('-') == 1 and spec.count('.') == 6:
+        first, last = spec.split('-')
+        first, last = _fn_parse_address(first, spec), _fn_parse_address(last, spec)
+        if first > last:
+            raise ValueError('address range ends before it starts: {}'.format(spec))
+        return [(first, last)]
+
+    # dotted-quad, optionally with per-octet ranges or wildcards
+    fields = spec.split('.')
+    if len(fields) != _MAX_FIELDS:
+        raise ValueError('invalid target: {}'.format(spec))
+
+    range_list = list()
+    for field in fields:
+        if field == '*':
+            field = '0-255'
+        start, _, end = field.partition('-')
+        end = end or start
+        if not start.isdigit() or not end.isdigit():
+            raise ValueError('invalid octet range in target: {}'.format(spec))
+        start, end = int(start), int(end)
+        if not 0 <= start <= end <= 255:
+            raise ValueError('invalid octet range in target: {}'.format(spec))
+        range_list.append((start, end))
+
+    return _fn_octet_intervals(cl_ip_range([], range_list))
+
+def _fn_octet_intervals(ip_range):
+
+    octets = ip_range.octets
+    if any(count == 0 for start, count in octets):
+        return []
+
+    # trailing full octets ('*' or 0-255) and the octet before them form one
+    # contiguous span, so only the octets in front of it are combined
+    split = len(octets) - 1
+    while split > 0 and octets[split] == (0, 256):
+        split -= 1
+
+    shift = 8 * (len(octets) - 1 - split)
+    span_start, span_count = octets[split]
+    low = span_start << shift
+    high = ((span_start + span_count) << shift) - 1
+
+    intervals = list()
+    leading = [range(start, start + count) for start, count in octets[:split]]
+    for combination in itertools.product(*leading):
+
+        prefix = 0
+        for octet in combination:
+            prefix = (prefix << 8) | octet
+        prefix <<= 8 * (len(octets) - split)
+
+        # adjacent spans are joined as they are generated
+        if intervals and intervals[-1][1] + 1 == prefix | low:
+            intervals[-1] = (intervals[-1][0], prefix | high)
+        else:
+            intervals.append((prefix | low, prefix | high))
+
+    return intervals
+
+def _fn_merge_intervals(intervals):
+
+    merged = list()
+    for start, end in sorted(intervals):
+
+        if start > end:
+            continue
+
+        # overlapping or adjacent intervals are joined
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    return merged
+
+def _fn_parse_address(address, spec):
+
+    try:
+        return ip_to_int(address)
+    except ValueError:
+        raise ValueError('invalid address in target: {}'.format(spec))
+
+def ip_to_int(ip):
+    """
+    Returns a dotted-quad address as an integer. Raises ValueError unless
+    ip is exactly four decimal octets, shorthand like '10.1' is refused.
+    """
+    try:
+        return struct.unpack('!I', socket.inet_pton(socket.AF_INET, ip))[0]
+    except (OSError, TypeError):
+        raise ValueError('invalid IPv4 address: {!r}'.format(ip))
+
+def int_to_ip(ip):
+
+    return socket.inet_ntoa(struct.pack('!I', ip))
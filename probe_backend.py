@@ -0,0 +1,376 @@
+#-------------------------------------------------------------------------------
+# Name:        Probe Backend
+# Purpose:     Interface between the probe scheduler and the mechanisms that
+#              actually probe hosts, and the subprocess ping implementation.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+from platform import system as system_name  # Type of OS
+import heapq                                # kill deadlines
+import os                                   # posix_spawn, pidfds and reaping
+import selectors                            # epoll over child pidfds
+import shutil                               # locate the ping executable
+import signal                               # kill overdue children
+import subprocess                           # subprocesses to execute ping
+import time                                 # start times and deadlines
+
+try:
+    import resource                         # descriptor limit, POSIX only
+except ImportError:
+    resource = None
+
+# capabilities a backend may advertise
+CAP_RTT = 'rtt'                             # reports round trip times
+CAP_LATE_REPLIES = 'late_replies'           # grace period frees the slot
+CAP_IN_PROCESS = 'in_process'               # no process per probe
+CAP_ICMP = 'icmp'                           # probes with ICMP echo
+CAP_TCP = 'tcp'                             # probes with TCP connects
+
+# names accepted by create_backend
+BACKEND_NAMES = ('ping', 'icmp', 'tcp')
+
+
+class cl_probe_backend():
+    """
+    Base class of probe backends. The scheduler starts probes with
+    fn_start_probe and collects (host, alive, rtt) results from fn_poll; a
+    backend must return exactly one result per probe started, either when
+    the host answers or once its timeout (plus grace) has passed. Anything
+    platform specific is resolved once in the constructor.
+    """
+
+    CAPABILITIES = frozenset()
+
+    def fn_start_probe(self, host, timeout=None, grace=0.0):
+        """
+        Starts probing host, timeout is in seconds and None means the
+        backend's default.
+        """
+        raise NotImplementedError
+
+    def fn_poll(self, wait):
+        """
+        Waits up to wait seconds for probes to finish, returning early once
+        any has. Returns a list of (host, alive, rtt), rtt in seconds or None.
+        """
+        raise NotImplementedError
+
+    def fn_in_flight(self):
+        """
+        Returns the number of probes holding a concurrency slot.
+        """
+        raise NotImplementedError
+
+    def fn_outstanding(self):
+        """
+        Returns the number of probes whose result has not been polled yet,
+        including those in a grace period that no longer hold a slot.
+        """
+        return self.fn_in_flight()
+
+    def fn_cancel(self):
+        """
+        Abandons every outstanding probe, their results are never returned.
+        """
+        raise NotImplementedError
+
+    def fn_close(self):
+
+        self.fn_cancel()
+
+
+class cl_ping_backend(cl_probe_backend):
+    """
+    Probes each host by running the system ping command once.
+    """
+
+    CAPABILITIES = frozenset([CAP_RTT, CAP_ICMP])
+
+    def __init__(self, timeout=None):
+
+        # seconds before a ping is killed, None to leave it to the OS default
+        self.timeout = timeout
+
+        # determine parameters from OS once
+        if system_name().lower() == "windows":
+            self.argv = ['ping', '-n', '1']
+        else:
+            self.argv = ['ping', '-c', '1']
+
+        # without ping every probe would fail deep inside the scan loop
+        self.ping_path = shutil.which(self.argv[0])
+        if self.ping_path is None:
+            raise ValueError('no {} executable found on PATH'.format(self.argv[0]))
+
+        # host -> (sub_process, start time, kill deadline)
+        self.sub_process_dict = dict()
+
+    def fn_start_probe(self, host, timeout=None, grace=0.0):
+
+        if timeout is None:
+            timeout = self.timeout
+
+        # output is discarded, an unread pipe could fill up and block ping
+        sub_process = subprocess.Popen(self.argv + [host],
+                                       stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL)
+
+        # a subprocess cannot give up its slot early, so grace extends the kill
+        started = time.time()
+        deadline = None if timeout is None else started + timeout + grace
+
+        self.sub_process_dict[host] = (sub_process, started, deadline)
+
+    def fn_poll(self, wait):
+
+        results = self._fn_collect()
+
+        # sleep briefly if no ping is done yet
+        if not results and wait > 0 and self.sub_process_dict:
+            time.sleep(wait)
+            results = self._fn_collect()
+
+        return results
+
+    def fn_in_flight(self):
+
+        return len(self.sub_process_dict)
+
+    def fn_cancel(self):
+
+        # signal every child before reaping any, so they all die in parallel
+        for sub_process, started, deadline in self.sub_process_dict.values():
+            sub_process.kill()
+
+        for sub_process, started, deadline in self.sub_process_dict.values():
+            sub_process.wait()
+
+        self.sub_process_dict.clear()
+
+    def _fn_collect(self):
+
+        now = time.time()
+        done = list()
+        for host, (sub_process, started, deadline) in self.sub_process_dict.items():
+
+            # returncode is None while the ping is still running
+            if sub_process.poll() is not None:
+                done.append(host)
+
+            # kill pings that outlive the timeout, they count as no reply
+            elif deadline is not None and now > deadline:
+                sub_process.kill()
+                sub_process.wait()
+                done.append(host)
+
+        results = list()
+        for host in done:
+
+            sub_process, started, deadline = self.sub_process_dict.pop(host)
+            alive = sub_process.returncode == 0
+            results.append((host, alive, now - started if alive else None))
+
+        return results
+
+
+class cl_spawn_ping_backend(cl_ping_backend):
+    """
+    Runs the system ping like cl_ping_backend, with less overhead per host:
+    children are started with os.posix_spawn and their output goes straight
+    to /dev/null. A pidfd for every child is registered in one epoll
+    selector, so a single thread reaps thousands of children as they exit
+    instead of polling or waiting on each. Linux only, see fn_spawn_supported.
+    """
+
+    def __init__(self, timeout=None):
+
+        cl_ping_backend.__init__(self, timeout)
+
+        self.devnull = os.open(os.devnull, os.O_RDWR)
+        self.file_actions = [(os.POSIX_SPAWN_DUP2, self.devnull, 1),
+                             (os.POSIX_SPAWN_DUP2, self.devnull, 2)]
+
+        self.selector = selectors.DefaultSelector()
+
+        # pid -> (host, pidfd, start time, kill deadline)
+        self.children = dict()
+
+        # heap of (kill deadline, pid)
+        self.deadlines = list()
+
+    def fn_start_probe(self, host, timeout=None, grace=0.0):
+
+        if timeout is None:
+            timeout = self.timeout
+
+        pid = os.posix_spawn(self.ping_path, self.argv + [host], os.environ,
+                             file_actions=self.file_actions)
+
+        # until registered nothing would ever reap the child, so a failure
+        # here, such as running out of descriptors, must not leak it
+        pidfd = None
+        try:
+            pidfd = os.pidfd_open(pid)
+            self.selector.register(pidfd, selectors.EVENT_READ, pid)
+        except BaseException:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            if pidfd is not None:
+                os.close(pidfd)
+            raise
+
+        started = time.time()
+        deadline = None if timeout is None else started + timeout + grace
+
+        self.children[pid] = (host, pidfd, started, deadline)
+        if deadline is not None:
+            heapq.heappush(self.deadlines, (deadline, pid))
+
+    def fn_poll(self, wait):
+
+        results = list()
+        if not self.children:
+            return results
+
+        # never sleep past the earliest kill deadline
+        if self.deadlines:
+            wait = max(0, min(wait, self.deadlines[0][0] - time.time()))
+
+        # a pidfd becomes readable once its child has exited
+        for key, mask in self.selector.select(wait):
+            self._fn_reap(key.data, results)
+
+        # kill children that outlive their timeout, they count as no reply
+        now = time.time()
+        while self.deadlines and self.deadlines[0][0] <= now:
+
+            # skip children already reaped, or a reused pid with a new deadline
+            deadline, pid = heapq.heappop(self.deadlines)
+            child = self.children.get(pid)
+            if child is not None and child[3] == deadline:
+                signal.pidfd_send_signal(child[1], signal.SIGKILL)
+                self._fn_reap(pid, results)
+
+        return results
+
+    def fn_in_flight(self):
+
+        return len(self.children)
+
+    def fn_cancel(self):
+
+        for host, pidfd, started, deadline in self.children.values():
+            signal.pidfd_send_signal(pidfd, signal.SIGKILL)
+
+        for pid in list(self.children):
+            self._fn_reap(pid, list())
+
+        del self.deadlines[:]
+
+    def fn_close(self):
+
+        self.fn_cancel()
+        self.selector.close()
+        os.close(self.devnull)
+
+    def _fn_reap(self, pid, results):
+
+        host, pidfd, started, deadline = self.children.pop(pid)
+        self.selector.unregister(pidfd)
+        os.close(pidfd)
+
+        # returns at once for an exited child, killed ones exit immediately
+        status = os.waitpid(pid, 0)[1]
+        alive = os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+        results.append((host, alive, time.time() - started if alive else None))
+
+
+def fn_spawn_supported():
+    """
+    Returns True if this OS can run cl_spawn_ping_backend.
+    """
+    if not (hasattr(os, 'posix_spawn') and hasattr(os, 'pidfd_open')
+            and hasattr(signal, 'pidfd_send_signal')):
+        return False
+
+    # the calls exist but the kernel may still lack pidfd support
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except OSError:
+        return False
+
+    return True
+
+
+def fn_fd_limit():
+    """
+    Returns the soft limit on open descriptors of this process, None if it
+    is unlimited or cannot be read. Every probe in flight holds at least
+    one descriptor: a pidfd, a socket or a pipe to a child.
+    """
+    if resource is None:
+        return None
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return None
+
+    return soft
+
+
+def fn_raise_fd_limit():
+    """
+    Raises the soft limit on open descriptors to the hard limit, for scans
+    that keep more probes in flight than the soft limit allows. Returns the
+    limit now in force, as fn_fd_limit.
+    """
+    if resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != hard:
+            try:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            except (ValueError, OSError):
+                pass
+
+    return fn_fd_limit()
+
+
+def create_backend(name, timeout=None, ports=None):
+    """
+    Creates the backend registered under name, one of BACKEND_NAMES. ports
+    only applies to backends probing with TCP. 'ping' uses the posix_spawn
+    launcher where the OS supports it. Raises ValueError if the backend
+    cannot run here, e.g. without a ping executable, or was given options
+    it cannot honour.
+    """
+    if name == 'ping':
+        backend_class = cl_spawn_ping_backend if fn_spawn_supported() else cl_ping_backend
+
+    elif name == 'icmp':
+        import icmp_engine
+        backend_class = icmp_engine.cl_icmp_engine
+
+    elif name == 'tcp':
+        import tcp_engine
+        backend_class = tcp_engine.cl_tcp_engine
+
+    else:
+        raise ValueError('unknown probe backend: {}'.format(name))
+
+    # an option silently ignored would make the scan mean something else
+    if ports and CAP_TCP not in backend_class.CAPABILITIES:
+        raise ValueError('ports only apply to the tcp backend, not {}'.format(name))
+
+    if name == 'icmp':
+        return backend_class(timeout or backend_class._DEFAULT_TIMEOUT)
+
+    elif name == 'tcp':
+        return backend_class(ports or backend_class._DEFAULT_PORTS,
+                             timeout or backend_class._DEFAULT_TIMEOUT)
+
+    return backend_class(timeout)
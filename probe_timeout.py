@@ -0,0 +1,110 @@
+#-------------------------------------------------------------------------------
+# Name:        Probe Timeout
+# Purpose:     Adaptive per-probe timeouts driven by the round trip times
+#              observed so far in each subnet.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+from array import array                     # RTT sample rings
+from collections import OrderedDict         # least recently used subnets
+from ip_targets import ip_to_int            # subnet of a host
+
+
+class cl_rtt_window():
+
+    def __init__(self, size):
+
+        # ring buffer of the most recent samples
+        self.samples = array('f')
+        self.size = size
+        self.next = 0
+
+        # cached percentile, None when samples changed since it was computed
+        self.cached = None
+
+    def fn_add(self, rtt):
+
+        if len(self.samples) < self.size:
+            self.samples.append(rtt)
+        else:
+            self.samples[self.next] = rtt
+            self.next = (self.next + 1) % self.size
+
+        self.cached = None
+
+    def fn_percentile(self, percentile):
+
+        if self.cached is None:
+            ordered = sorted(self.samples)
+            self.cached = ordered[int(round(percentile * (len(ordered) - 1)))]
+
+        return self.cached
+
+
+class cl_adaptive_timeout():
+    """
+    Tracks the RTTs of replies per subnet and derives each probe's timeout
+    as the chosen percentile times a multiplier, clamped to [floor, ceiling].
+    Subnets with too few replies fall back to the scan wide distribution,
+    and to the initial timeout before any reply has been seen.
+    """
+
+    def __init__(self,
+                 initial=1.0,
+                 floor=0.05,
+                 ceiling=5.0,
+                 multiplier=3.0,
+                 percentile=0.99,
+                 window=64,
+                 min_samples=8,
+                 subnet_bits=24,
+                 max_subnets=4096):
+
+        self.initial = initial
+        self.floor = floor
+        self.ceiling = ceiling
+        self.multiplier = multiplier
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.max_subnets = max_subnets
+        self._shift = 32 - subnet_bits
+
+        # scan wide RTT samples, and per subnet samples in LRU order
+        self.overall = cl_rtt_window(window)
+        self.subnets = OrderedDict()
+
+    def fn_timeout(self, host):
+        """
+        Returns the timeout in seconds to use for a probe of host.
+        """
+        samples = self.subnets.get(ip_to_int(host) >> self._shift)
+        if samples is None or len(samples.samples) < self.min_samples:
+            samples = self.overall
+
+        if len(samples.samples) < self.min_samples:
+            return self.initial
+
+        timeout = samples.fn_percentile(self.percentile) * self.multiplier
+        return min(self.ceiling, max(self.floor, timeout))
+
+    def fn_observe(self, host, rtt):
+        """
+        Records the RTT, in seconds, of a reply from host.
+        """
+        subnet = ip_to_int(host) >> self._shift
+
+        samples = self.subnets.pop(subnet, None)
+        if samples is None:
+            samples = cl_rtt_window(self.window)
+            if len(self.subnets) >= self.max_subnets:
+                self.subnets.popitem(last=False)
+
+        self.subnets[subnet] = samples
+        samples.fn_add(rtt)
+        self.overall.fn_add(rtt)
@@ -0,0 +1,139 @@
+#-------------------------------------------------------------------------------
+# Name:        Rate Limit
+# Purpose:     Token buckets capping the packet rate of probe emission,
+#              globally and per /24.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+from collections import OrderedDict         # /24 buckets by last use
+import time                                 # refill buckets from elapsed time
+from ip_targets import cl_target_set        # targets ordered /24 by /24
+from ip_targets import ip_to_int            # subnet of a host
+
+
+class cl_token_bucket():
+
+    def __init__(self, rate, burst=None):
+
+        # tokens per second, and the most that can accumulate while idle
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else max(1.0, self.rate / 10)
+
+        self.tokens = self.burst
+        self.stamp = time.time()
+
+    def fn_refill(self, now):
+
+        # a now read before the bucket was created must not take tokens away
+        if now > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def fn_reserve(self, now):
+        """
+        Takes one token, going into debt if none is left. Returns the number
+        of seconds until the token taken is actually available.
+        """
+        self.fn_refill(now)
+        self.tokens -= 1
+
+        return max(0.0, -self.tokens / self.rate)
+
+
+class cl_rate_limiter():
+    """
+    Caps probe emission at a global packets-per-second rate and, optionally,
+    a separate rate per /24. A host whose /24 is over its cap gets a token
+    reserved in the future and is handed back to the caller as a delay.
+    Callers only defer so many hosts, so with a /24 cap targets should be
+    probed in the order of fn_order, which takes the /24s in turn; in
+    address order the scan could go no faster than the few /24s whose hosts
+    fill the deferred set.
+    """
+
+    # /24 buckets kept before idle ones are pruned
+    _MAX_SUBNETS = 4096
+
+    def __init__(self, rate=None, subnet_rate=None, burst=None):
+
+        self.rate = rate
+        self.subnet_rate = subnet_rate
+
+        self.bucket = cl_token_bucket(rate, burst) if rate else None
+
+        # /24 -> bucket, least recently used first, and hosts that already
+        # hold a reserved /24 token
+        self.subnet_buckets = OrderedDict()
+        self.reserved = set()
+
+    def fn_ready(self):
+        """
+        Returns True if the global cap allows another probe right now.
+        """
+        if self.bucket is None:
+            return True
+
+        self.bucket.fn_refill(time.time())
+        return self.bucket.tokens >= 1
+
+    def fn_order(self, targets):
+        """
+        Returns targets, a cl_target_set or anything with fn_to_target_set,
+        in the order to probe them in: unchanged without a /24 cap, else as
+        an iterator taking the /24s in turn.
+        """
+        if not self.subnet_rate:
+            return targets
+
+        if not isinstance(targets, cl_target_set):
+            targets = targets.fn_to_target_set()
+
+        return targets.fn_interleaved()
+
+    def fn_acquire(self, host):
+        """
+        Accounts for a probe of host. Returns 0 if it may be sent now, or the
+        number of seconds to defer it by to respect the /24 cap, in which
+        case fn_acquire must be called again for the host once that is up.
+        """
+        now = time.time()
+
+        if self.subnet_rate and host not in self.reserved:
+            delay = self._fn_subnet_bucket(host, now).fn_reserve(now)
+            if delay > 0:
+                self.reserved.add(host)
+                return delay
+
+        self.reserved.discard(host)
+        if self.bucket is not None:
+            self.bucket.fn_reserve(now)
+
+        return 0.0
+
+    def _fn_subnet_bucket(self, host, now):
+
+        subnet = ip_to_int(host) >> 8
+        bucket = self.subnet_buckets.get(subnet)
+
+        if bucket is not None:
+            self.subnet_buckets.move_to_end(subnet)
+            return bucket
+
+        # forget the least recently used /24s while their buckets have
+        # refilled completely, the first one that has not ends the sweep
+        while len(self.subnet_buckets) >= self._MAX_SUBNETS:
+            idle = next(iter(self.subnet_buckets.values()))
+            idle.fn_refill(now)
+            if idle.tokens < idle.burst:
+                break
+            self.subnet_buckets.popitem(last=False)
+
+        bucket = cl_token_bucket(self.subnet_rate)
+        self.subnet_buckets[subnet] = bucket
+
+        return bucket
@@ -0,0 +1,216 @@
+#-------------------------------------------------------------------------------
+# Name:        Result Channel
+# Purpose:     Bounded queue of scan results between the scan thread and a
+#              slower consumer such as the GUI, a file writer or a socket.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+from collections import deque               # results held in memory
+import struct                               # packed spilled records
+import tempfile                             # spill file
+import threading                            # producer and consumer threads
+import time                                 # time producers spent blocked
+
+import ip_scanner
+import ip_targets
+
+# what fn_put does once capacity results are queued: wait for the consumer,
+# keep only the counts of further results, or queue them in a file on disk
+POLICY_BLOCK = 'block'
+POLICY_DROP = 'drop'
+POLICY_SPILL = 'spill'
+POLICIES = (POLICY_BLOCK, POLICY_DROP, POLICY_SPILL)
+
+# address, alive, attempts, rtt in seconds or -1
+_RECORD = struct.Struct('<IBBf')
+
+
+class cl_result_channel():
+    """
+    Carries cl_scan_result records from the scan thread to a consumer that
+    takes them in batches. At most capacity results are held in memory;
+    beyond that POLICY_BLOCK holds the scan thread, and with it new probes,
+    until the consumer catches up, POLICY_DROP counts results without
+    keeping them, and POLICY_SPILL appends them to a temporary file that is
+    read back once the memory queue is empty, so order is kept. fn_put can
+    be used directly as the scanner's progress callback.
+    """
+
+    _CAPACITY = 65536
+
+    # spilled records read back per file read
+    _SPILL_READ = 4096
+
+    def __init__(self, capacity=_CAPACITY, policy=POLICY_BLOCK, spill_dir=None):
+
+        if policy not in POLICIES:
+            raise ValueError('unknown backpressure policy: {}'.format(policy))
+        if capacity < 1:
+            raise ValueError('channel capacity must be at least 1: {}'.format(capacity))
+
+        self.capacity = capacity
+        self.policy = policy
+        self.spill_dir = spill_dir
+
+        self.lock = threading.Condition()
+        self.queue = deque()
+
+        # spill file, and the offsets the next record is written and read at
+        self.spill = None
+        self.spill_write = 0
+        self.spill_read = 0
+
+        # every result put, and those without detail under POLICY_DROP
+        self.total = 0
+        self.alive = 0
+        self.dropped = 0
+        self.spilled = 0
+
+        # seconds the scan thread spent waiting on a full channel, and the
+        # most results ever queued in memory
+        self.blocked_seconds = 0.0
+        self.high_water = 0
+
+        # set by fn_close when no more results will come, by fn_cancel when
+        # the remaining ones are no longer wanted
+        self._closed = False
+        self._cancelled = False
+
+    def fn_put(self, result):
+
+        with self.lock:
+            if self._cancelled:
+                return
+
+            self.total += 1
+            if result.alive:
+                self.alive += 1
+
+            if len(self.queue) >= self.capacity or self.spill_write > self.spill_read:
+
+                if self.policy == POLICY_DROP:
+                    self.dropped += 1
+                    return
+
+                if self.policy == POLICY_SPILL:
+                    self._fn_spill(result)
+                    self.lock.notify_all()
+                    return
+
+                # hold the scan thread until the consumer makes room
+                started = time.time()
+                while len(self.queue) >= self.capacity and not self._cancelled:
+                    self.lock.wait()
+                self.blocked_seconds += time.time() - started
+                if self._cancelled:
+                    return
+
+            self.queue.append(result)
+            if len(self.queue) > self.high_water:
+                self.high_water = len(self.queue)
+            self.lock.notify_all()
+
+    def fn_get_batch(self, max_results, timeout=None):
+        """
+        Returns up to max_results results in the order they were put,
+        waiting up to timeout seconds, or without limit if None, for the
+        first. Returns an empty list on timeout or once drained.
+        """
+        with self.lock:
+            if not self.queue and self.spill_read == self.spill_write and not self._closed:
+                self.lock.wait(timeout)
+
+            if not self.queue and self.spill_read < self.spill_write:
+                self._fn_unspill()
+
+            count = min(max_results, len(self.queue))
+            batch = [self.queue.popleft() for _ in range(count)]
+
+            # producers waiting for room can carry on
+            if count:
+                self.lock.notify_all()
+
+            return batch
+
+    def fn_close(self):
+        """
+        Marks the end of the results; consumers still get what is queued.
+        """
+        with self.lock:
+            self._closed = True
+            self.lock.notify_all()
+
+    def fn_cancel(self):
+        """
+        Drops every queued result and releases a blocked scan thread, for
+        scans being stopped. Later results are ignored.
+        """
+        with self.lock:
+            self._cancelled = True
+            self._closed = True
+            self.queue.clear()
+            self._fn_close_spill()
+            self.lock.notify_all()
+
+    def fn_is_drained(self):
+        """
+        Returns True once the channel is closed and every result was taken.
+        """
+        with self.lock:
+            return self._closed and not self.queue and self.spill_read == self.spill_write
+
+    def fn_stats(self):
+
+        with self.lock:
+            return {'total': self.total,
+                    'alive': self.alive,
+                    'queued': len(self.queue),
+                    'spilled': self.spilled,
+                    'on_disk': (self.spill_write - self.spill_read) // _RECORD.size,
+                    'dropped': self.dropped,
+                    'high_water': self.high_water,
+                    'blocked_seconds': self.blocked_seconds}
+
+    def _fn_spill(self, result):
+
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile(prefix='ip_scanner_results_', dir=self.spill_dir)
+
+        rtt = -1.0 if result.rtt is None else result.rtt
+        self.spill.seek(self.spill_write)
+        self.spill.write(_RECORD.pack(ip_targets.ip_to_int(result.ip),
+                                      int(result.alive),
+                                      min(255, result.attempts),
+                                      rtt))
+        self.spill_write += _RECORD.size
+        self.spilled += 1
+
+    def _fn_unspill(self):
+
+        self.spill.seek(self.spill_read)
+        records = min(self._SPILL_READ, self.capacity)
+        data = self.spill.read(min(self.spill_write - self.spill_read, records * _RECORD.size))
+        self.spill_read += len(data)
+
+        for ip, alive, attempts, rtt in _RECORD.iter_unpack(data):
+            self.queue.append(ip_scanner.cl_scan_result(ip_targets.int_to_ip(ip),
+                                                        bool(alive),
+                                                        None if rtt < 0 else rtt,
+                                                        attempts))
+
+        # start the file over once everything spilled was read back
+        if self.spill_read == self.spill_write:
+            self.spill.truncate(0)
+            self.spill_read = self.spill_write = 0
+
+    def _fn_close_spill(self):
+
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+        self.spill_read = self.spill_write = 0
@@ -0,0 +1,375 @@
+#-------------------------------------------------------------------------------
+# Name:        Result Store
+# Purpose:     Compact, array backed storage of scan results that views such
+#              as the GUI's virtual results table can filter and sort, and a
+#              cache of recent results that lets rescans skip known hosts.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+from array import array                     # compact per-result columns
+from ip_targets import ip_to_int, int_to_ip # store addresses as integers
+import os                                   # atomic cache snapshots
+import struct                               # cache snapshot header
+import sys                                  # snapshot byte order
+import time                                 # cache entry ages
+
+# values of the status column
+STATUS_DEAD = 0
+STATUS_ALIVE = 1
+
+# rtt column value for results without a round trip time
+_NO_RTT = -1.0
+
+
+class cl_result_store():
+    """
+    Holds every result of a scan as a uint32 address, a status byte and a
+    float32 RTT in milliseconds, about 9 bytes per host. A view of row
+    numbers on top of the columns provides filtering and sorting without
+    copying any results.
+    """
+
+    # sort keys accepted by fn_set_sort
+    SORT_KEYS = ('ip', 'alive', 'rtt')
+
+    def __init__(self):
+
+        self.addrs = array('I')
+        self.status = bytearray()
+        self.rtts = array('f')
+
+        # row numbers of the results currently visible, in display order
+        self.view = array('I')
+
+        self.alive_only = False
+        self.sort_key = None
+        self.sort_reverse = False
+
+        # set when new rows must be merged into a sorted view
+        self._view_dirty = False
+
+    def __len__(self):
+
+        return len(self.addrs)
+
+    def fn_clear(self):
+
+        del self.addrs[:]
+        del self.status[:]
+        del self.rtts[:]
+        del self.view[:]
+        self._view_dirty = False
+
+    def fn_append(self, result):
+        """
+        Stores one cl_scan_result, or any (ip, alive[, rtt]) sequence.
+        """
+        alive = bool(result[1])
+        rtt = result[2] if len(result) > 2 else None
+        row = len(self.addrs)
+
+        self.addrs.append(ip_to_int(result[0]))
+        self.status.append(STATUS_ALIVE if alive else STATUS_DEAD)
+        self.rtts.append(_NO_RTT if rtt is None else rtt * 1000.0)
+
+        if self.alive_only and not alive:
+            return
+
+        # unsorted views take new rows in arrival order
+        if self.sort_key is None:
+            self.view.append(row)
+        else:
+            self._view_dirty = True
+
+    def fn_refresh(self):
+        """
+        Re-sorts the view if rows arrived since the last call. Returns the
+        number of visible rows.
+        """
+        if self._view_dirty:
+            self._fn_rebuild_view()
+
+        return len(self.view)
+
+    def fn_set_filter(self, alive_only):
+
+        self.alive_only = alive_only
+        self._fn_rebuild_view()
+
+    def fn_set_sort(self, key, reverse=False):
+        """
+        Orders the view by one of SORT_KEYS, or by arrival order if key is None.
+        """
+        if key is not None and key not in self.SORT_KEYS:
+            raise ValueError('unknown sort key: {}'.format(key))
+
+        self.sort_key = key
+        self.sort_reverse = reverse
+        self._fn_rebuild_view()
+
+    def fn_row(self, index):
+        """
+        Returns (ip, alive, rtt in ms or None) for the index-th visible row.
+        """
+        row = self.view[index]
+        rtt = self.rtts[row]
+
+        return (int_to_ip(self.addrs[row]),
+                self.status[row] == STATUS_ALIVE,
+                None if rtt < 0 else rtt)
+
+    def fn_is_alive(self, index):
+
+        return self.status[self.view[index]] == STATUS_ALIVE
+
+    def fn_alive_count(self):
+
+        return self.status.count(STATUS_ALIVE)
+
+    def _fn_rebuild_view(self):
+
+        rows = range(len(self.addrs))
+        if self.alive_only:
+            status = self.status
+            rows = [row for row in rows if status[row] == STATUS_ALIVE]
+
+        if self.sort_key is not None:
+            column = {'ip': self.addrs, 'alive': self.status, 'rtt': self.rtts}[self.sort_key]
+            rows = sorted(rows, key=column.__getitem__, reverse=self.sort_reverse)
+
+        self.view = array('I', rows)
+        self._view_dirty = False
+
+
+class cl_result_cache():
+    """
+    Remembers the latest result of each address for ttl seconds. Entries live
+    in an open addressing hash table made of parallel columns: a uint32
+    address, a status byte, a float32 RTT in milliseconds and a float64
+    timestamp, 19 bytes per slot with the table kept at most half full. Once
+    max_entries addresses are held, a clock sweep evicts expired entries and
+    entries not looked up since the hand last passed, an approximation of
+    least recently used. The cache can be saved to and loaded from a file
+    so rescans from separate runs share it.
+    """
+
+    _SNAPSHOT_MAGIC = b'IPSCACHE1'
+
+    # table slots allocated up front, doubled as entries are added
+    _MIN_SLOTS = 1024
+
+    def __init__(self, ttl=300.0, max_entries=1 << 20):
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._fn_allocate(self._MIN_SLOTS)
+
+    def __len__(self):
+
+        return self.count
+
+    def fn_clear(self):
+
+        self._fn_allocate(self._MIN_SLOTS)
+
+    def fn_lookup(self, ip, now=None):
+        """
+        Returns (alive, rtt in seconds or None) for a result of ip younger
+        than ttl, or None if there is none.
+        """
+        if now is None:
+            now = time.time()
+
+        slot = self._fn_find(ip_to_int(ip))
+        if slot < 0:
+            return None
+
+        if now - self.stamps[slot] >= self.ttl:
+            self._fn_remove(slot)
+            return None
+
+        self.referenced[slot] = 1
+        rtt = self.rtts[slot]
+
+        return self.status[slot] == STATUS_ALIVE, None if rtt < 0 else rtt / 1000.0
+
+    def fn_store(self, result, now=None):
+        """
+        Records one cl_scan_result, or any (ip, alive[, rtt]) sequence,
+        replacing an earlier result of the same address.
+        """
+        if now is None:
+            now = time.time()
+
+        rtt = result[2] if len(result) > 2 else None
+        self._fn_put(ip_to_int(result[0]),
+                     STATUS_ALIVE if result[1] else STATUS_DEAD,
+                     _NO_RTT if rtt is None else rtt * 1000.0,
+                     now)
+
+    def fn_save(self, path):
+        """
+        Writes every fresh entry to path, replacing the file atomically.
+        """
+        now = time.time()
+        slots = [slot for slot in range(len(self.used))
+                 if self.used[slot] and now - self.stamps[slot] < self.ttl]
+
+        addrs = array('I', [self.addrs[slot] for slot in slots])
+        status = bytearray(self.status[slot] for slot in slots)
+        rtts = array('f', [self.rtts[slot] for slot in slots])
+        stamps = array('d', [self.stamps[slot] for slot in slots])
+
+        # columns are written little endian whatever the platform
+        if sys.byteorder == 'big':
+            for column in (addrs, rtts, stamps):
+                column.byteswap()
+
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as snapshot:
+            snapshot.write(self._SNAPSHOT_MAGIC)
+            snapshot.write(struct.pack('<Q', len(slots)))
+            for column in (addrs, status, rtts, stamps):
+                snapshot.write(column if isinstance(column, bytearray) else column.tobytes())
+
+        os.replace(temp_path, path)
+
+    def fn_load(self, path):
+        """
+        Adds the entries saved in path that are still fresh. Returns the
+        number of entries added. Raises ValueError for files that are not
+        cache snapshots.
+        """
+        with open(path, 'rb') as snapshot:
+            if snapshot.read(len(self._SNAPSHOT_MAGIC)) != self._SNAPSHOT_MAGIC:
+                raise ValueError('{} is not a result cache snapshot'.format(path))
+
+            count = struct.unpack('<Q', snapshot.read(8))[0]
+            addrs, rtts, stamps = array('I'), array('f'), array('d')
+            addrs.frombytes(snapshot.read(count * addrs.itemsize))
+            status = bytearray(snapshot.read(count))
+            rtts.frombytes(snapshot.read(count * rtts.itemsize))
+            stamps.frombytes(snapshot.read(count * stamps.itemsize))
+
+        if min(len(addrs), len(status), len(rtts), len(stamps)) != count:
+            raise ValueError('{} is truncated'.format(path))
+
+        if sys.byteorder == 'big':
+            for column in (addrs, rtts, stamps):
+                column.byteswap()
+
+        now = time.time()
+        added = 0
+        for i in range(count):
+            if now - stamps[i] < self.ttl:
+                self._fn_put(addrs[i], status[i], rtts[i], stamps[i])
+                added += 1
+
+        return added
+
+    def _fn_allocate(self, slots):
+
+        self.mask = slots - 1
+        self.shift = 32 - (slots.bit_length() - 1)
+        self.count = 0
+        self.hand = 0
+
+        self.used = bytearray(slots)
+        self.referenced = bytearray(slots)
+        self.addrs = array('I', bytes(4 * slots))
+        self.status = bytearray(slots)
+        self.rtts = array('f', bytes(4 * slots))
+        self.stamps = array('d', bytes(8 * slots))
+
+    def _fn_home(self, addr):
+
+        # Fibonacci hashing spreads consecutive addresses over the table
+        return ((addr * 2654435769) & 0xffffffff) >> self.shift
+
+    def _fn_find(self, addr):
+
+        slot = self._fn_home(addr)
+        while self.used[slot]:
+            if self.addrs[slot] == addr:
+                return slot
+            slot = (slot + 1) & self.mask
+
+        return -1
+
+    def _fn_put(self, addr, status, rtt, stamp):
+
+        slot = self._fn_find(addr)
+        if slot < 0:
+
+            if self.count >= self.max_entries:
+                self._fn_evict(stamp)
+
+            # keep the table at most half full
+            elif 2 * (self.count + 1) > len(self.used):
+                self._fn_grow()
+
+            slot = self._fn_home(addr)
+            while self.used[slot]:
+                slot = (slot + 1) & self.mask
+
+            self.used[slot] = 1
+            self.addrs[slot] = addr
+            self.count += 1
+
+        self.status[slot] = status
+        self.rtts[slot] = rtt
+        self.stamps[slot] = stamp
+        self.referenced[slot] = 1
+
+    def _fn_grow(self):
+
+        old = (self.used, self.addrs, self.status, self.rtts, self.stamps)
+        self._fn_allocate(2 * len(self.used))
+
+        used, addrs, status, rtts, stamps = old
+        for slot in range(len(used)):
+            if used[slot]:
+                self._fn_put(addrs[slot], status[slot], rtts[slot], stamps[slot])
+
+    def _fn_evict(self, now):
+
+        # two turns at most, the first clears every referenced bit
+        while True:
+            slot = self.hand
+            self.hand = (self.hand + 1) & self.mask
+
+            if not self.used[slot]:
+                continue
+
+            if self.referenced[slot] and now - self.stamps[slot] < self.ttl:
+                self.referenced[slot] = 0
+                continue
+
+            self._fn_remove(slot)
+            return
+
+    def _fn_remove(self, slot):
+
+        # backward shift deletion, entries after the hole that would no
+        # longer be found from their home slot move into it
+        mask = self.mask
+        hole = slot
+        slot = (slot + 1) & mask
+
+        while self.used[slot]:
+            home = self._fn_home(self.addrs[slot])
+            if (slot - home) & mask >= (slot - hole) & mask:
+                for column in (self.referenced, self.addrs, self.status, self.rtts, self.stamps):
+                    column[hole] = column[slot]
+                hole = slot
+            slot = (slot + 1) & mask
+
+        self.used[hole] = 0
+        self.referenced[hole] = 0
+        self.count -= 1
@@ -0,0 +1,677 @@
+#-------------------------------------------------------------------------------
+# Name:        Scan Cluster
+# Purpose:     Spreads one scan over several worker nodes. A coordinator cuts
+#              the targets into shards and streams them to workers over TCP,
+#              workers probe them with cl_ip_scanner and stream results back.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#
+# Protocol: one JSON object per line in each direction, with a 'type' of
+#
+#   worker -> coordinator
+#     hello      {name}                     first message after connecting
+#     results    {shard, records}           records of [ip, alive, rtt, attempts],
+#                                           ip as an integer, rtt in seconds or null
+#     done       {shard}                    every host of the shard was reported
+#     heartbeat  {}                         sent when otherwise idle
+#
+#   coordinator -> worker
+#     shard      {shard, intervals}         inclusive integer address intervals
+#     cancel     {shard}                    finished elsewhere, drop it
+#     stop       {}                         the scan is over
+#
+# A shard may be handed to a second worker when the first is slow, and is
+# handed out again when its worker dies; the coordinator keeps a bitmap per
+# shard so each host is reported exactly once either way.
+
+import collections                          # shards waiting for a worker
+import json                                 # line protocol
+import queue                                # shards handed to the worker's scan loop
+import selectors                            # coordinator multiplexes every worker
+import socket                               # worker connections
+import threading                            # worker side reader and sender
+import time                                 # heartbeats and dead workers
+
+import ip_scanner
+import ip_targets
+
+
+def fn_parse_address(text, default_host=''):
+    """
+    Splits 'host:port' or ':port' into a (host, port) tuple.
+    """
+    host, sep, port = text.rpartition(':')
+    if not sep:
+        raise ValueError('expected host:port, got {!r}'.format(text))
+
+    return host or default_host, int(port)
+
+
+def _fn_encode(message):
+
+    return json.dumps(message, separators=(',', ':')).encode('ascii') + b'\n'
+
+
+class cl_line_reader():
+    """
+    Splits the byte stream of a socket into decoded JSON messages.
+    """
+
+    def __init__(self):
+
+        self.buffer = bytearray()
+
+    def fn_feed(self, data):
+
+        self.buffer += data
+
+        messages = list()
+        while True:
+            end = self.buffer.find(b'\n')
+            if end < 0:
+                return messages
+
+            line = bytes(self.buffer[:end])
+            del self.buffer[:end + 1]
+            if line.strip():
+                messages.append(json.loads(line.decode('ascii')))
+
+
+class cl_shard():
+
+    def __init__(self, shard_id, start, stop):
+
+        self.shard_id = shard_id
+
+        # positions [start, stop) of the coordinator's target set
+        self.start = start
+        self.stop = stop
+
+        # the shard's own targets, and one bit per host already reported,
+        # both only kept while the shard is being scanned
+        self.targets = None
+        self.reported = None
+        self.remaining = stop - start
+
+        # workers currently scanning the shard, and when it was first handed out
+        self.owners = set()
+        self.assigned_at = None
+        self.finished = False
+
+
+class cl_worker_link():
+
+    def __init__(self, sock, address):
+
+        self.sock = sock
+        self.address = address
+        self.name = '{}:{}'.format(*address[:2])
+        self.reader = cl_line_reader()
+
+        # shards sent to this worker and not yet done or cancelled, in order
+        self.shards = list()
+        self.last_seen = time.time()
+
+        # bytes not yet taken by the socket, and since when they have waited
+        self.output = bytearray()
+        self.output_since = None
+
+
+class cl_scan_coordinator():
+    """
+    Serves a scan to any number of workers. Every connected worker is kept
+    busy with up to _SHARDS_AHEAD shards; once no shard is left unassigned,
+    idle workers get a second copy of the shard with the most hosts still
+    unreported, so a slow worker cannot hold up the end of the scan. Shards
+    of workers that disconnect or go silent for dead_after seconds are
+    handed out again. Results are passed to fn_update_scan_progress_cb as
+    ip_scanner.cl_scan_result records, each host exactly once.
+    """
+
+    # hosts per shard
+    _SHARD_SIZE = 65536
+
+    # shards queued on each worker so it never waits for the coordinator
+    _SHARDS_AHEAD = 2
+
+    # seconds of silence after which a worker counts as dead
+    _DEAD_AFTER = 10.0
+
+    # seconds a shard runs before an idle worker may duplicate it
+    _SPECULATE_AFTER = 5.0
+
+    # most bytes buffered for a worker that does not read them
+    _MAX_OUTPUT = 1 << 20
+
+    _POLL_INTERVAL = 0.5
+
+    def __init__(self,
+                 targets,
+                 fn_update_scan_progress_cb,
+                 address=('', 0),
+                 shard_size=_SHARD_SIZE,
+                 dead_after=_DEAD_AFTER,
+                 speculate_after=_SPECULATE_AFTER,
+                 fn_log_cb=None):
+
+        self.targets = targets
+        self._fn_update_scan_progress = fn_update_scan_progress_cb
+        self._fn_log = fn_log_cb
+        self.dead_after = dead_after
+        self.speculate_after = speculate_after
+
+        self.shards = [cl_shard(shard_id, start, min(start + shard_size, len(targets)))
+                       for shard_id, start in enumerate(range(0, len(targets), shard_size))]
+        self.pending = collections.deque(self.shards)
+        self.unfinished = len(self.shards)
+
+        # bound here so the address, with its port if 0 was asked for, is known
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen(64)
+        self.listener.setblocking(False)
+        self.address = self.listener.getsockname()
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        self.links = list()
+
+        # hosts reported, and when the scan ran, for the rate report
+        self.reported = 0
+        self.started = None
+        self.finished = None
+
+        # set to false to stop the scan
+        self._running = True
+
+    def fn_run(self):
+
+        self.started = time.time()
+
+        try:
+            while self._running and self.unfinished:
+
+                self._fn_assign()
+
+                for key, mask in self.selector.select(self._POLL_INTERVAL):
+                    if key.data is None:
+                        self._fn_accept()
+                        continue
+
+                    # a link dropped earlier in this pass has nothing to do
+                    if mask & selectors.EVENT_WRITE and key.data in self.links:
+                        self._fn_write(key.data)
+                    if mask & selectors.EVENT_READ and key.data in self.links:
+                        self._fn_read(key.data)
+
+                # workers that went silent, or stopped reading, lose their shards
+                now = time.time()
+                for link in list(self.links):
+                    if now - link.last_seen > self.dead_after:
+                        self._fn_drop(link, 'timed out')
+                    elif link.output_since is not None and now - link.output_since > self.dead_after:
+                        self._fn_drop(link, 'stopped reading')
+        finally:
+            for link in list(self.links):
+                if self._fn_send(link, {'type': 'stop'}):
+                    self._fn_finish_output(link)
+                self._fn_drop(link, None)
+
+            self.selector.close()
+            self.listener.close()
+            self.finished = time.time()
+
+    def fn_stop(self):
+
+        self._running = False
+
+    def fn_rate_report(self):
+        """
+        Returns hosts reported per second, and None as no rate is targeted.
+        """
+        end = self.finished or time.time()
+        if self.started is None or end == self.started:
+            return 0.0, None
+
+        return self.reported / (end - self.started), None
+
+    def _fn_accept(self):
+
+        try:
+            sock, address = self.listener.accept()
+        except BlockingIOError:
+            return
+
+        # never blocking, so one stalled worker cannot hold up the others
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        link = cl_worker_link(sock, address)
+        self.links.append(link)
+        self.selector.register(sock, selectors.EVENT_READ, link)
+
+    def _fn_read(self, link):
+
+        try:
+            data = link.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+
+        if not data:
+            self._fn_drop(link, 'disconnected')
+            return
+
+        link.last_seen = time.time()
+
+        try:
+            messages = link.reader.fn_feed(data)
+        except ValueError:
+            self._fn_drop(link, 'sent a malformed message')
+            return
+
+        for message in messages:
+
+            try:
+                self._fn_handle(link, message)
+            except (AttributeError, KeyError, TypeError, ValueError):
+                self._fn_drop(link, 'sent a malformed message')
+                return
+
+            # a failed send while handling the message may have dropped it
+            if link not in self.links:
+                return
+
+    def _fn_handle(self, link, message):
+
+        kind = message.get('type')
+        if kind == 'hello':
+            link.name = message.get('name') or link.name
+            self._fn_log_event('worker {} joined'.format(link.name))
+
+        elif kind == 'results':
+            self._fn_merge(self._fn_shard(link, message), message['records'])
+
+        elif kind == 'done':
+            self._fn_done(link, self._fn_shard(link, message))
+
+    def _fn_shard(self, link, message):
+        """
+        Returns the shard a worker message refers to. Raises ValueError for
+        one that does not exist or was never given to the worker.
+        """
+        shard_id = message['shard']
+        if type(shard_id) is not int or not 0 <= shard_id < len(self.shards):
+            raise ValueError('no such shard: {!r}'.format(shard_id))
+
+        # late messages about a finished shard are harmless and ignored
+        shard = self.shards[shard_id]
+        if not shard.finished and link not in shard.owners:
+            raise ValueError('shard {} was not given to this worker'.format(shard_id))
+
+        return shard
+
+    def _fn_merge(self, shard, records):
+
+        if shard.finished:
+            return
+
+        for ip, alive, rtt, attempts in records:
+
+            # drop hosts another copy of the shard already reported
+            index = shard.targets.fn_index(ip)
+            byte, bit = index >> 3, 1 << (index & 7)
+            if shard.reported[byte] & bit:
+                continue
+            shard.reported[byte] |= bit
+            shard.remaining -= 1
+            self.reported += 1
+
+            self._fn_update_scan_progress(ip_scanner.cl_scan_result(ip_targets.int_to_ip(ip),
+                                                                    bool(alive),
+                                                                    rtt,
+                                                                    attempts))
+
+    def _fn_done(self, link, shard):
+
+        # results arrive before done on the same connection, so a worker
+        # that leaves hosts unreported lost them; its shards go elsewhere
+        if not shard.finished and shard.remaining:
+            raise ValueError('shard {} done with {} hosts unreported'.format(shard.shard_id,
+                                                                            shard.remaining))
+
+        if shard in link.shards:
+            link.shards.remove(shard)
+        shard.owners.discard(link)
+
+        if shard.finished:
+            return
+
+        shard.finished = True
+        self.unfinished -= 1
+
+        for owner in list(shard.owners):
+            owner.shards.remove(shard)
+            self._fn_send(owner, {'type': 'cancel', 'shard': shard.shard_id})
+        shard.owners.clear()
+
+        shard.targets = None
+        shard.reported = None
+
+    def _fn_assign(self):
+
+        now = time.time()
+        for link in list(self.links):
+
+            # a failed send drops the link and puts the shard back
+            while len(link.shards) < self._SHARDS_AHEAD and self.pending:
+                shard = self.pending.popleft()
+                if not shard.finished and not self._fn_hand_out(link, shard, now):
+                    break
+
+            if link not in self.links:
+                continue
+
+            # an idle worker duplicates the slowest shard still running
+            if not link.shards and not self.pending:
+                candidates = [shard for shard in self.shards
+                              if shard.owners and link not in shard.owners
+                              and len(shard.owners) < 2
+                              and now - shard.assigned_at >= self.speculate_after]
+                if candidates:
+                    shard = max(candidates, key=lambda shard: shard.remaining)
+                    self._fn_log_event('shard {} duplicated on {}'.format(shard.shard_id, link.name))
+                    self._fn_hand_out(link, shard, now)
+
+    def _fn_hand_out(self, link, shard, now):
+        """
+        Sends the shard to the worker. Returns False if that failed, the
+        link is then dropped and the shard queued again unless another
+        worker has it.
+        """
+        if shard.targets is None:
+            shard.targets = self.targets.fn_slice(shard.start, shard.stop)
+            shard.reported = bytearray((shard.stop - shard.start + 7) // 8)
+
+        if shard.assigned_at is None:
+            shard.assigned_at = now
+
+        if self._fn_send(link, {'type': 'shard',
+                                'shard': shard.shard_id,
+                                'intervals': [list(interval) for interval in shard.targets.fn_intervals()]}):
+            link.shards.append(shard)
+            shard.owners.add(link)
+            return True
+
+        if not shard.owners:
+            self.pending.appendleft(shard)
+        return False
+
+    def _fn_send(self, link, message):
+        """
+        Queues a message for the worker and sends what the socket takes
+        now, the rest once it is writable. Returns False, having dropped the
+        link, if the connection failed or too much is waiting on it.
+        """
+        if link not in self.links:
+            return False
+
+        link.output += _fn_encode(message)
+        if len(link.output) > self._MAX_OUTPUT:
+            self._fn_drop(link, 'stopped reading')
+            return False
+
+        return self._fn_write(link)
+
+    def _fn_write(self, link):
+
+        try:
+            sent = link.sock.send(link.output)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._fn_drop(link, 'disconnected')
+            return False
+
+        del link.output[:sent]
+
+        # wait for writability only while something is left to send, timing
+        # how long the worker has taken nothing
+        if not link.output:
+            if link.output_since is not None:
+                self.selector.modify(link.sock, selectors.EVENT_READ, link)
+            link.output_since = None
+        else:
+            if link.output_since is None:
+                self.selector.modify(link.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, link)
+            if sent or link.output_since is None:
+                link.output_since = time.time()
+
+        return True
+
+    def _fn_finish_output(self, link):
+
+        # the scan is over, give the last messages a moment to go out
+        try:
+            link.sock.settimeout(1.0)
+            link.sock.sendall(link.output)
+        except OSError:
+            pass
+
+    def _fn_drop(self, link, reason):
+
+        if link not in self.links:
+            return
+
+        self.links.remove(link)
+        self.selector.unregister(link.sock)
+        link.sock.close()
+
+        if reason is not None:
+            self._fn_log_event('worker {} {}'.format(link.name, reason))
+
+        # shards nobody else is scanning go back to the front of the queue
+        for shard in reversed(link.shards):
+            shard.owners.discard(link)
+            if not shard.owners and not shard.finished:
+                self.pending.appendleft(shard)
+        link.shards = list()
+
+    def _fn_log_event(self, text):
+
+        if self._fn_log is not None:
+            self._fn_log(text)
+
+
+class cl_scan_worker():
+    """
+    Connects to a coordinator and scans the shards it sends, one after the
+    other, with cl_ip_scanner. scanner_options are keyword arguments for
+    cl_ip_scanner (engine, max_in_flight, timeout, ...) and apply to every
+    shard, so a backend instance given as engine is reused throughout.
+    """
+
+    # records per results message, and seconds a result may wait to be sent
+    _MAX_RECORDS = 1024
+    _MAX_AGE = 0.2
+
+    # seconds without sending anything before a heartbeat goes out
+    _HEARTBEAT = 1.0
+
+    def __init__(self, address, scanner_options=None, name=None):
+
+        self.address = address
+        self.scanner_options = scanner_options or dict()
+        self.name = name or socket.gethostname()
+
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.last_sent = 0.0
+
+        # results not yet sent, and the shard they belong to
+        self.records = list()
+        self.oldest = None
+
+        self.shards = queue.Queue()
+        self.cancelled = set()
+        self.current = None
+
+        # set to false to stop after the current shard
+        self._running = True
+
+    def fn_run(self):
+        """
+        Scans shards until the coordinator stops the scan or goes away.
+        Returns the number of shards completed.
+        """
+        self.sock = socket.create_connection(self.address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._fn_send({'type': 'hello', 'name': self.name})
+
+        reader = threading.Thread(target=self._fn_read_loop)
+        reader.daemon = True
+        reader.start()
+
+        sender = threading.Thread(target=self._fn_send_loop)
+        sender.daemon = True
+        sender.start()
+
+        completed = 0
+        try:
+            while self._running:
+
+                shard = self.shards.get()
+                if shard is None:
+                    break
+
+                shard_id, targets = shard
+                if shard_id in self.cancelled:
+                    continue
+
+                scanner = ip_scanner.cl_ip_scanner(None, None, None,
+                                                   lambda result, shard_id=shard_id: self._fn_add(shard_id, result),
+                                                   None,
+                                                   targets=targets,
+                                                   **self.scanner_options)
+                self.current = (shard_id, scanner)
+                scanner._check_active_ips()
+                self.current = None
+
+                # a cancelled shard may be cut short, so it is never done
+                if shard_id not in self.cancelled and self._running:
+                    self._fn_flush()
+                    self._fn_send({'type': 'done', 'shard': shard_id})
+                    completed += 1
+        finally:
+            self._running = False
+            self.sock.close()
+
+        return completed
+
+    def fn_stop(self):
+
+        self._running = False
+        self._fn_stop_current(None)
+        self.shards.put(None)
+
+    def _fn_read_loop(self):
+
+        reader = cl_line_reader()
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                data = b''
+
+            if not data:
+                self.fn_stop()
+                return
+
+            for message in reader.fn_feed(data):
+
+                kind = message.get('type')
+                if kind == 'shard':
+                    targets = ip_targets.cl_target_set([tuple(interval) for interval in message['intervals']])
+                    self.shards.put((message['shard'], targets))
+
+                elif kind == 'cancel':
+                    self.cancelled.add(message['shard'])
+                    self._fn_stop_current(message['shard'])
+
+                elif kind == 'stop':
+                    self.fn_stop()
+                    return
+
+    def _fn_stop_current(self, shard_id):
+
+        current = self.current
+        if current is None or (shard_id is not None and current[0] != shard_id):
+            return
+
+        current[1]._fn_stop_scan()
+
+    def _fn_add(self, shard_id, result):
+
+        with self.send_lock:
+
+            # results of one shard go out before those of the next
+            if self.records and self.records[0][0] != shard_id:
+                self._fn_flush_locked()
+
+            self.records.append((shard_id, [ip_targets.ip_to_int(result.ip),
+                                            int(result.alive),
+                                            result.rtt,
+                                            result.attempts]))
+            if self.oldest is None:
+                self.oldest = time.time()
+
+            if len(self.records) >= self._MAX_RECORDS:
+                self._fn_flush_locked()
+
+    def _fn_flush(self):
+
+        with self.send_lock:
+            self._fn_flush_locked()
+
+    def _fn_flush_locked(self):
+
+        if self.records:
+            self._fn_send_locked({'type': 'results',
+                                  'shard': self.records[0][0],
+                                  'records': [record for shard_id, record in self.records]})
+        self.records = list()
+        self.oldest = None
+
+    def _fn_send_loop(self):
+
+        # flushes results that waited too long, and keeps the link alive
+        while self._running:
+            time.sleep(self._MAX_AGE / 2)
+
+            with self.send_lock:
+                now = time.time()
+                if self.oldest is not None and now - self.oldest >= self._MAX_AGE:
+                    self._fn_flush_locked()
+                elif now - self.last_sent >= self._HEARTBEAT:
+                    self._fn_send_locked({'type': 'heartbeat'})
+
+    def _fn_send(self, message):
+
+        with self.send_lock:
+            self._fn_send_locked(message)
+
+    def _fn_send_locked(self, message):
+
+        try:
+            self.sock.sendall(_fn_encode(message))
+            self.last_sent = time.time()
+        except OSError:
+            # the reader sees the connection go and stops the worker
+            pass
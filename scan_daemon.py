@@ -0,0 +1,513 @@
+#-------------------------------------------------------------------------------
+# Name:        Scan Daemon
+# Purpose:     Long-running scan service. Jobs submitted over a local HTTP
+#              API share one probe engine and one global in-flight limit.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+#
+# API, JSON in and out:
+#
+#   POST   /jobs                      {"targets": [...], "exclude": [...]}, submit
+#   GET    /jobs                      summaries of every job
+#   GET    /jobs/<id>                 summary of one job
+#   GET    /jobs/<id>/results?since=N results from position N on, wait=S blocks
+#                                     up to S seconds for new ones
+#   GET    /jobs/<id>/stream          NDJSON results as they arrive, until done
+#   DELETE /jobs/<id>                 cancel a running job, forget a finished one
+#   GET    /status                    engine load and probe rate
+#   GET    /metrics                   Prometheus metrics, if the daemon has them
+
+from array import array                     # compact per-job results
+import collections                          # round robin over active jobs
+import http.server                          # API server
+import itertools                            # job ids
+import json                                 # API bodies
+import os                                   # stale unix sockets
+import socketserver                         # threading unix socket server
+import stat                                 # only sockets are unlinked
+import threading                            # service thread, job lock
+import time                                 # job times and waits
+from urllib.parse import urlsplit, parse_qs # API query strings
+
+import ip_scanner
+import ip_targets
+
+# job states
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_CANCELLED = 'cancelled'
+
+
+class cl_scan_job():
+
+    def __init__(self, job_id, targets):
+
+        self.job_id = job_id
+        self.targets = targets
+        self.state = JOB_QUEUED
+
+        # addresses not yet handed to the engine, and probes awaiting a result
+        self.ip_iter = targets.fn_iter_ints()
+        self.exhausted = False
+        self.outstanding = 0
+
+        # results in completion order, rtt in seconds or -1 for none
+        self.addrs = array('I')
+        self.alive = bytearray()
+        self.rtts = array('f')
+        self.attempts = bytearray()
+        self.alive_count = 0
+
+        self.submitted = time.time()
+        self.finished = None
+
+    def __len__(self):
+
+        return len(self.addrs)
+
+    def fn_add(self, result):
+
+        self.addrs.append(ip_targets.ip_to_int(result.ip))
+        self.alive.append(int(result.alive))
+        self.rtts.append(-1.0 if result.rtt is None else result.rtt)
+        self.attempts.append(min(255, result.attempts))
+        if result.alive:
+            self.alive_count += 1
+
+    def fn_is_final(self):
+
+        return self.state in (JOB_DONE, JOB_CANCELLED)
+
+    def fn_records(self, since, limit):
+
+        records = list()
+        for i in range(since, min(len(self), since + limit)):
+            rtt = self.rtts[i]
+            records.append({'ip': ip_targets.int_to_ip(self.addrs[i]),
+                            'alive': bool(self.alive[i]),
+                            'rtt_ms': None if rtt < 0 else round(rtt * 1000.0, 3),
+                            'attempts': self.attempts[i]})
+
+        return records
+
+    def fn_summary(self):
+
+        return {'id': self.job_id,
+                'state': self.state,
+                'hosts': len(self.targets),
+                'scanned': len(self),
+                'alive': self.alive_count,
+                'submitted': self.submitted,
+                'finished': self.finished}
+
+
+class cl_scan_daemon():
+    """
+    Runs every submitted job through a single cl_sub_process_spawner, so the
+    whole service never has more than max_in_flight probes out however many
+    jobs there are. The spawner's targets come from an endless source that
+    takes one host from each active job in turn. A host wanted by several
+    jobs at once is probed once and the result given to each of them.
+    """
+
+    # results returned by one fn_results call
+    _MAX_BATCH = 10000
+
+    # finished jobs kept for fetching before the oldest are forgotten
+    _MAX_FINISHED_JOBS = 100
+
+    # seconds the idle source sleeps between checks for new jobs
+    _IDLE_WAIT = 1.0
+
+    def __init__(self,
+                 engine=None,
+                 max_in_flight=ip_scanner.cl_sub_process_spawner._MAX_SUB_PROCESSES,
+                 timeout=None,
+                 adaptive_timeout=None,
+                 grace=0.0,
+                 retries=0,
+                 retry_backoff=0.5,
+                 rate_limiter=None,
+                 metrics=None):
+
+        self.lock = threading.Condition()
+        self.job_ids = itertools.count(1)
+
+        # job id -> job, in submission order
+        self.jobs = collections.OrderedDict()
+
+        # jobs with addresses left to hand out, in round robin order
+        self.active = collections.deque()
+
+        # host in flight -> jobs waiting for its result
+        self.waiting = dict()
+
+        # optional scan_metrics.cl_scan_metrics, served at /metrics
+        self.metrics = metrics
+
+        self.spawner = ip_scanner.cl_sub_process_spawner(self._fn_source(),
+                                                         self._fn_on_result,
+                                                         engine,
+                                                         max_in_flight,
+                                                         timeout,
+                                                         adaptive_timeout,
+                                                         grace,
+                                                         retries,
+                                                         retry_backoff,
+                                                         rate_limiter,
+                                                         metrics)
+        self.thread = None
+
+        # set to false to stop the service
+        self._running = True
+
+    def fn_start(self):
+
+        self.thread = threading.Thread(target=self.spawner._fn_spawn)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def fn_stop(self):
+
+        with self.lock:
+            self._running = False
+            self.spawner._fn_terminate_sub_processes()
+            self.lock.notify_all()
+
+        if self.thread is not None:
+            self.thread.join()
+
+        # the daemon runs for the life of the backend given to it
+        if not self.spawner.owns_engine:
+            self.spawner.engine.fn_close()
+
+    def fn_submit(self, targets):
+
+        with self.lock:
+            job = cl_scan_job(next(self.job_ids), targets)
+            self.jobs[job.job_id] = job
+            self.active.append(job)
+            self.lock.notify_all()
+
+        return job
+
+    def fn_cancel(self, job_id):
+        """
+        Cancels a job that is still running, or forgets one that finished.
+        Raises KeyError for unknown jobs.
+        """
+        with self.lock:
+            job = self.jobs[job_id]
+
+            if job.fn_is_final():
+                del self.jobs[job_id]
+            else:
+                if job in self.active:
+                    self.active.remove(job)
+                job.state = JOB_CANCELLED
+                job.finished = time.time()
+                self.lock.notify_all()
+
+            return job
+
+    def fn_job(self, job_id):
+
+        with self.lock:
+            return self.jobs[job_id].fn_summary()
+
+    def fn_jobs(self):
+
+        with self.lock:
+            return [job.fn_summary() for job in self.jobs.values()]
+
+    def fn_results(self, job_id, since=0, wait=0.0):
+        """
+        Returns (records, next position, job state) for results of job_id from
+        position since on, waiting up to wait seconds if there are none yet.
+        """
+        deadline = time.time() + wait
+        with self.lock:
+            job = self.jobs[job_id]
+
+            while len(job) <= since and not job.fn_is_final():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.lock.wait(remaining)
+
+            records = job.fn_records(since, self._MAX_BATCH)
+            return records, since + len(records), job.state
+
+    def fn_status(self):
+
+        achieved, target = self.spawner.fn_rate_report()
+        with self.lock:
+            return {'jobs': len(self.jobs),
+                    'active': len(self.active),
+                    'in_flight': len(self.waiting),
+                    'max_in_flight': self.spawner.max_in_flight,
+                    'probe_rate': achieved,
+                    'target_rate': target}
+
+    def _fn_source(self):
+
+        # runs on the service thread, inside the spawner
+        while True:
+            with self.lock:
+                if not self._running:
+                    return
+
+                host = self._fn_next_host()
+
+                # sleep while the spawner has nothing else to wait for
+                if host is None and self.spawner._fn_outstanding() == 0 and not self.spawner.retry_heap:
+                    self.lock.wait(self._IDLE_WAIT)
+                    continue
+
+            yield host
+
+    def _fn_next_host(self):
+
+        for _ in range(len(self.active)):
+
+            job = self.active[0]
+            self.active.rotate(-1)
+
+            for ip in job.ip_iter:
+
+                host = ip_targets.int_to_ip(ip)
+                job.outstanding += 1
+                job.state = JOB_RUNNING
+
+                # already in flight for another job, share its result
+                waiters = self.waiting.get(host)
+                if waiters is not None:
+                    waiters.append(job)
+                    continue
+
+                self.waiting[host] = [job]
+                return host
+
+            # the job was moved to the back by the rotation
+            self.active.pop()
+            job.exhausted = True
+            self._fn_check_done(job)
+
+        return None
+
+    def _fn_on_result(self, result):
+
+        if self.metrics is None:
+            self._fn_deliver(result)
+            return
+
+        started = time.perf_counter()
+        self._fn_deliver(result)
+        self.metrics.fn_result(result, time.perf_counter() - started)
+
+    def _fn_deliver(self, result):
+
+        with self.lock:
+            for job in self.waiting.pop(result.ip, ()):
+                job.outstanding -= 1
+                if job.state != JOB_CANCELLED:
+                    job.fn_add(result)
+                self._fn_check_done(job)
+
+            self.lock.notify_all()
+
+    def _fn_check_done(self, job):
+
+        if job.fn_is_final() or not job.exhausted or job.outstanding:
+            return
+
+        job.state = JOB_DONE
+        job.finished = time.time()
+
+        # forget the oldest finished jobs beyond the limit
+        finished = [old for old in self.jobs.values() if old.fn_is_final()]
+        for old in finished[:max(0, len(finished) - self._MAX_FINISHED_JOBS)]:
+            del self.jobs[old.job_id]
+
+
+class cl_daemon_request_handler(http.server.BaseHTTPRequestHandler):
+
+    server_version = 'ip_scanner'
+
+    def do_GET(self):
+
+        path, query = self._fn_parse_path()
+        daemon = self.server.scan_daemon
+
+        try:
+            if path == ['status']:
+                self._fn_send_json(200, daemon.fn_status())
+
+            elif path == ['metrics'] and daemon.metrics is not None:
+                data = daemon.metrics.fn_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            elif path == ['jobs']:
+                self._fn_send_json(200, daemon.fn_jobs())
+
+            elif len(path) == 2 and path[0] == 'jobs':
+                self._fn_send_json(200, daemon.fn_job(self._fn_job_id(path[1])))
+
+            elif len(path) == 3 and path[0] == 'jobs' and path[2] == 'results':
+                since = int(query.get('since', 0))
+                if since < 0:
+                    raise ValueError('since must not be negative')
+                wait = max(0.0, min(float(query.get('wait', 0)), 60.0))
+                records, position, state = daemon.fn_results(self._fn_job_id(path[1]), since, wait)
+                self._fn_send_json(200, {'results': records, 'next': position, 'state': state})
+
+            elif len(path) == 3 and path[0] == 'jobs' and path[2] == 'stream':
+                self._fn_stream(daemon, self._fn_job_id(path[1]))
+
+            else:
+                self._fn_send_json(404, {'error': 'not found'})
+
+        except KeyError:
+            self._fn_send_json(404, {'error': 'no such job'})
+        except ValueError as error:
+            self._fn_send_json(400, {'error': str(error)})
+
+    def do_POST(self):
+
+        path, query = self._fn_parse_path()
+        if path != ['jobs']:
+            self._fn_send_json(404, {'error': 'not found'})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            targets = ip_targets.parse_targets(body['targets'], body.get('exclude', ()))
+        except (KeyError, TypeError, ValueError, OSError) as error:
+            self._fn_send_json(400, {'error': 'bad job: {}'.format(error)})
+            return
+
+        job = self.server.scan_daemon.fn_submit(targets)
+        self._fn_send_json(201, job.fn_summary())
+
+    def do_DELETE(self):
+
+        path, query = self._fn_parse_path()
+        try:
+            if len(path) != 2 or path[0] != 'jobs':
+                self._fn_send_json(404, {'error': 'not found'})
+                return
+
+            job = self.server.scan_daemon.fn_cancel(self._fn_job_id(path[1]))
+            self._fn_send_json(200, job.fn_summary())
+
+        except KeyError:
+            self._fn_send_json(404, {'error': 'no such job'})
+        except ValueError as error:
+            self._fn_send_json(400, {'error': str(error)})
+
+    def address_string(self):
+
+        # unix socket clients have no address
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+
+        if self.server.verbose:
+            http.server.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _fn_parse_path(self):
+
+        parts = urlsplit(self.path)
+        path = [part for part in parts.path.split('/') if part]
+        query = dict((key, values[-1]) for key, values in parse_qs(parts.query).items())
+
+        return path, query
+
+    def _fn_job_id(self, text):
+
+        if not text.isdigit():
+            raise ValueError('job ids are numbers')
+        return int(text)
+
+    def _fn_send_json(self, status, body):
+
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _fn_stream(self, daemon, job_id):
+
+        # raises KeyError before any header is sent for unknown jobs
+        daemon.fn_job(job_id)
+
+        # no length, the stream ends when the connection closes
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+
+        position = 0
+        while True:
+            try:
+                records, position, state = daemon.fn_results(job_id, position, 1.0)
+            except KeyError:
+                return
+
+            if records:
+                self.wfile.write(''.join(json.dumps(record) + '\n' for record in records).encode('utf-8'))
+                self.wfile.flush()
+
+            elif state in (JOB_DONE, JOB_CANCELLED):
+                return
+
+
+class cl_daemon_http_server(http.server.ThreadingHTTPServer):
+
+    daemon_threads = True
+
+
+class cl_daemon_unix_server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+
+def fn_create_server(scan_daemon, address=None, unix_path=None, verbose=False):
+    """
+    Returns an HTTP server for the daemon's API, listening on a (host, port)
+    address or, if unix_path is given, on a unix socket at that path.
+    Raises ValueError if something other than a socket is at unix_path.
+    """
+    if unix_path is not None:
+
+        # a socket file left behind by an earlier run blocks bind, anything
+        # else at the path is not ours to remove
+        try:
+            mode = os.lstat(unix_path).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise ValueError('{} exists and is not a socket'.format(unix_path))
+            os.unlink(unix_path)
+        server = cl_daemon_unix_server(unix_path, cl_daemon_request_handler)
+    else:
+        server = cl_daemon_http_server(address, cl_daemon_request_handler)
+
+    server.scan_daemon = scan_daemon
+    server.verbose = verbose
+    return server
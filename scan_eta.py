@@ -0,0 +1,147 @@
+#-------------------------------------------------------------------------------
+# Name:        Scan ETA
+# Purpose:     Estimates the time left in a scan from the rate results are
+#              actually coming in at, and formats it for the GUI and CLI.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+from collections import deque               # sliding window of samples
+import time                                 # sample times
+
+
+class cl_eta_estimator():
+    """
+    Estimates the remaining time of a scan of total hosts. fn_update is
+    called periodically with the counts so far; the completion rate is
+    measured over a sliding window of those samples and smoothed with an
+    EWMA, so one slow poll does not swing the estimate. Until results
+    come in the rate is taken from the probes in flight and the expected
+    probe time instead (Little's law), which is what a scan reaches once
+    its window is full.
+    """
+
+    # seconds of samples the rate is measured over
+    _WINDOW = 10.0
+
+    # weight of the newest windowed rate in the smoothed rate
+    _ALPHA = 0.3
+
+    def __init__(self, total, probe_time, max_in_flight, window=_WINDOW, alpha=_ALPHA):
+
+        self.total = total
+        self.probe_time = probe_time
+        self.max_in_flight = max_in_flight
+        self.window = window
+        self.alpha = alpha
+
+        # (time, results, probes sent) samples within the window
+        self.samples = deque()
+
+        self.done = 0
+        self.alive = 0
+        self.in_flight = None
+
+        # smoothed results and probes per second, None until measured
+        self.rate = None
+        self.probe_rate = None
+
+    def fn_update(self, done, alive, in_flight=None, probes_sent=None, now=None):
+        """
+        Records that done results, alive of them alive, have arrived and
+        in_flight probes are outstanding. probes_sent, when known, gives
+        the probe rate including retries.
+        """
+        if now is None:
+            now = time.time()
+
+        self.done = done
+        self.alive = alive
+        self.in_flight = in_flight
+
+        self.samples.append((now, done, probes_sent))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= self.window:
+            self.samples.popleft()
+
+        start, start_done, start_sent = self.samples[0]
+        elapsed = now - start
+        if elapsed <= 0:
+            return
+
+        self.rate = self._fn_smooth(self.rate, (done - start_done) / elapsed)
+        if probes_sent is not None and start_sent is not None:
+            self.probe_rate = self._fn_smooth(self.probe_rate, (probes_sent - start_sent) / elapsed)
+
+    def fn_reset_rate(self):
+        """
+        Forgets the measured rate, for when the scan was held, e.g. paused,
+        so the time without progress does not count against it.
+        """
+        self.samples.clear()
+        self.rate = None
+        self.probe_rate = None
+
+    def fn_seconds_left(self):
+        """
+        Returns the estimated seconds until every host has a result.
+        """
+        remaining = self.total - self.done
+        if remaining <= 0:
+            return 0.0
+
+        rate = self.rate
+        if not rate:
+
+            # nothing measured yet, a full window finishes one probe time apart
+            in_flight = self.in_flight or min(self.max_in_flight, remaining)
+            rate = in_flight / self.probe_time
+
+        return remaining / rate
+
+    def fn_status(self):
+        """
+        Returns a dict of the counts, rates and estimated seconds left.
+        """
+        return {'done': self.done,
+                'total': self.total,
+                'alive': self.alive,
+                'dead': self.done - self.alive,
+                'in_flight': self.in_flight,
+                'rate': self.rate or 0.0,
+                'probe_rate': self.probe_rate if self.probe_rate is not None else self.rate or 0.0,
+                'seconds_left': self.fn_seconds_left()}
+
+    def _fn_smooth(self, previous, sample):
+
+        if previous is None:
+            return sample
+        return self.alpha * sample + (1.0 - self.alpha) * previous
+
+
+def fn_format_duration(seconds):
+    """
+    Returns seconds as rough human readable text, e.g. '2 hours, 5 minutes'.
+    """
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes = rest // 60
+
+    if hours:
+        return '{} {}, {} {}'.format(hours, 'hour' if hours == 1 else 'hours',
+                                     minutes, 'minute' if minutes == 1 else 'minutes')
+    elif minutes:
+        return '{} {}'.format(minutes, 'minute' if minutes == 1 else 'minutes')
+
+    return '< 1 minute'
+
+
+def fn_format_status(status):
+    """
+    Returns a one line summary of an fn_status dict.
+    """
+    return '{done}/{total} hosts, {alive} alive, {dead} dead, {probe_rate:.1f} probes/s, ' \
+           'ETA {eta}'.format(eta=fn_format_duration(status['seconds_left']), **status)
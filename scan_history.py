@@ -0,0 +1,302 @@
+#-------------------------------------------------------------------------------
+# Name:        Scan History
+# Purpose:     Keeps every finished scan in a SQLite file as compact bitmaps,
+#              so scans of a range can be compared without rescanning.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+from array import array                     # RTT column
+from collections import namedtuple          # scan summaries
+import sqlite3                              # history file
+import sys                                  # byte order of the RTT column
+import time                                 # scan times
+import zlib                                 # bitmaps of sparse ranges shrink a lot
+
+import ip_scanner
+import ip_targets
+
+# summary of one stored scan, targets is the list of fn_to_strings ranges
+cl_scan_info = namedtuple('cl_scan_info', ['scan_id', 'started', 'finished', 'targets',
+                                           'hosts', 'scanned', 'alive'])
+
+# hosts that changed state between two scans, as lists of addresses
+cl_scan_diff = namedtuple('cl_scan_diff', ['came_up', 'went_down'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id        INTEGER PRIMARY KEY,
+    started   REAL NOT NULL,
+    finished  REAL NOT NULL,
+    targets   TEXT NOT NULL,
+    hosts     INTEGER NOT NULL,
+    scanned   INTEGER NOT NULL,
+    alive     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scans_by_targets ON scans (targets, id);
+CREATE TABLE IF NOT EXISTS scan_bitmaps (
+    scan_id   INTEGER PRIMARY KEY REFERENCES scans (id),
+    scanned   BLOB NOT NULL,
+    alive     BLOB NOT NULL,
+    rtts      BLOB NOT NULL
+);
+"""
+
+
+class cl_scan_recorder():
+    """
+    Collects the results of one scan for cl_scan_history. Results are kept
+    by position in the scan's target set: one bit for scanned and one for
+    alive, plus the position and float32 RTT in milliseconds of each alive
+    host, written by fn_finish. fn_add takes ip_scanner.cl_scan_result
+    records and may be used as the scan's progress callback. Results
+    replayed from a cache or checkpoint (attempts 0) were not observed by
+    this scan and are only counted in replayed.
+    """
+
+    def __init__(self, history, targets, started=None):
+
+        if not isinstance(targets, ip_targets.cl_target_set):
+            targets = targets.fn_to_target_set()
+
+        self.history = history
+        self.targets = targets
+        self.started = time.time() if started is None else started
+
+        size = (len(targets) + 7) // 8
+        self.scanned = bytearray(size)
+        self.alive = bytearray(size)
+
+        # RTTs of alive hosts only, by position, in the order they came in
+        self.rtt_positions = array('I')
+        self.rtts = array('f')
+
+        self.replayed = 0
+
+    def fn_add(self, result):
+
+        # an old result stored as new would hide changes from fn_diff
+        if result.attempts == 0:
+            self.replayed += 1
+            return
+
+        index = self.targets.fn_index(result.ip)
+        self.scanned[index >> 3] |= 1 << (index & 7)
+
+        if result.alive:
+            self.alive[index >> 3] |= 1 << (index & 7)
+            if result.rtt is not None:
+                self.rtt_positions.append(index)
+                self.rtts.append(result.rtt * 1000.0)
+
+    def fn_finish(self, finished=None):
+        """
+        Stores the scan and returns its id.
+        """
+        return self.history._fn_store(self, time.time() if finished is None else finished)
+
+
+class cl_scan_history():
+    """
+    History of scans in a SQLite file. Each scan is stored as bitmaps over
+    its target set, so a /16 costs two 8 KB bitmaps before compression plus
+    4 bytes per alive host. Scans of the same targets are diffed by XOR of
+    their bitmaps; scans of different targets are compared address by address
+    over the addresses both cover.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+    def fn_close(self):
+
+        self.db.close()
+
+    def fn_record(self, targets, started=None):
+        """
+        Returns a cl_scan_recorder for a scan of targets, a cl_target_set or
+        cl_ip_range.
+        """
+        return cl_scan_recorder(self, targets, started)
+
+    def fn_scans(self, targets=None, limit=None):
+        """
+        Returns cl_scan_info of stored scans, newest first, only those of
+        exactly targets if given.
+        """
+        query = 'SELECT id, started, finished, targets, hosts, scanned, alive FROM scans'
+        params = list()
+
+        if targets is not None:
+            query += ' WHERE targets = ?'
+            params.append(_fn_targets_key(targets))
+
+        query += ' ORDER BY id DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        return [cl_scan_info(row[0], row[1], row[2], row[3].split(','), row[4], row[5], row[6])
+                for row in self.db.execute(query, params)]
+
+    def fn_results(self, scan_id):
+        """
+        Yields the stored cl_scan_result records of a scan in address order.
+        Attempts are not stored and reported as 1.
+        """
+        targets, scanned, alive, rtts = self._fn_load(scan_id, True)
+
+        for index in _fn_set_bits(scanned):
+            ip = targets.fn_int_at(index)
+            if alive[index >> 3] >> (index & 7) & 1:
+                yield ip_scanner.cl_scan_result(ip_targets.int_to_ip(ip), True, rtts[index] / 1000.0)
+            else:
+                yield ip_scanner.cl_scan_result(ip_targets.int_to_ip(ip), False)
+
+    def fn_diff(self, old_id, new_id):
+        """
+        Returns the cl_scan_diff from scan old_id to scan new_id, counting only
+        hosts scanned in both.
+        """
+        old_targets, old_scanned, old_alive = self._fn_load(old_id)[:3]
+        new_targets, new_scanned, new_alive = self._fn_load(new_id)[:3]
+
+        # same targets, so the same bit is the same host in both scans; the
+        # bitmaps are XORed as integers once, then read back as bytes
+        if old_targets == new_targets:
+            changed = ((int.from_bytes(old_alive, 'little') ^ int.from_bytes(new_alive, 'little'))
+                       & int.from_bytes(old_scanned, 'little')
+                       & int.from_bytes(new_scanned, 'little'))
+            changed = changed.to_bytes(len(new_alive), 'little')
+            came_up = list()
+            went_down = list()
+            for index in _fn_set_bits(changed):
+                ip = ip_targets.int_to_ip(new_targets.fn_int_at(index))
+                if new_alive[index >> 3] >> (index & 7) & 1:
+                    came_up.append(ip)
+                else:
+                    went_down.append(ip)
+            return cl_scan_diff(came_up, went_down)
+
+        # otherwise compare the addresses both scans covered
+        old_state = dict((old_targets.fn_int_at(index), old_alive[index >> 3] >> (index & 7) & 1)
+                         for index in _fn_set_bits(old_scanned))
+        came_up = list()
+        went_down = list()
+        for index in _fn_set_bits(new_scanned):
+            ip = new_targets.fn_int_at(index)
+            before = old_state.get(ip)
+            if before is None:
+                continue
+            now = new_alive[index >> 3] >> (index & 7) & 1
+            if now and not before:
+                came_up.append(ip_targets.int_to_ip(ip))
+            elif before and not now:
+                went_down.append(ip_targets.int_to_ip(ip))
+
+        return cl_scan_diff(came_up, went_down)
+
+    def fn_changes(self, targets):
+        """
+        Returns the cl_scan_diff between the last two scans of exactly targets,
+        or None if there are fewer than two.
+        """
+        scans = self.fn_scans(targets, 2)
+        if len(scans) < 2:
+            return None
+
+        return self.fn_diff(scans[1].scan_id, scans[0].scan_id)
+
+    def _fn_store(self, recorder, finished):
+
+        # only alive hosts carry an RTT worth keeping, in position order
+        rtts = dict(zip(recorder.rtt_positions, recorder.rtts))
+        alive_rtts = array('f', [rtts.get(index, 0.0) for index in _fn_set_bits(recorder.alive)])
+
+        # stored little endian whatever the platform
+        if sys.byteorder == 'big':
+            alive_rtts.byteswap()
+
+        with self.db:
+            cursor = self.db.execute(
+                'INSERT INTO scans (started, finished, targets, hosts, scanned, alive) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (recorder.started,
+                 finished,
+                 _fn_targets_key(recorder.targets),
+                 len(recorder.targets),
+                 _fn_popcount(recorder.scanned),
+                 _fn_popcount(recorder.alive)))
+
+            scan_id = cursor.lastrowid
+            self.db.execute('INSERT INTO scan_bitmaps (scan_id, scanned, alive, rtts) VALUES (?, ?, ?, ?)',
+                            (scan_id,
+                             zlib.compress(bytes(recorder.scanned), 1),
+                             zlib.compress(bytes(recorder.alive), 1),
+                             zlib.compress(alive_rtts.tobytes(), 1)))
+
+        return scan_id
+
+    def _fn_load(self, scan_id, with_rtts=False):
+        """
+        Returns (targets, scanned bits, alive bits, rtts by position or None)
+        of a scan, bitmaps as bytes with bit n & 7 of byte n >> 3 for the
+        n-th target. Raises KeyError for unknown scans.
+        """
+        row = self.db.execute('SELECT s.targets, b.scanned, b.alive, b.rtts '
+                              'FROM scans s JOIN scan_bitmaps b ON b.scan_id = s.id '
+                              'WHERE s.id = ?', (scan_id,)).fetchone()
+        if row is None:
+            raise KeyError('no scan {}'.format(scan_id))
+
+        targets = ip_targets.parse_targets(row[0].split(','))
+        scanned = zlib.decompress(row[1])
+        alive = zlib.decompress(row[2])
+        if not with_rtts:
+            return targets, scanned, alive, None
+
+        alive_rtts = array('f')
+        alive_rtts.frombytes(zlib.decompress(row[3]))
+        if sys.byteorder == 'big':
+            alive_rtts.byteswap()
+
+        # spread back out by position, only alive positions are ever read
+        rtts = dict(zip(_fn_set_bits(alive), alive_rtts))
+
+        return targets, scanned, alive, rtts
+
+
+def _fn_targets_key(targets):
+
+    if not isinstance(targets, ip_targets.cl_target_set):
+        targets = targets.fn_to_target_set()
+
+    return ','.join(targets.fn_to_strings())
+
+
+def _fn_popcount(bitmap):
+
+    return bin(int.from_bytes(bitmap, 'little')).count('1')
+
+
+def _fn_set_bits(bitmap):
+    """
+    Returns the positions of the set bits of a little-endian bitmap, in order.
+    """
+    positions = list()
+
+    for byte_index, byte in enumerate(bitmap):
+        if byte:
+            base = byte_index << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    positions.append(base + bit)
+
+    return positions
@@ -0,0 +1,246 @@
+#-------------------------------------------------------------------------------
+# Name:        Scan Metrics
+# Purpose:     Counters and histograms of the probe scheduler and the result
+#              path, readable as a dict or in Prometheus text format.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+from bisect import bisect_left              # histogram bucket of a value
+import os                                   # atomic metrics file replace
+import threading                            # periodic metrics file writes
+import time                                 # uptime and write interval
+
+# upper bounds in seconds of the histogram buckets
+_RTT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+_FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+
+class cl_histogram():
+    """
+    Counts observations into fixed buckets, each holding the values up to
+    its bound and above the previous one, plus their sum.
+    """
+
+    def __init__(self, buckets):
+
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def fn_observe(self, value):
+
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def fn_quantile(self, q):
+        """
+        Returns the bound of the bucket holding quantile q, None if nothing
+        was observed or it lies above the last bound.
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return None
+
+    def fn_snapshot(self):
+
+        # copied first, the scan thread may observe values meanwhile
+        counts = list(self.counts)
+        total = self.sum
+        cumulative = list()
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            cumulative.append((bound, seen))
+
+        return {'count': sum(counts),
+                'sum': total,
+                'buckets': cumulative,
+                'p50': self.fn_quantile(0.5),
+                'p99': self.fn_quantile(0.99)}
+
+
+class cl_scan_metrics():
+    """
+    Metrics of one scan engine. The spawner feeds the probe side: probes
+    sent, how long starting each probe took (the process spawn for ping),
+    time spent waiting for replies, probes in flight and the depth of the
+    retry queue. The result path feeds results, timeouts, RTTs and the time
+    spent in the progress callback. Engines given no metrics object skip
+    all of this behind a single None check.
+    """
+
+    # (name, type, help) of every metric, in export order
+    _METRICS = (('probes_sent', 'counter', 'Probes sent, including retries.'),
+                ('results', 'counter', 'Results reported.'),
+                ('results_alive', 'counter', 'Results of hosts that replied.'),
+                ('results_replayed', 'counter', 'Results taken from a cache or checkpoint.'),
+                ('timeouts', 'counter', 'Probes that got no reply.'),
+                ('in_flight', 'gauge', 'Probes in flight.'),
+                ('queue_depth', 'gauge', 'Hosts waiting for a retry or rate limit token.'),
+                ('spawn_seconds', 'histogram', 'Time taken to start a probe.'),
+                ('poll_seconds', 'histogram', 'Time spent waiting for replies per poll.'),
+                ('rtt_seconds', 'histogram', 'Round trip time of replies.'),
+                ('callback_seconds', 'histogram', 'Time spent in the progress callback per result.'))
+
+    def __init__(self):
+
+        self.started = time.time()
+
+        self.probes_sent = 0
+        self.results = 0
+        self.results_alive = 0
+        self.results_replayed = 0
+        self.timeouts = 0
+
+        self.in_flight = 0
+        self.queue_depth = 0
+
+        self.spawn_seconds = cl_histogram(_FAST_BUCKETS)
+        self.poll_seconds = cl_histogram(_FAST_BUCKETS)
+        self.rtt_seconds = cl_histogram(_RTT_BUCKETS)
+        self.callback_seconds = cl_histogram(_FAST_BUCKETS)
+
+    def fn_probe_started(self, seconds):
+
+        self.probes_sent += 1
+        self.spawn_seconds.fn_observe(seconds)
+
+    def fn_probes_sent(self, count):
+        """
+        Counts count probes whose start was timed elsewhere, e.g. in a
+        worker process.
+        """
+        self.probes_sent += count
+
+    def fn_polled(self, seconds, in_flight, queue_depth):
+
+        self.poll_seconds.fn_observe(seconds)
+        self.in_flight = in_flight
+        self.queue_depth = queue_depth
+
+    def fn_result(self, result, seconds):
+        """
+        Counts a cl_scan_result that took seconds in the progress callback.
+        Every attempt but a successful last one timed out.
+        """
+        self.results += 1
+        self.callback_seconds.fn_observe(seconds)
+
+        if result.attempts == 0:
+            self.results_replayed += 1
+            if result.alive:
+                self.results_alive += 1
+            return
+
+        if result.alive:
+            self.results_alive += 1
+            self.timeouts += result.attempts - 1
+            if result.rtt is not None:
+                self.rtt_seconds.fn_observe(result.rtt)
+        else:
+            self.timeouts += result.attempts
+
+    def fn_snapshot(self):
+        """
+        Returns every metric as a dict, histograms as dicts of count, sum,
+        cumulative (bound, count) buckets and approximate p50 and p99.
+        """
+        snapshot = {'uptime_seconds': time.time() - self.started}
+
+        for name, kind, description in self._METRICS:
+            value = getattr(self, name)
+            snapshot[name] = value.fn_snapshot() if kind == 'histogram' else value
+
+        return snapshot
+
+    def fn_prometheus(self, prefix='ip_scanner'):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = list()
+
+        for name, kind, description in self._METRICS:
+            full_name = '{}_{}'.format(prefix, name)
+            if kind == 'counter':
+                full_name += '_total'
+
+            lines.append('# HELP {} {}'.format(full_name, description))
+            lines.append('# TYPE {} {}'.format(full_name, kind))
+
+            if kind != 'histogram':
+                lines.append('{} {}'.format(full_name, getattr(self, name)))
+                continue
+
+            histogram = getattr(self, name).fn_snapshot()
+            for bound, count in histogram['buckets']:
+                lines.append('{}_bucket{{le="{}"}} {}'.format(full_name, repr(bound), count))
+            lines.append('{}_bucket{{le="+Inf"}} {}'.format(full_name, histogram['count']))
+            lines.append('{}_sum {}'.format(full_name, repr(histogram['sum'])))
+            lines.append('{}_count {}'.format(full_name, histogram['count']))
+
+        return '\n'.join(lines) + '\n'
+
+    def fn_write(self, path, prefix='ip_scanner'):
+        """
+        Writes the Prometheus text to path, replacing it atomically so a
+        collector never reads half a file.
+        """
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as output:
+            output.write(self.fn_prometheus(prefix))
+
+        os.replace(temp_path, path)
+
+
+class cl_metrics_writer():
+    """
+    Writes a cl_scan_metrics to a Prometheus text file every interval
+    seconds from a background thread, and once more when stopped, for
+    node_exporter's textfile collector or any scraper that reads files.
+    """
+
+    _INTERVAL = 5.0
+
+    def __init__(self, metrics, path, interval=_INTERVAL):
+
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def fn_start(self):
+
+        self.thread = threading.Thread(target=self._fn_run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def fn_stop(self):
+
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+        self.metrics.fn_write(self.path)
+
+    def _fn_run(self):
+
+        while not self.stop_event.wait(self.interval):
+            self.metrics.fn_write(self.path)
@@ -0,0 +1,231 @@
+#-------------------------------------------------------------------------------
+# Name:        Scan Watch
+# Purpose:     Keeps watching a target set and reports hosts coming up and
+#              going down, probing alive hosts often and dead space rarely.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+from array import array                     # timing wheel buckets
+from collections import namedtuple          # change events
+import math                                 # due slots rounded up
+import random                               # jittered intervals
+import threading                            # stop requests and idle waits
+import time
+
+import ip_scanner
+import ip_targets
+
+# state changes reported by cl_host_watcher, time is when the result came in
+STATE_UP = 'up'
+STATE_DOWN = 'down'
+cl_watch_event = namedtuple('cl_watch_event', ['ip', 'state', 'rtt', 'time'])
+
+# per-host state, one byte per target
+_UNKNOWN = 0
+_UP = 1
+_DOWN = 2
+
+
+class cl_host_watcher():
+    """
+    Probes every target once, then keeps re-probing on a schedule and
+    calls fn_event_cb with a cl_watch_event only when a host changes
+    state. Alive hosts are checked every alive_interval seconds. Dead
+    hosts wait dead_interval seconds, doubled for every further probe they
+    miss up to max_dead_interval, so space that stays dead costs less and
+    less. Every interval is jittered by up to the jitter fraction, at least
+    0 and below 1, which spreads the probes of a range out over time. An
+    alive host is only reported down after down_after probes in a row went
+    unanswered, the first misses being rechecked after recheck_interval
+    seconds.
+
+    Per host the watcher keeps a state byte, a miss count byte and its
+    position in a timing wheel, six bytes in all. Wheel slots are a quarter
+    of the shortest interval, at most a second, and a host is due in the
+    first slot starting after its interval has passed, so no probe goes out
+    early. Intervals must be at least _MIN_INTERVAL seconds, which bounds
+    the number of slots. Probes go through one cl_sub_process_spawner fed
+    by an endless source.
+    """
+
+    _ALIVE_INTERVAL = 30.0
+    _DEAD_INTERVAL = 300.0
+    _MAX_DEAD_INTERVAL = 3600.0
+    _RECHECK_INTERVAL = 2.0
+    _DOWN_AFTER = 2
+    _JITTER = 0.2
+
+    # longest timing wheel slot in seconds, and the shortest interval
+    # allowed, which keeps the wheel to a few hundred thousand slots
+    _MAX_SLOT = 1.0
+    _MIN_INTERVAL = 0.1
+
+    def __init__(self,
+                 targets,
+                 fn_event_cb,
+                 engine=None,
+                 max_in_flight=ip_scanner.cl_sub_process_spawner._MAX_SUB_PROCESSES,
+                 timeout=None,
+                 adaptive_timeout=None,
+                 grace=0.0,
+                 retries=0,
+                 retry_backoff=0.5,
+                 rate_limiter=None,
+                 alive_interval=_ALIVE_INTERVAL,
+                 dead_interval=_DEAD_INTERVAL,
+                 max_dead_interval=_MAX_DEAD_INTERVAL,
+                 recheck_interval=_RECHECK_INTERVAL,
+                 down_after=_DOWN_AFTER,
+                 jitter=_JITTER,
+                 seed=None):
+
+        if min(alive_interval, dead_interval, recheck_interval) < self._MIN_INTERVAL:
+            raise ValueError('watch intervals must be at least {} seconds'.format(self._MIN_INTERVAL))
+        if not 0.0 <= jitter < 1.0:
+            raise ValueError('watch jitter must be at least 0 and below 1: {}'.format(jitter))
+
+        if not isinstance(targets, ip_targets.cl_target_set):
+            targets = targets.fn_to_target_set()
+
+        self.targets = targets
+        self._fn_event = fn_event_cb
+
+        self.alive_interval = alive_interval
+        self.dead_interval = dead_interval
+        self.max_dead_interval = max(max_dead_interval, dead_interval)
+        self.recheck_interval = recheck_interval
+        self.down_after = max(1, down_after)
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+        n = len(targets)
+        self.state = bytearray(n)
+        self.misses = bytearray(n)
+        self.up_count = 0
+
+        # first sweep over every target, in order
+        self.cursor = 0
+
+        # slots of positions due for a probe, covering the longest interval;
+        # wheel_slot is the absolute slot number handed out next
+        self.slot = min(self._MAX_SLOT, min(alive_interval, dead_interval, recheck_interval) / 4.0)
+        longest = max(alive_interval, self.max_dead_interval, recheck_interval) * (1.0 + jitter)
+        self.wheel = [array('I') for _ in range(int(longest / self.slot) + 2)]
+        self.wheel_slot = int(time.time() / self.slot)
+
+        self.spawner = ip_scanner.cl_sub_process_spawner(self._fn_source(),
+                                                         self._fn_on_result,
+                                                         engine,
+                                                         max_in_flight,
+                                                         timeout,
+                                                         adaptive_timeout,
+                                                         grace,
+                                                         retries,
+                                                         retry_backoff,
+                                                         rate_limiter)
+
+        # set by fn_stop, also ends idle waits early
+        self.stop_event = threading.Event()
+
+    def fn_run(self):
+        """
+        Watches until fn_stop is called from another thread.
+        """
+        self.spawner._fn_spawn()
+
+    def fn_stop(self):
+
+        self.stop_event.set()
+        self.spawner._fn_terminate_sub_processes()
+
+    def fn_stats(self):
+
+        achieved, target = self.spawner.fn_rate_report()
+        return {'hosts': len(self.targets),
+                'up': self.up_count,
+                'first_sweep_done': self.cursor == len(self.targets),
+                'probes_sent': self.spawner.probes_sent,
+                'probe_rate': achieved,
+                'target_rate': target}
+
+    def _fn_source(self):
+
+        # runs on the spawner's thread, like _fn_on_result, so neither locks
+        while not self.stop_event.is_set():
+
+            position = self._fn_next_due()
+            if position is not None:
+                yield ip_targets.int_to_ip(self.targets.fn_int_at(position))
+                continue
+
+            # nothing due and nothing to wait for, sleep to the next slot
+            if self.spawner._fn_outstanding() == 0 and not self.spawner.retry_heap:
+                self.stop_event.wait((self.wheel_slot + 1) * self.slot - time.time())
+
+            yield None
+
+    def _fn_next_due(self):
+        """
+        Returns the position of the next target due for a probe, or None.
+        """
+        now_slot = int(time.time() / self.slot)
+
+        while True:
+            bucket = self.wheel[self.wheel_slot % len(self.wheel)]
+            if bucket:
+                return bucket.pop()
+            if self.wheel_slot >= now_slot:
+                break
+            self.wheel_slot += 1
+
+        # rechecks come first, the first sweep takes whatever capacity is left
+        if self.cursor < len(self.targets):
+            self.cursor += 1
+            return self.cursor - 1
+
+        return None
+
+    def _fn_schedule(self, position, interval):
+
+        # rounded up, a slot only starts once everything in it is due
+        interval *= self.random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+        slot = max(math.ceil((time.time() + interval) / self.slot), self.wheel_slot)
+        self.wheel[slot % len(self.wheel)].append(position)
+
+    def _fn_on_result(self, result):
+
+        position = self.targets.fn_index(result.ip)
+        state = self.state[position]
+
+        if result.alive:
+            self.misses[position] = 0
+            if state != _UP:
+                self.state[position] = _UP
+                self.up_count += 1
+                self._fn_event(cl_watch_event(result.ip, STATE_UP, result.rtt, time.time()))
+            self._fn_schedule(position, self.alive_interval)
+            return
+
+        misses = min(255, self.misses[position] + 1)
+        self.misses[position] = misses
+
+        if state == _UP:
+
+            # one lost reply is no outage, look again soon
+            if misses < self.down_after:
+                self._fn_schedule(position, self.recheck_interval)
+                return
+
+            self.up_count -= 1
+            self._fn_event(cl_watch_event(result.ip, STATE_DOWN, None, time.time()))
+
+        self.state[position] = _DOWN
+
+        # the longer a host stays dead the less often it is probed
+        backoff = 2 ** min(16, max(0, misses - self.down_after))
+        self._fn_schedule(position, min(self.max_dead_interval, self.dead_interval * backoff))
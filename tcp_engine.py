@@ -0,0 +1,181 @@
+#-------------------------------------------------------------------------------
+# Name:        TCP Engine
+# Purpose:     Liveness probes by non-blocking TCP connect for networks that
+#              filter ICMP, driven by a single asyncio event loop.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import asyncio                              # one event loop for every connect
+import socket                               # non-blocking TCP sockets
+import struct                               # SO_LINGER option value
+import time                                 # RTTs
+from probe_backend import cl_probe_backend, CAP_RTT, CAP_IN_PROCESS, CAP_TCP
+
+try:
+    import resource                         # descriptor limit, POSIX only
+except ImportError:
+    resource = None
+
+
+class cl_tcp_engine(cl_probe_backend):
+    """
+    Treats a host as alive if a TCP connect to any of the configured ports
+    completes or is refused with a RST, both of which prove the host is up.
+    Connects are started from fn_start_probe and progressed whenever fn_poll
+    runs the event loop, so no extra thread is involved. At most max_fds
+    sockets are open at once, further connects wait for a free descriptor.
+    """
+
+    CAPABILITIES = frozenset([CAP_RTT, CAP_IN_PROCESS, CAP_TCP])
+
+    _DEFAULT_PORTS = (80, 443, 22)
+
+    # seconds to wait for a connect before a port counts as filtered
+    _DEFAULT_TIMEOUT = 1.0
+
+    # descriptors left for everything else when max_fds is derived
+    _FD_HEADROOM = 64
+
+    def __init__(self, ports=_DEFAULT_PORTS, timeout=_DEFAULT_TIMEOUT, max_fds=None):
+
+        self.ports = tuple(ports)
+        self.timeout = timeout
+
+        if max_fds is None:
+            max_fds = _fn_default_max_fds(self._FD_HEADROOM)
+        self.max_fds = max_fds
+
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self._fn_init_loop_state())
+
+        # running probe tasks, and (host, alive, rtt) results not yet polled
+        self.tasks = set()
+        self.done = list()
+
+    def fn_in_flight(self):
+
+        return len(self.tasks)
+
+    def fn_outstanding(self):
+
+        return len(self.tasks) + len(self.done)
+
+    def fn_start_probe(self, host, timeout=None, grace=0.0):
+        """
+        Starts connects to every port of host. Sockets cannot give up their
+        descriptor early, so a grace period simply extends the connect timeout.
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        task = self.loop.create_task(self._fn_probe(host, timeout + grace))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def fn_poll(self, wait):
+        """
+        Runs the event loop for up to wait seconds, returning as soon as any
+        probe finishes. Returns a list of (host, alive, rtt).
+        """
+        if self.done:
+            wait = 0
+
+        self.loop.run_until_complete(self._fn_wait(wait))
+
+        results = self.done
+        self.done = list()
+        return results
+
+    def fn_cancel(self):
+
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+
+        # let cancelled probes close their sockets
+        if tasks:
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+        self.done = list()
+
+    def fn_close(self):
+
+        self.fn_cancel()
+        self.loop.close()
+
+    async def _fn_init_loop_state(self):
+
+        # created on the engine's loop so they bind to it
+        self.fd_limit = asyncio.Semaphore(self.max_fds)
+        self.wakeup = asyncio.Event()
+
+    async def _fn_wait(self, wait):
+
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+
+        self.wakeup.clear()
+
+    async def _fn_probe(self, host, timeout):
+
+        started = time.time()
+        connects = [self.loop.create_task(self._fn_connect(host, port, timeout))
+                    for port in self.ports]
+        alive = False
+
+        try:
+            pending = set(connects)
+            while pending and not alive:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                alive = any(task.result() for task in finished)
+        finally:
+            for task in connects:
+                task.cancel()
+
+            # let the other connects close their sockets, also when cancelled
+            await asyncio.gather(*connects, return_exceptions=True)
+
+        # leave the in-flight set before the result becomes visible to fn_poll
+        self.tasks.discard(asyncio.current_task())
+        self.done.append((host, alive, time.time() - started if alive else None))
+        self.wakeup.set()
+
+    async def _fn_connect(self, host, port, timeout):
+
+        async with self.fd_limit:
+
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+
+            # reset on close rather than leaving thousands of TIME_WAIT sockets
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+
+            try:
+                await asyncio.wait_for(self.loop.sock_connect(sock, (host, port)), timeout)
+                return True
+            except ConnectionRefusedError:
+                # a RST means the host answered
+                return True
+            except (asyncio.TimeoutError, OSError):
+                return False
+            finally:
+                sock.close()
+
+
+def _fn_default_max_fds(headroom):
+
+    if resource is None:
+        return 512
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        soft = 65536
+
+    return max(16, soft - headroom)
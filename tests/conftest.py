@@ -0,0 +1,16 @@
+#-------------------------------------------------------------------------------
+# Name:        Test Configuration
+# Purpose:     Makes the modules at the repository root importable from the
+#              tests, however pytest is started.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
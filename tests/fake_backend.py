@@ -0,0 +1,77 @@
+#-------------------------------------------------------------------------------
+# Name:        Fake Backend
+# Purpose:     In-process probe backend for the tests, answering after a set
+#              latency without sending anything on the network.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import heapq                                # replies ordered by due time
+import random                               # seeded losses
+import time                                 # reply times
+
+from probe_backend import cl_probe_backend, CAP_RTT, CAP_IN_PROCESS
+
+
+class cl_fake_backend(cl_probe_backend):
+    """
+    Answers every probe after latency seconds, except a fraction loss of
+    them, drawn from a seeded generator, which are reported dead once their
+    timeout plus grace has passed. fn_start_probe records every host probed.
+    """
+
+    CAPABILITIES = frozenset([CAP_RTT, CAP_IN_PROCESS])
+
+    def __init__(self, latency=0.001, loss=0.0, timeout=1.0, seed=None):
+
+        self.latency = latency
+        self.loss = loss
+        self.timeout = timeout
+        self.random = random.Random(seed)
+
+        # heap of (reply time, sequence, host, alive, rtt)
+        self.replies = list()
+        self.sequence = 0
+
+        self.probed = list()
+
+    def fn_start_probe(self, host, timeout=None, grace=0.0):
+
+        if timeout is None:
+            timeout = self.timeout
+        now = time.time()
+        self.probed.append(host)
+
+        if self.random.random() < self.loss or self.latency > timeout + grace:
+            reply = (now + timeout + grace, self.sequence, host, False, None)
+        else:
+            reply = (now + self.latency, self.sequence, host, True, self.latency)
+
+        self.sequence += 1
+        heapq.heappush(self.replies, reply)
+
+    def fn_poll(self, wait):
+
+        now = time.time()
+        if self.replies and self.replies[0][0] > now and wait > 0:
+            time.sleep(min(wait, self.replies[0][0] - now))
+            now = time.time()
+
+        results = list()
+        while self.replies and self.replies[0][0] <= now:
+            due, sequence, host, alive, rtt = heapq.heappop(self.replies)
+            results.append((host, alive, rtt))
+
+        return results
+
+    def fn_in_flight(self):
+
+        return len(self.replies)
+
+    def fn_cancel(self):
+
+        del self.replies[:]
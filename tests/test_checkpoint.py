@@ -0,0 +1,114 @@
+#-------------------------------------------------------------------------------
+# Name:        Checkpoint Tests
+# Purpose:     Saving a scan's progress and resuming it from the file.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import os
+
+import pytest
+
+import checkpoint
+import ip_scanner
+import ip_targets
+from fake_backend import cl_fake_backend
+
+
+def test_save_and_resume(tmp_path):
+
+    path = str(tmp_path / 'scan.ckpt')
+    targets = ip_targets.parse_targets(['10.0.0.0/24', '10.0.2.0/28'])
+    hosts = list(targets)
+
+    scan_checkpoint = checkpoint.cl_scan_checkpoint(path, targets)
+    for position, ip in enumerate(hosts[:100]):
+        alive = position % 3 == 0
+        scan_checkpoint.fn_add(ip_scanner.cl_scan_result(ip, alive, 0.002 if alive else None))
+    scan_checkpoint.fn_save()
+
+    resumed = checkpoint.cl_scan_checkpoint(path, targets)
+
+    assert resumed.resumed == 100
+    assert resumed.cursor == 100
+    assert list(resumed.fn_remaining()) == hosts[100:]
+
+    replayed = list(resumed.fn_replay())
+    assert [result.ip for result in replayed] == hosts[:100]
+    assert all(result.attempts == 0 for result in replayed)
+    assert [result.alive for result in replayed] == [position % 3 == 0 for position in range(100)]
+    assert replayed[0].rtt == pytest.approx(0.002)
+
+
+def test_out_of_order_results_leave_gaps(tmp_path):
+
+    path = str(tmp_path / 'scan.ckpt')
+    targets = ip_targets.parse_targets(['10.0.0.0/29'])
+    hosts = list(targets)
+
+    scan_checkpoint = checkpoint.cl_scan_checkpoint(path, targets)
+    for ip in (hosts[0], hosts[2], hosts[3], hosts[6]):
+        scan_checkpoint.fn_add(ip_scanner.cl_scan_result(ip, False))
+    scan_checkpoint.fn_save()
+
+    resumed = checkpoint.cl_scan_checkpoint(path, targets)
+
+    assert resumed.cursor == 1
+    assert list(resumed.fn_remaining()) == [hosts[1], hosts[4], hosts[5], hosts[7]]
+
+
+def test_other_targets_are_refused(tmp_path):
+
+    path = str(tmp_path / 'scan.ckpt')
+    checkpoint.cl_scan_checkpoint(path, ip_targets.parse_targets(['10.0.0.0/30'])).fn_save()
+
+    with pytest.raises(ValueError):
+        checkpoint.cl_scan_checkpoint(path, ip_targets.parse_targets(['10.0.1.0/30']))
+
+
+def test_truncated_file_is_refused(tmp_path):
+
+    path = str(tmp_path / 'scan.ckpt')
+    targets = ip_targets.parse_targets(['10.0.0.0/24'])
+    scan_checkpoint = checkpoint.cl_scan_checkpoint(path, targets)
+    scan_checkpoint.fn_add(ip_scanner.cl_scan_result('10.0.0.0', True, 0.001))
+    scan_checkpoint.fn_save()
+
+    with open(path, 'rb') as source:
+        data = source.read()
+
+    # cut inside the header, and inside the compressed sections
+    for length in (len(checkpoint._MAGIC) + 4, len(data) - 3):
+        with open(path, 'wb') as sink:
+            sink.write(data[:length])
+        with pytest.raises(ValueError, match='truncated or corrupt'):
+            checkpoint.cl_scan_checkpoint(path, targets)
+
+
+def test_resumed_scan_covers_every_host_once(tmp_path):
+
+    path = str(tmp_path / 'scan.ckpt')
+    targets = ip_targets.parse_targets(['10.0.0.0/26'])
+    hosts = list(targets)
+
+    scan_checkpoint = checkpoint.cl_scan_checkpoint(path, targets)
+    for ip in hosts[::2]:
+        scan_checkpoint.fn_add(ip_scanner.cl_scan_result(ip, True, 0.001))
+    scan_checkpoint.fn_save()
+
+    results = list()
+    scanner = ip_scanner.cl_ip_scanner(None, None, None, results.append, None,
+                                       engine=cl_fake_backend(0.001, 0.0, 0.1),
+                                       targets=targets,
+                                       checkpoint=checkpoint.cl_scan_checkpoint(path, targets))
+    scanner._check_active_ips()
+
+    assert sorted(result.ip for result in results) == sorted(hosts)
+    assert sum(1 for result in results if result.attempts == 0) == len(hosts[::2])
+
+    # a completed scan leaves no checkpoint behind
+    assert not os.path.exists(path)
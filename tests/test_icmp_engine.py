@@ -0,0 +1,163 @@
+#-------------------------------------------------------------------------------
+# Name:        ICMP Engine Tests
+# Purpose:     The in-process ICMP echo engine against the loopback network,
+#              with no other network needed.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import struct
+import time
+
+import pytest
+
+import icmp_engine
+
+
+class _cl_captured_socket():
+    """
+    Stands in for the engine's socket: requests are recorded instead of
+    sent, and replies queued with fn_reply are read back by the engine.
+    """
+
+    def __init__(self, sock):
+
+        self.sock = sock
+        self.sent = list()
+        self.replies = list()
+
+    def fileno(self):
+
+        return self.sock.fileno()
+
+    def sendto(self, packet, address):
+
+        self.sent.append((packet, address))
+
+    def recvfrom(self, size):
+
+        if not self.replies:
+            raise BlockingIOError
+        return self.replies.pop(0)
+
+    def close(self):
+
+        self.sock.close()
+
+    def fn_reply(self, engine, host, ident, seq):
+
+        packet = struct.pack('!BBHHH', icmp_engine._ICMP_ECHO_REPLY, 0, 0, ident, seq)
+
+        # raw sockets deliver the IP header in front of the ICMP message
+        if engine._raw:
+            packet = bytes([0x45]) + bytes(19) + packet
+
+        self.replies.append((packet, (host, 0)))
+
+
+@pytest.fixture
+def engine():
+
+    try:
+        engine = icmp_engine.cl_icmp_engine(1.0)
+    except OSError as error:
+        pytest.skip('no ICMP socket available: {}'.format(error))
+
+    yield engine
+    engine.fn_close()
+
+
+def _fn_poll_until(engine, count, limit=3.0):
+
+    results = list()
+    deadline = time.time() + limit
+    while len(results) < count and time.time() < deadline:
+        results += engine.fn_poll(0.05)
+
+    return results
+
+
+def test_loopback_host_is_alive(engine):
+
+    engine.fn_start_probe('127.0.0.1')
+
+    results = _fn_poll_until(engine, 1)
+
+    assert len(results) == 1
+    host, alive, rtt = results[0]
+    assert (host, alive) == ('127.0.0.1', True)
+    assert 0 <= rtt < 1.0
+    assert engine.fn_outstanding() == 0
+
+
+def test_unanswered_probe_times_out(engine):
+
+    engine.sock = _cl_captured_socket(engine.sock)
+    engine.fn_start_probe('127.0.0.1', timeout=0.05)
+
+    assert engine.fn_in_flight() == 1
+    assert engine.fn_poll(0.01) == []
+
+    results = _fn_poll_until(engine, 1)
+
+    assert results == [('127.0.0.1', False, None)]
+    assert engine.fn_outstanding() == 0
+
+
+def test_grace_frees_the_slot_but_accepts_late_replies(engine):
+
+    engine.sock = _cl_captured_socket(engine.sock)
+    engine.fn_start_probe('127.0.0.2', timeout=0.02, grace=1.0)
+    time.sleep(0.03)
+
+    assert engine.fn_poll(0) == []
+    assert engine.fn_in_flight() == 0
+    assert engine.fn_outstanding() == 1
+
+    seq = struct.unpack('!BBHHH', engine.sock.sent[0][0][:8])[4]
+    engine.sock.fn_reply(engine, '127.0.0.2', engine._ident, seq)
+
+    results = list()
+    engine._fn_read_replies(results)
+    assert [(host, alive) for host, alive, rtt in results] == [('127.0.0.2', True)]
+
+
+def test_replies_are_matched_by_id_seq_and_address(engine):
+
+    engine.sock = _cl_captured_socket(engine.sock)
+    engine.fn_start_probe('127.0.0.1', timeout=5.0)
+    engine.fn_start_probe('127.0.0.2', timeout=5.0)
+
+    seqs = [struct.unpack('!BBHHH', packet[:8])[4] for packet, address in engine.sock.sent]
+    assert len(set(seqs)) == 2
+
+    # an unknown seq, a reply from the wrong host and, on raw sockets,
+    # another process's identifier are all ignored
+    engine.sock.fn_reply(engine, '127.0.0.1', engine._ident, (max(seqs) + 1) & 0xFFFF)
+    engine.sock.fn_reply(engine, '127.0.0.3', engine._ident, seqs[0])
+    if engine._raw:
+        engine.sock.fn_reply(engine, '127.0.0.1', engine._ident ^ 1, seqs[0])
+
+    results = list()
+    engine._fn_read_replies(results)
+    assert results == []
+
+    # the right replies count, whatever order they arrive in
+    engine.sock.fn_reply(engine, '127.0.0.2', engine._ident, seqs[1])
+    engine.sock.fn_reply(engine, '127.0.0.1', engine._ident, seqs[0])
+    engine._fn_read_replies(results)
+
+    assert [(host, alive) for host, alive, rtt in results] == [('127.0.0.2', True), ('127.0.0.1', True)]
+    assert engine.fn_outstanding() == 0
+
+
+def test_echo_request_checksum():
+
+    packet = icmp_engine._fn_echo_request(0x1234, 7)
+
+    assert icmp_engine._fn_checksum(packet) == 0
+    assert struct.unpack('!BBHHH', packet[:8])[3:] == (0x1234, 7)
@@ -0,0 +1,159 @@
+#-------------------------------------------------------------------------------
+# Name:        IP Scanner Tests
+# Purpose:     The probe scheduler against an in-process fake backend.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import threading
+
+import pytest
+
+import ip_scanner
+import ip_targets
+import probe_backend
+from fake_backend import cl_fake_backend
+
+
+def _fn_hosts(count):
+
+    return list(ip_targets.parse_targets(['10.0.0.0/16']).fn_slice(0, count))
+
+
+def test_every_host_reported_once():
+
+    hosts = _fn_hosts(500)
+    results = list()
+    engine = cl_fake_backend(0.001, 0.3, 0.05, seed=1)
+
+    spawner = ip_scanner.cl_sub_process_spawner(hosts, results.append, engine, 64, 0.05)
+    spawner._fn_spawn()
+
+    assert sorted(result.ip for result in results) == sorted(hosts)
+    assert spawner.probes_sent == len(hosts)
+    assert engine.fn_in_flight() == 0
+    assert all(result.attempts == 1 for result in results)
+
+
+def test_window_is_never_exceeded():
+
+    hosts = _fn_hosts(300)
+    engine = cl_fake_backend(0.002, 0.0, 1.0)
+    start_probe = engine.fn_start_probe
+    most = [0]
+
+    # count the probe being started along with those already in flight
+    def fn_start_probe(host, timeout=None, grace=0.0):
+        most[0] = max(most[0], engine.fn_in_flight() + 1)
+        start_probe(host, timeout, grace)
+
+    engine.fn_start_probe = fn_start_probe
+    spawner = ip_scanner.cl_sub_process_spawner(hosts, lambda result: None, engine, 16, 1.0)
+    spawner._fn_spawn()
+
+    assert 0 < most[0] <= 16
+    assert len(engine.probed) == len(hosts)
+
+
+def test_open_ended_source_waits_for_hosts():
+
+    hosts = _fn_hosts(20)
+    results = list()
+
+    # idle passes first, then hosts, then idle again before the end
+    def fn_source():
+        for _ in range(5):
+            yield None
+        for host in hosts:
+            yield host
+        yield None
+
+    engine = cl_fake_backend(0.001, 0.0, 0.05)
+    spawner = ip_scanner.cl_sub_process_spawner(fn_source(), results.append, engine, 8, 0.05)
+    spawner._fn_spawn()
+
+    assert sorted(result.ip for result in results) == sorted(hosts)
+    assert all(result.alive for result in results)
+
+
+def test_retries_until_exhausted():
+
+    hosts = _fn_hosts(50)
+    results = list()
+    engine = cl_fake_backend(0.001, 1.0, 0.01, seed=1)
+
+    spawner = ip_scanner.cl_sub_process_spawner(hosts, results.append, engine, 16, 0.01,
+                                                retries=2, retry_backoff=0.001)
+    spawner._fn_spawn()
+
+    assert len(results) == len(hosts)
+    assert all(not result.alive and result.attempts == 3 for result in results)
+    assert spawner.probes_sent == 3 * len(hosts)
+    assert not spawner.retry_heap
+
+
+def test_retried_hosts_that_answer_report_their_attempt():
+
+    hosts = _fn_hosts(200)
+    results = list()
+    engine = cl_fake_backend(0.001, 0.5, 0.01, seed=2)
+
+    spawner = ip_scanner.cl_sub_process_spawner(hosts, results.append, engine, 32, 0.01,
+                                                retries=3, retry_backoff=0.001)
+    spawner._fn_spawn()
+
+    assert sorted(result.ip for result in results) == sorted(hosts)
+    assert spawner.probes_sent == sum(result.attempts for result in results)
+    assert any(result.alive and result.attempts > 1 for result in results)
+    assert all(result.attempts == 4 for result in results if not result.alive)
+
+
+def test_stop_cancels_probes_in_flight():
+
+    hosts = _fn_hosts(1000)
+    results = list()
+    engine = cl_fake_backend(10.0, 0.0, 60.0)
+
+    spawner = ip_scanner.cl_sub_process_spawner(hosts, results.append, engine, 100, 60.0)
+    thread = threading.Thread(target=spawner._fn_spawn)
+    thread.start()
+    spawner._fn_terminate_sub_processes()
+    thread.join(5.0)
+
+    assert not thread.is_alive()
+    assert engine.fn_in_flight() == 0
+
+
+def test_callback_errors_still_cancel_probes():
+
+    engine = cl_fake_backend(0.001, 0.0, 1.0)
+
+    def fn_fail(result):
+        raise RuntimeError('callback failed')
+
+    spawner = ip_scanner.cl_sub_process_spawner(_fn_hosts(100), fn_fail, engine, 50, 1.0)
+    with pytest.raises(RuntimeError):
+        spawner._fn_spawn()
+
+    assert engine.fn_in_flight() == 0
+
+
+def test_adaptive_timeout_needs_rtts():
+
+    engine = probe_backend.cl_probe_backend()
+
+    with pytest.raises(ValueError):
+        ip_scanner.cl_sub_process_spawner([], None, engine, adaptive_timeout=object())
+
+
+def test_scanner_rate_report_before_start():
+
+    scanner = ip_scanner.cl_ip_scanner(None, None, None, None, None,
+                                       engine=cl_fake_backend(),
+                                       targets=ip_targets.parse_targets(['10.0.0.1']))
+
+    assert scanner.fn_rate_report() == (0.0, None)
@@ -0,0 +1,147 @@
+#-------------------------------------------------------------------------------
+# Name:        IP Targets Tests
+# Purpose:     Target spec parsing and the target set operations.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import pytest
+
+import ip_targets
+
+
+def test_single_address_cidr_and_range():
+
+    targets = ip_targets.parse_targets(['10.0.0.5', '10.0.1.0/30', '10.0.2.1-10.0.2.3'])
+
+    assert len(targets) == 1 + 4 + 3
+    assert list(targets)[:5] == ['10.0.0.5', '10.0.1.0', '10.0.1.1', '10.0.1.2', '10.0.1.3']
+    assert '10.0.2.3' in targets
+    assert '10.0.2.4' not in targets
+
+
+def test_octet_ranges():
+
+    targets = ip_targets.parse_targets(['192.168.0-1.1-2'])
+
+    assert list(targets) == ['192.168.0.1', '192.168.0.2', '192.168.1.1', '192.168.1.2']
+    assert len(ip_targets.parse_targets(['10.0.*.1'])) == 256
+
+
+def test_full_octets_form_one_interval():
+
+    targets = ip_targets.parse_targets(['0-255.*.*.*'])
+
+    assert len(targets) == 1 << 32
+    assert list(targets.fn_intervals()) == [(0, 0xFFFFFFFF)]
+    assert len(list(ip_targets.parse_targets(['10.*.*.*']).fn_intervals())) == 1
+    assert len(list(ip_targets.parse_targets(['10.1-3.*.*']).fn_intervals())) == 1
+    assert len(list(ip_targets.parse_targets(['*.5.*.*']).fn_intervals())) == 256
+
+
+def test_comma_separated_specs():
+
+    targets = ip_targets.parse_targets('10.0.0.1, 10.0.0.3,,10.0.0.2')
+
+    assert list(targets) == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+
+
+def test_overlapping_specs_are_merged():
+
+    targets = ip_targets.parse_targets(['10.0.0.0/24', '10.0.0.128/25', '10.0.0.255'])
+
+    assert len(targets) == 256
+    assert targets.fn_to_strings() == ['10.0.0.0-10.0.0.255']
+
+
+def test_exclude():
+
+    targets = ip_targets.parse_targets(['10.0.0.0/24'], ['10.0.0.0', '10.0.0.128/25'])
+
+    assert len(targets) == 127
+    assert '10.0.0.0' not in targets
+    assert '10.0.0.127' in targets
+
+
+def test_edges_of_the_address_space():
+
+    assert len(ip_targets.parse_targets(['0.0.0.0/0'])) == 1 << 32
+    assert list(ip_targets.parse_targets(['255.255.255.255/32'])) == ['255.255.255.255']
+    assert list(ip_targets.parse_targets(['0.0.0.0'])) == ['0.0.0.0']
+
+
+def test_index_and_slice():
+
+    targets = ip_targets.parse_targets(['10.0.0.0/30', '10.0.1.0/30'])
+
+    for position in range(len(targets)):
+        assert targets.fn_index(targets[position]) == position
+
+    assert list(targets.fn_slice(2, 6)) == ['10.0.0.2', '10.0.0.3', '10.0.1.0', '10.0.1.1']
+    with pytest.raises(ValueError):
+        targets.fn_index('10.0.2.0')
+
+
+@pytest.mark.parametrize('spec', ['10/8',
+                                  '10.1/16',
+                                  '1.2.3',
+                                  '1.2.3.4.5',
+                                  '1.2.3.256',
+                                  '1.2.3.4-1.2.3.300',
+                                  '1.2.3.9-1.2.3.4',
+                                  '1.2.3.4/33',
+                                  '1.2.3.4/8x',
+                                  '1.2.x.4',
+                                  '1.2.3.+4'])
+def test_invalid_specs_raise(spec):
+
+    with pytest.raises(ValueError):
+        ip_targets.parse_targets([spec])
+
+
+def test_error_names_the_spec():
+
+    with pytest.raises(ValueError, match='1.2.3.9-1.2.3.4'):
+        ip_targets.parse_targets(['1.2.3.9-1.2.3.4'])
+
+
+def test_address_conversion_round_trips():
+
+    for ip in ('0.0.0.0', '10.1.2.3', '255.255.255.255'):
+        assert ip_targets.int_to_ip(ip_targets.ip_to_int(ip)) == ip
+
+    with pytest.raises(ValueError):
+        ip_targets.ip_to_int('10.1.2')
+
+
+@pytest.mark.parametrize('specs', [['10.0.0.0/22'],
+                                   ['10.0.0.200-10.0.3.10'],
+                                   ['10.0.0.5', '10.0.0.9-10.0.0.20', '10.0.7.0/23'],
+                                   ['10.0.0.0/24']])
+def test_interleaved_covers_every_address_once(specs):
+
+    targets = ip_targets.parse_targets(specs)
+    interleaved = list(targets.fn_interleaved())
+
+    assert sorted(interleaved, key=ip_targets.ip_to_int) == list(targets)
+
+
+def test_interleaved_takes_the_24s_in_turn():
+
+    targets = ip_targets.parse_targets(['10.0.0.254-10.0.2.1'])
+
+    assert list(targets.fn_interleaved())[:6] == ['10.0.0.254', '10.0.1.0', '10.0.2.0',
+                                                 '10.0.0.255', '10.0.1.1', '10.0.2.1']
+
+
+@pytest.mark.parametrize('targets', [ip_targets.parse_targets(['10.0.0.0/24', '10.0.5.0/24']),
+                                     ip_targets.cl_ip_range(['10', '0'], [(0, 3), (10, 20)])])
+def test_slice_to_target_set(targets):
+
+    view = ip_targets.cl_target_slice(targets, 5, 30)
+
+    assert list(view.fn_to_target_set()) == list(view)
@@ -0,0 +1,82 @@
+#-------------------------------------------------------------------------------
+# Name:        Probe Backend Tests
+# Purpose:     The posix_spawn ping launcher, with a stand-in ping executable.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import os
+
+import pytest
+
+import probe_backend
+
+pytestmark = pytest.mark.skipif(not probe_backend.fn_spawn_supported(), reason='no pidfd support')
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+
+    # a ping that answers 127.0.0.1 and never answers anything else
+    ping = tmp_path / 'ping'
+    ping.write_text('#!/bin/sh\n'
+                    'for last; do :; done\n'
+                    '[ "$last" = 127.0.0.1 ] && exit 0\n'
+                    'sleep 5\n'
+                    'exit 1\n')
+    ping.chmod(0o755)
+    monkeypatch.setenv('PATH', str(tmp_path))
+
+    backend = probe_backend.cl_spawn_ping_backend(timeout=1.0)
+    yield backend
+    backend.fn_close()
+
+
+def test_children_are_reaped(backend):
+
+    backend.fn_start_probe('127.0.0.1')
+    backend.fn_start_probe('10.0.0.1', timeout=0.2)
+
+    results = list()
+    while backend.fn_in_flight():
+        results.extend(backend.fn_poll(1.0))
+
+    assert sorted((host, alive) for host, alive, rtt in results) == [('10.0.0.1', False),
+                                                                    ('127.0.0.1', True)]
+
+
+def test_failed_register_kills_the_child(backend, monkeypatch):
+
+    spawned = list()
+    opened = list()
+    posix_spawn = os.posix_spawn
+    pidfd_open = os.pidfd_open
+
+    def fn_posix_spawn(*args, **kwargs):
+        spawned.append(posix_spawn(*args, **kwargs))
+        return spawned[-1]
+
+    def fn_pidfd_open(pid):
+        opened.append(pidfd_open(pid))
+        return opened[-1]
+
+    def fn_register(*args):
+        raise OSError('no room in the selector')
+
+    monkeypatch.setattr(os, 'posix_spawn', fn_posix_spawn)
+    monkeypatch.setattr(os, 'pidfd_open', fn_pidfd_open)
+    monkeypatch.setattr(backend.selector, 'register', fn_register)
+
+    with pytest.raises(OSError):
+        backend.fn_start_probe('10.0.0.1')
+
+    # the child was waited for and its pidfd closed
+    with pytest.raises(ChildProcessError):
+        os.waitpid(spawned[0], os.WNOHANG)
+    with pytest.raises(OSError):
+        os.fstat(opened[0])
+    assert backend.fn_in_flight() == 0
@@ -0,0 +1,89 @@
+#-------------------------------------------------------------------------------
+# Name:        Rate Limit Tests
+# Purpose:     Global and per-/24 caps on probe emission.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import time
+
+import ip_scanner
+import ip_targets
+import rate_limit
+from fake_backend import cl_fake_backend
+
+
+def test_subnet_cap_defers_within_a_24():
+
+    limiter = rate_limit.cl_rate_limiter(subnet_rate=10)
+
+    # the burst of a 10/s bucket is one probe
+    assert limiter.fn_acquire('10.0.0.1') == 0.0
+    delay = limiter.fn_acquire('10.0.0.2')
+    assert 0.05 < delay <= 0.1
+
+    # another /24 has its own bucket, and a deferred host is let through
+    assert limiter.fn_acquire('10.0.1.1') == 0.0
+    assert limiter.fn_acquire('10.0.0.2') == 0.0
+
+
+def test_idle_24s_are_pruned(monkeypatch):
+
+    monkeypatch.setattr(rate_limit.cl_rate_limiter, '_MAX_SUBNETS', 8)
+    limiter = rate_limit.cl_rate_limiter(subnet_rate=1000)
+
+    for subnet in range(100):
+        limiter.fn_acquire('10.0.{}.1'.format(subnet))
+        time.sleep(0.002)
+
+    assert len(limiter.subnet_buckets) <= 8
+    assert 99 in [key & 0xFF for key in limiter.subnet_buckets]
+
+
+def test_order_is_unchanged_without_subnet_cap():
+
+    targets = ip_targets.parse_targets(['10.0.0.0/23'])
+
+    assert rate_limit.cl_rate_limiter(rate=100).fn_order(targets) is targets
+    assert list(rate_limit.cl_rate_limiter(subnet_rate=100).fn_order(targets))[:2] == ['10.0.0.0',
+                                                                                      '10.0.1.0']
+
+
+def test_subnet_cap_spreads_across_24s(monkeypatch):
+
+    # few deferred hosts, as a large scan would have relative to its /24s
+    monkeypatch.setattr(ip_scanner.cl_sub_process_spawner, '_MAX_DEFERRED', 32)
+
+    targets = ip_targets.parse_targets(['10.0.{}.0/28'.format(subnet) for subnet in range(64)])
+    engine = cl_fake_backend(0.001, 0.0, 0.05)
+    start_probe = engine.fn_start_probe
+    sent = dict()
+
+    def fn_start_probe(host, timeout=None, grace=0.0):
+        sent.setdefault(host.rsplit('.', 1)[0], list()).append(time.time())
+        start_probe(host, timeout, grace)
+
+    engine.fn_start_probe = fn_start_probe
+    results = list()
+    scanner = ip_scanner.cl_ip_scanner(None, None, None, results.append, None,
+                                       engine=engine,
+                                       targets=targets,
+                                       max_in_flight=64,
+                                       timeout=0.05,
+                                       rate_limiter=rate_limit.cl_rate_limiter(subnet_rate=50))
+
+    started = time.time()
+    scanner._check_active_ips()
+    elapsed = time.time() - started
+
+    assert sorted(result.ip for result in results) == sorted(targets)
+
+    # every /24 stays within 50/s after its burst of 5, yet the /24s are
+    # scanned side by side: one after another this takes over 2 seconds
+    for times in sent.values():
+        assert times[-1] - times[0] >= 0.9 * (16 - 5 - 1) / 50.0
+    assert elapsed < 1.0
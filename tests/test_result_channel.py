@@ -0,0 +1,95 @@
+#-------------------------------------------------------------------------------
+# Name:        Result Channel Tests
+# Purpose:     The bounded result queue and its backpressure policies.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import threading
+
+import pytest
+
+import ip_scanner
+import result_channel
+
+
+def _fn_results(count):
+
+    return [ip_scanner.cl_scan_result('10.0.{}.{}'.format(index >> 8, index & 255),
+                                      index % 2 == 0,
+                                      0.001 if index % 2 == 0 else None)
+            for index in range(count)]
+
+
+def _fn_drain(channel):
+
+    results = list()
+    while True:
+        batch = channel.fn_get_batch(100, 0.0)
+        if not batch:
+            return results
+        results.extend(batch)
+
+
+@pytest.mark.parametrize('capacity', [0, -1])
+def test_capacity_below_one_is_refused(capacity):
+
+    with pytest.raises(ValueError):
+        result_channel.cl_result_channel(capacity)
+
+
+def test_unknown_policy_is_refused():
+
+    with pytest.raises(ValueError):
+        result_channel.cl_result_channel(policy='lose')
+
+
+def test_drop_keeps_counts():
+
+    channel = result_channel.cl_result_channel(10, result_channel.POLICY_DROP)
+    for result in _fn_results(25):
+        channel.fn_put(result)
+
+    stats = channel.fn_stats()
+    assert len(_fn_drain(channel)) == 10
+    assert stats['total'] == 25 and stats['dropped'] == 15 and stats['alive'] == 13
+
+
+def test_spill_keeps_order(tmp_path):
+
+    results = _fn_results(50)
+    channel = result_channel.cl_result_channel(1, result_channel.POLICY_SPILL, str(tmp_path))
+    for result in results:
+        channel.fn_put(result)
+    channel.fn_close()
+
+    drained = _fn_drain(channel)
+    assert [(result.ip, result.alive) for result in drained] == [(result.ip, result.alive)
+                                                                for result in results]
+    assert channel.fn_is_drained()
+
+
+def test_block_holds_producer_until_consumed():
+
+    results = _fn_results(200)
+    channel = result_channel.cl_result_channel(1)
+
+    def fn_produce():
+        for result in results:
+            channel.fn_put(result)
+        channel.fn_close()
+
+    producer = threading.Thread(target=fn_produce)
+    producer.start()
+
+    drained = list()
+    while not channel.fn_is_drained():
+        drained.extend(channel.fn_get_batch(10, 0.1))
+    producer.join(5.0)
+
+    assert [result.ip for result in drained] == [result.ip for result in results]
+    assert channel.fn_stats()['high_water'] == 1
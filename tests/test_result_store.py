@@ -0,0 +1,89 @@
+#-------------------------------------------------------------------------------
+# Name:        Result Store Tests
+# Purpose:     Expiry, eviction and snapshots of the result cache.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import pytest
+
+import ip_scanner
+import result_store
+
+
+def _fn_result(ip, alive=True):
+
+    return ip_scanner.cl_scan_result(ip, alive, 0.004 if alive else None)
+
+
+def test_lookup_and_expiry():
+
+    cache = result_store.cl_result_cache(ttl=10.0)
+    cache.fn_store(_fn_result('10.0.0.1'), now=100.0)
+    cache.fn_store(_fn_result('10.0.0.2', False), now=100.0)
+
+    alive, rtt = cache.fn_lookup('10.0.0.1', now=105.0)
+    assert alive and rtt == pytest.approx(0.004)
+    assert cache.fn_lookup('10.0.0.2', now=105.0) == (False, None)
+    assert cache.fn_lookup('10.0.0.3', now=105.0) is None
+
+    # expired entries are dropped on lookup
+    assert cache.fn_lookup('10.0.0.1', now=110.0) is None
+    assert len(cache) == 1
+
+
+def test_eviction_keeps_the_size_bound():
+
+    cache = result_store.cl_result_cache(ttl=1000.0, max_entries=8)
+    for host in range(50):
+        cache.fn_store(_fn_result('10.0.0.{}'.format(host)), now=float(host))
+
+    assert len(cache) == 8
+
+    # the newest entry is always kept, every kept entry can still be found
+    assert cache.fn_lookup('10.0.0.49', now=60.0) is not None
+    found = [host for host in range(50) if cache.fn_lookup('10.0.0.{}'.format(host), now=60.0)]
+    assert len(found) == 8
+
+
+def test_expired_entries_are_evicted_first():
+
+    cache = result_store.cl_result_cache(ttl=50.0, max_entries=4)
+    cache.fn_store(_fn_result('10.0.0.1'), now=0.0)
+    for host in (2, 3, 4):
+        cache.fn_store(_fn_result('10.0.0.{}'.format(host)), now=100.0)
+
+    cache.fn_store(_fn_result('10.0.0.5'), now=101.0)
+
+    assert len(cache) == 4
+    for host in (2, 3, 4, 5):
+        assert cache.fn_lookup('10.0.0.{}'.format(host), now=101.0) is not None
+
+
+def test_growing_keeps_every_entry():
+
+    cache = result_store.cl_result_cache(ttl=1000.0)
+    hosts = ['10.{}.{}.1'.format(high, low) for high in range(8) for low in range(256)]
+    for ip in hosts:
+        cache.fn_store(_fn_result(ip), now=1.0)
+
+    assert len(cache) == len(hosts)
+    assert all(cache.fn_lookup(ip, now=2.0) is not None for ip in hosts)
+
+
+def test_snapshot_round_trip(tmp_path):
+
+    path = str(tmp_path / 'cache')
+    cache = result_store.cl_result_cache(ttl=300.0)
+    cache.fn_store(_fn_result('10.0.0.1'))
+    cache.fn_store(_fn_result('10.0.0.2', False))
+    cache.fn_save(path)
+
+    loaded = result_store.cl_result_cache(ttl=300.0)
+    assert loaded.fn_load(path) == 2
+    assert loaded.fn_lookup('10.0.0.1')[0]
+    assert loaded.fn_lookup('10.0.0.2') == (False, None)
@@ -0,0 +1,80 @@
+#-------------------------------------------------------------------------------
+# Name:        Scan Cluster Tests
+# Purpose:     A coordinator and two workers over localhost TCP.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import socket
+import threading
+
+import ip_targets
+import scan_cluster
+from fake_backend import cl_fake_backend
+
+
+def _fn_run_cluster(targets, workers, shard_size, before=None):
+
+    results = list()
+    coordinator = scan_cluster.cl_scan_coordinator(targets, results.append, ('127.0.0.1', 0),
+                                                   shard_size=shard_size)
+    if before is not None:
+        before(coordinator)
+
+    threads = list()
+    for index in range(workers):
+        worker = scan_cluster.cl_scan_worker(coordinator.address,
+                                             dict(engine=cl_fake_backend(0.001, 0.2, 0.05, seed=index),
+                                                  max_in_flight=64,
+                                                  timeout=0.05),
+                                             'worker-{}'.format(index))
+        thread = threading.Thread(target=worker.fn_run)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    coordinator.fn_run()
+    for thread in threads:
+        thread.join(10.0)
+        assert not thread.is_alive()
+
+    return coordinator, results
+
+
+def test_two_workers_report_every_host_once():
+
+    targets = ip_targets.parse_targets(['10.0.0.0/22', '10.1.0.0/28'])
+
+    coordinator, results = _fn_run_cluster(targets, 2, 100)
+
+    ips = [result.ip for result in results]
+    assert len(ips) == len(set(ips))
+    assert sorted(ips) == sorted(targets)
+    assert coordinator.reported == len(targets)
+
+
+def test_bad_worker_messages_drop_only_that_worker():
+
+    targets = ip_targets.parse_targets(['10.0.0.0/24'])
+    connections = list()
+
+    # one peer names a shard that does not exist, the other claims one done
+    # without reporting a host, or names one it was never given
+    def fn_connect_bad_peers(coordinator):
+        for message in (b'{"type":"done","shard":12345}\n', b'{"type":"done","shard":0}\n'):
+            sock = socket.create_connection(coordinator.address)
+            sock.sendall(message)
+            connections.append(sock)
+
+    coordinator, results = _fn_run_cluster(targets, 2, 64, fn_connect_bad_peers)
+
+    ips = [result.ip for result in results]
+    assert sorted(ips) == sorted(targets)
+    assert len(ips) == len(set(ips))
+
+    for sock in connections:
+        sock.close()
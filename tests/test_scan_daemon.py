@@ -0,0 +1,45 @@
+#-------------------------------------------------------------------------------
+# Name:        Scan Daemon Tests
+# Purpose:     Binding the daemon's API to a unix socket.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import os
+import socket
+import stat
+
+import pytest
+
+import scan_daemon
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='no unix sockets')
+
+
+def test_stale_socket_is_replaced(tmp_path):
+
+    path = str(tmp_path / 'daemon.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    server = scan_daemon.fn_create_server(None, unix_path=path)
+    try:
+        assert stat.S_ISSOCK(os.lstat(path).st_mode)
+    finally:
+        server.server_close()
+
+
+def test_other_files_are_left_alone(tmp_path):
+
+    path = tmp_path / 'daemon.sock'
+    path.write_text('not a socket')
+
+    with pytest.raises(ValueError):
+        scan_daemon.fn_create_server(None, unix_path=str(path))
+
+    assert path.read_text() == 'not a socket'
@@ -0,0 +1,67 @@
+#-------------------------------------------------------------------------------
+# Name:        Scan History Tests
+# Purpose:     Storing scans as bitmaps and diffing them.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import pytest
+
+import ip_scanner
+import ip_targets
+import scan_history
+
+
+@pytest.fixture
+def history(tmp_path):
+
+    history = scan_history.cl_scan_history(str(tmp_path / 'history.db'))
+    yield history
+    history.fn_close()
+
+
+def _fn_store(history, specs, alive, skip=()):
+
+    targets = ip_targets.parse_targets(specs)
+    recorder = history.fn_record(targets)
+    for ip in targets:
+        if ip not in skip:
+            recorder.fn_add(ip_scanner.cl_scan_result(ip, ip in alive, 0.005 if ip in alive else None))
+
+    return recorder.fn_finish()
+
+
+def test_results_round_trip(history):
+
+    scan_id = _fn_store(history, ['10.0.0.0/29'], {'10.0.0.1', '10.0.0.6'}, skip={'10.0.0.3'})
+
+    results = list(history.fn_results(scan_id))
+    assert [result.ip for result in results] == ['10.0.0.{}'.format(n) for n in (0, 1, 2, 4, 5, 6, 7)]
+    assert [result.ip for result in results if result.alive] == ['10.0.0.1', '10.0.0.6']
+    assert results[1].rtt == pytest.approx(0.005)
+
+    info = history.fn_scans()[0]
+    assert (info.hosts, info.scanned, info.alive) == (8, 7, 2)
+
+
+def test_diff_of_same_targets(history):
+
+    old_id = _fn_store(history, ['10.0.0.0/24'], {'10.0.0.1', '10.0.0.2'})
+    new_id = _fn_store(history, ['10.0.0.0/24'], {'10.0.0.2', '10.0.0.200'}, skip={'10.0.0.1'})
+
+    # 10.0.0.1 was not scanned the second time, so it did not go down
+    assert history.fn_diff(old_id, new_id) == (['10.0.0.200'], [])
+    assert history.fn_changes(ip_targets.parse_targets(['10.0.0.0/24'])) == (['10.0.0.200'], [])
+
+
+def test_diff_of_overlapping_targets(history):
+
+    old_id = _fn_store(history, ['10.0.0.0/24'], {'10.0.0.10', '10.0.0.130'})
+    new_id = _fn_store(history, ['10.0.0.128/25', '10.0.1.0/24'], {'10.0.0.200', '10.0.1.1'})
+
+    assert history.fn_diff(old_id, new_id) == (['10.0.0.200'], ['10.0.0.130'])
+
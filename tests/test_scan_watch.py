@@ -0,0 +1,54 @@
+#-------------------------------------------------------------------------------
+# Name:        Scan Watch Tests
+# Purpose:     Watch mode options and its first sweep over the targets.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import threading
+import time
+
+import pytest
+
+import ip_targets
+import scan_watch
+from fake_backend import cl_fake_backend
+
+
+@pytest.mark.parametrize('jitter', [-0.1, 1.0, 1.5])
+def test_jitter_outside_range_is_refused(jitter):
+
+    with pytest.raises(ValueError):
+        scan_watch.cl_host_watcher(ip_targets.parse_targets(['10.0.0.0/30']), None,
+                                   cl_fake_backend(), jitter=jitter)
+
+
+def test_short_interval_is_refused():
+
+    with pytest.raises(ValueError):
+        scan_watch.cl_host_watcher(ip_targets.parse_targets(['10.0.0.0/30']), None,
+                                   cl_fake_backend(), alive_interval=0.01)
+
+
+def test_first_sweep_reports_every_alive_host():
+
+    targets = ip_targets.parse_targets(['10.0.0.0/28'])
+    events = list()
+    watcher = scan_watch.cl_host_watcher(targets, events.append, cl_fake_backend(0.001, 0.0, 0.05),
+                                         max_in_flight=8, timeout=0.05, jitter=0.0)
+
+    thread = threading.Thread(target=watcher.fn_run)
+    thread.start()
+    deadline = time.time() + 5.0
+    while len(events) < len(targets) and time.time() < deadline:
+        time.sleep(0.01)
+    watcher.fn_stop()
+    thread.join(5.0)
+
+    assert not thread.is_alive()
+    assert sorted(event.ip for event in events) == sorted(targets)
+    assert all(event.state == scan_watch.STATE_UP for event in events)
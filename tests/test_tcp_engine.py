@@ -0,0 +1,142 @@
+#-------------------------------------------------------------------------------
+# Name:        TCP Engine Tests
+# Purpose:     TCP-connect probes against listeners on the loopback interface.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import socket
+import time
+
+import pytest
+
+import tcp_engine
+
+
+@pytest.fixture
+def listener():
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(16)
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture
+def closed_port():
+
+    # a port just released by a bound socket has nothing listening on it
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.fixture
+def silent_port():
+
+    # a listener whose accept queue is full drops further SYNs unanswered
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(0)
+    port = sock.getsockname()[1]
+
+    fillers = list()
+    for _ in range(4):
+        filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        filler.setblocking(False)
+        filler.connect_ex(('127.0.0.1', port))
+        fillers.append(filler)
+    time.sleep(0.1)
+
+    yield port
+
+    for filler in fillers:
+        filler.close()
+    sock.close()
+
+
+def _fn_run(engine, hosts, timeout=None):
+
+    for host in hosts:
+        engine.fn_start_probe(host, timeout)
+
+    results = list()
+    deadline = time.time() + 10.0
+    while engine.fn_outstanding() and time.time() < deadline:
+        results.extend(engine.fn_poll(0.5))
+
+    return results
+
+
+def test_listening_port_is_alive(listener):
+
+    engine = tcp_engine.cl_tcp_engine(ports=(listener,), timeout=1.0)
+    try:
+        results = _fn_run(engine, ['127.0.0.1'])
+    finally:
+        engine.fn_close()
+
+    assert len(results) == 1
+    host, alive, rtt = results[0]
+    assert host == '127.0.0.1' and alive
+    assert 0 <= rtt < 1.0
+
+
+def test_refused_port_is_alive(closed_port):
+
+    engine = tcp_engine.cl_tcp_engine(ports=(closed_port,), timeout=1.0)
+    try:
+        results = _fn_run(engine, ['127.0.0.1'])
+    finally:
+        engine.fn_close()
+
+    assert [(host, alive) for host, alive, rtt in results] == [('127.0.0.1', True)]
+
+
+def test_unanswered_connect_times_out(silent_port):
+
+    engine = tcp_engine.cl_tcp_engine(ports=(silent_port,), timeout=0.2)
+    started = time.time()
+    try:
+        results = _fn_run(engine, ['127.0.0.1'])
+    finally:
+        engine.fn_close()
+
+    assert results == [('127.0.0.1', False, None)]
+    assert time.time() - started >= 0.2
+
+
+def test_max_fds_bounds_open_sockets(silent_port, monkeypatch):
+
+    counts = dict(open=0, most=0)
+
+    class cl_counted_socket(socket.socket):
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            counts['open'] += 1
+            counts['most'] = max(counts['most'], counts['open'])
+
+        def close(self):
+            if self.fileno() != -1:
+                counts['open'] -= 1
+            super().close()
+
+    engine = tcp_engine.cl_tcp_engine(ports=(silent_port,), timeout=0.1, max_fds=2)
+    monkeypatch.setattr(socket, 'socket', cl_counted_socket)
+    try:
+        results = _fn_run(engine, ['127.0.0.1'] * 6)
+    finally:
+        monkeypatch.undo()
+        engine.fn_close()
+
+    assert len(results) == 6
+    assert counts['most'] == 2
+    assert counts['open'] == 0
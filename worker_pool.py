@@ -0,0 +1,388 @@
+#-------------------------------------------------------------------------------
+# Name:        Worker Pool
+# Purpose:     Fixed pool of long-lived probe worker processes, each running
+#              its own in-process probe loop over blocks of the target set.
+#
+# Author:      Peter Zhou
+#
+# Created:     17-10-2026
+# Copyright:   (c) PBES 2017
+# Licence:     <your licence>
+#-------------------------------------------------------------------------------
+
+import copy                                 # per-worker timeout trackers
+import multiprocessing                      # worker processes and pipes
+import multiprocessing.connection           # wait on several pipes at once
+import os                                   # default worker count
+import queue                                # blocks handed to a worker's scheduler
+import signal                               # leave Ctrl-C to the coordinator
+import struct                               # packed result records
+import threading                            # worker side pipe reader
+import time                                 # batch flushing and rate report
+
+import ip_scanner
+import ip_targets
+import probe_backend
+import rate_limit
+
+# message tags, each message is one tag byte followed by its payload
+_MSG_RESULTS = b'R'                         # packed result records
+_MSG_BLOCK_DONE = b'D'                      # block index, probes sent
+_MSG_BLOCK = b'B'                           # block index to scan
+_MSG_STOP = b'S'                            # finish up and exit
+_MSG_PAUSE = b'P'                           # stop sending probes for now
+_MSG_RESUME = b'U'                          # send probes again
+
+# address, alive, attempts, rtt in seconds or -1
+_RECORD = struct.Struct('<IBBf')
+_BLOCK = struct.Struct('<QQ')
+
+
+class cl_worker_pool():
+    """
+    Scans a target set with one long-lived process per core instead of one
+    process per address. The coordinator hands out blocks of consecutive
+    target positions over pipes, every worker probes its blocks with its
+    own backend and scheduler, and results come back as packed batches.
+    Drop-in replacement for cl_sub_process_spawner inside cl_ip_scanner.
+    """
+
+    # addresses per block handed to a worker
+    _BLOCK_SIZE = 4096
+
+    # blocks queued on each worker so it never waits for the coordinator
+    _BLOCKS_AHEAD = 2
+
+    # longest wait for worker messages, bounds how long stop and pause take
+    _WAIT = 0.05
+
+    def __init__(self,
+                 ip_list,
+                 fn_update_scan_progress_cb,
+                 engine='ping',
+                 workers=None,
+                 max_in_flight=ip_scanner.cl_sub_process_spawner._MAX_SUB_PROCESSES,
+                 timeout=None,
+                 adaptive_timeout=None,
+                 grace=0.0,
+                 retries=0,
+                 retry_backoff=0.5,
+                 rate_limiter=None,
+                 ports=None,
+                 metrics=None):
+
+        if not isinstance(engine, str):
+            raise ValueError('worker pools need a backend name, one of {}'.format(
+                ', '.join(probe_backend.BACKEND_NAMES)))
+
+        self.ip_list = ip_list
+        self._fn_update_scan_progress = fn_update_scan_progress_cb
+        self.workers = workers or os.cpu_count() or 1
+
+        # scheduler options for every worker; max_in_flight and the rate
+        # limits apply per worker and to the whole pool respectively
+        self.options = dict(engine=engine,
+                            ports=ports,
+                            max_in_flight=max_in_flight,
+                            timeout=timeout,
+                            adaptive_timeout=adaptive_timeout,
+                            grace=grace,
+                            retries=retries,
+                            retry_backoff=retry_backoff)
+
+        self.rate_limiter = rate_limiter
+        if rate_limiter is not None:
+            self.options['rate'] = rate_limiter.rate / self.workers if rate_limiter.rate else None
+            self.options['subnet_rate'] = rate_limiter.subnet_rate
+
+        self.blocks = (len(ip_list) + self._BLOCK_SIZE - 1) // self._BLOCK_SIZE
+
+        # probes sent by all workers, and when the pool ran, for the rate report
+        self.probes_sent = 0
+        self.started = None
+        self.finished = None
+
+        # optional scan_metrics.cl_scan_metrics; probe timings stay in the
+        # workers, only the probes they report sending are counted here
+        self.metrics = metrics
+
+        self.processes = list()
+        self.conns = list()
+
+        # set to false to stop spawn
+        self._running = True
+
+        # requested pause state, passed on to the workers by the coordinating
+        # thread, and the state they were last told
+        self._paused = False
+        self._workers_paused = False
+
+    def _fn_spawn(self):
+
+        context = multiprocessing.get_context('spawn')
+        self.started = time.time()
+
+        for _ in range(min(self.workers, max(1, self.blocks))):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_fn_worker_main,
+                                      args=(child_conn, self.ip_list, self.options))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+
+            self.processes.append(process)
+            self.conns.append(parent_conn)
+
+        try:
+            self._fn_coordinate()
+        finally:
+            self._fn_shutdown()
+            self.finished = time.time()
+
+    def _fn_terminate_sub_processes(self):
+
+        # the coordinating thread stops the workers on its way out
+        self._running = False
+
+    def fn_pause(self):
+
+        self._paused = True
+
+    def fn_resume(self):
+
+        self._paused = False
+
+    def fn_is_paused(self):
+
+        return self._paused
+
+    def fn_rate_report(self):
+
+        target = self.rate_limiter.rate if self.rate_limiter is not None else None
+
+        end = self.finished or time.time()
+        if self.started is None or end == self.started:
+            return 0.0, target
+
+        return self.probes_sent / (end - self.started), target
+
+    def _fn_coordinate(self):
+
+        next_block = 0
+        queued = dict((conn, 0) for conn in self.conns)
+
+        # fill every worker's queue
+        for conn in self.conns:
+            while next_block < self.blocks and queued[conn] < self._BLOCKS_AHEAD:
+                conn.send_bytes(_MSG_BLOCK + _BLOCK.pack(next_block, self._BLOCK_SIZE))
+                queued[conn] += 1
+                next_block += 1
+
+        while self._running and any(queued.values()):
+
+            if self._paused != self._workers_paused:
+                self._workers_paused = self._paused
+                for conn in self.conns:
+                    conn.send_bytes(_MSG_PAUSE if self._paused else _MSG_RESUME)
+
+            for conn in multiprocessing.connection.wait(self.conns, self._WAIT):
+
+                try:
+                    message = conn.recv_bytes()
+                except EOFError:
+                    raise RuntimeError('probe worker exited unexpectedly')
+
+                tag, payload = message[:1], message[1:]
+
+                if tag == _MSG_RESULTS:
+                    self._fn_report(payload)
+
+                elif tag == _MSG_BLOCK_DONE:
+                    block, probes_sent = _BLOCK.unpack(payload)
+                    self.probes_sent += probes_sent
+                    if self.metrics is not None:
+                        self.metrics.fn_probes_sent(probes_sent)
+                    queued[conn] -= 1
+
+                    if next_block < self.blocks:
+                        conn.send_bytes(_MSG_BLOCK + _BLOCK.pack(next_block, self._BLOCK_SIZE))
+                        queued[conn] += 1
+                        next_block += 1
+
+    def _fn_report(self, payload):
+
+        for ip, alive, attempts, rtt in _RECORD.iter_unpack(payload):
+            result = ip_scanner.cl_scan_result(ip_targets.int_to_ip(ip),
+                                               bool(alive),
+                                               None if rtt < 0 else rtt,
+                                               attempts)
+            self._fn_update_scan_progress(result)
+
+    def _fn_shutdown(self):
+
+        for conn in self.conns:
+            try:
+                conn.send_bytes(_MSG_STOP)
+            except (OSError, ValueError):
+                pass
+
+        for process in self.processes:
+            process.join(1.0)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+        for conn in self.conns:
+            conn.close()
+
+
+class cl_result_batcher():
+    """
+    Packs results into records and sends them to the coordinator in
+    batches, by size or by age, whichever comes first.
+    """
+
+    _MAX_RECORDS = 1024
+
+    # seconds a result may wait in a partial batch
+    _MAX_AGE = 0.1
+
+    def __init__(self, conn):
+
+        self.conn = conn
+        self.batch = bytearray()
+        self.count = 0
+        self.oldest = None
+
+    def fn_add(self, result):
+
+        rtt = -1.0 if result.rtt is None else result.rtt
+        self.batch += _RECORD.pack(ip_targets.ip_to_int(result.ip),
+                                   int(result.alive),
+                                   min(255, result.attempts),
+                                   rtt)
+        self.count += 1
+
+        now = time.time()
+        if self.oldest is None:
+            self.oldest = now
+
+        if self.count >= self._MAX_RECORDS or now - self.oldest >= self._MAX_AGE:
+            self.fn_flush()
+
+    def fn_flush(self):
+
+        if self.count:
+            self.conn.send_bytes(_MSG_RESULTS + bytes(self.batch))
+
+        self.batch = bytearray()
+        self.count = 0
+        self.oldest = None
+
+
+def _fn_worker_main(conn, ip_list, options):
+
+    # the coordinator stops workers over the pipe when interrupted
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    engine = probe_backend.create_backend(options['engine'], options['timeout'], options['ports'])
+
+    rate_limiter = None
+    if options.get('rate') or options.get('subnet_rate'):
+        rate_limiter = rate_limit.cl_rate_limiter(options.get('rate'), options.get('subnet_rate'))
+
+    # learns RTTs across every block this worker scans
+    adaptive_timeout = copy.deepcopy(options['adaptive_timeout'])
+
+    batcher = cl_result_batcher(conn)
+    blocks = queue.Queue()
+    state = {'running': True}
+
+    # block index of every host handed out and not yet reported, results
+    # still due per block, and probes sent up to the last finished block
+    pending = dict()
+    remaining = dict()
+    reported = [0]
+
+    # one scheduler for every block, so the window stays full across block
+    # boundaries instead of draining to its slowest probe at the end of each
+    def fn_source():
+        while state['running']:
+
+            # nothing to wait on, block for the next assignment for a while
+            if spawner._fn_outstanding() == 0 and not spawner.retry_heap:
+                try:
+                    block = blocks.get(timeout=cl_worker_pool._WAIT)
+                except queue.Empty:
+                    yield None
+                    continue
+            else:
+                try:
+                    block = blocks.get_nowait()
+                except queue.Empty:
+                    yield None
+                    continue
+
+            if block is None:
+                return
+
+            index, size = block
+            hosts = ip_targets.cl_target_slice(ip_list, index * size, (index + 1) * size)
+            remaining[index] = len(hosts)
+            if rate_limiter is not None:
+                hosts = rate_limiter.fn_order(hosts)
+            for host in hosts:
+                pending[host] = index
+                yield host
+
+    def fn_on_result(result):
+        batcher.fn_add(result)
+
+        index = pending.pop(result.ip)
+        remaining[index] -= 1
+        if remaining[index] == 0:
+            del remaining[index]
+            batcher.fn_flush()
+            conn.send_bytes(_MSG_BLOCK_DONE + _BLOCK.pack(index, spawner.probes_sent - reported[0]))
+            reported[0] = spawner.probes_sent
+
+    spawner = ip_scanner.cl_sub_process_spawner(fn_source(),
+                                                fn_on_result,
+                                                engine,
+                                                options['max_in_flight'],
+                                                options['timeout'],
+                                                adaptive_timeout,
+                                                options['grace'],
+                                                options['retries'],
+                                                options['retry_backoff'],
+                                                rate_limiter)
+
+    # reads block assignments, pause and stop requests while blocks are scanned
+    def fn_read_pipe():
+        while True:
+            try:
+                message = conn.recv_bytes()
+            except (EOFError, OSError):
+                message = _MSG_STOP
+
+            if message[:1] == _MSG_STOP:
+                state['running'] = False
+                spawner._fn_terminate_sub_processes()
+                blocks.put(None)
+                return
+
+            if message[:1] == _MSG_PAUSE:
+                spawner.fn_pause()
+            elif message[:1] == _MSG_RESUME:
+                spawner.fn_resume()
+            else:
+                blocks.put(_BLOCK.unpack(message[1:]))
+
+    reader = threading.Thread(target=fn_read_pipe)
+    reader.daemon = True
+    reader.start()
+
+    try:
+        spawner._fn_spawn()
+    finally:
+        engine.fn_close()